@@ -1,14 +1,54 @@
-from fastapi import Depends, HTTPException, status, Header
+from fastapi import Depends, HTTPException, status, Header, Request, Query
 from typing import Optional
 from jose import JWTError, jwt
 from app.config import settings
-from app.database import get_supabase
+from app.database import get_supabase, note_write
 from app.models.user import User
 from app.services.supabase_service import supabase_service
+from app.services.api_keys import api_key_store, has_permission, is_expired
 
 
-async def get_current_user(authorization: Optional[str] = Header(None)) -> User:
-    """Dependency to get current authenticated user"""
+async def get_api_key_user(api_key: str, request: Request) -> User:
+    """Authenticate an X-API-Key request (see app/services/api_keys.py)"""
+    record = await api_key_store.authenticate(api_key)
+    if record is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid API key",
+        )
+    if is_expired(record):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="API key expired",
+        )
+    if not has_permission(record.get("permissions"), request.method):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="API key does not have permission for this request",
+        )
+
+    user = record["user"]
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User profile not found",
+        )
+
+    api_key_store.touch(record["id"])
+    return user
+
+
+def _note_request(user: User, request: Request):
+    """Write requests pin the user's following reads to the primary database"""
+    if request.method not in ("GET", "HEAD", "OPTIONS"):
+        note_write(user.id)
+
+
+async def get_current_user(
+    request: Request,
+    authorization: Optional[str] = Header(None),
+) -> User:
+    """Dependency to get current authenticated user (Supabase JWT only)"""
     if not authorization:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -43,6 +83,7 @@ async def get_current_user(authorization: Optional[str] = Header(None)) -> User:
                 detail="User profile not found",
             )
 
+        _note_request(user, request)
         return user
 
     except ValueError:
@@ -57,6 +98,42 @@ async def get_current_user(authorization: Optional[str] = Header(None)) -> User:
         )
 
 
+async def get_api_user(
+    request: Request,
+    authorization: Optional[str] = Header(None),
+    x_api_key: Optional[str] = Header(None),
+) -> User:
+    """
+    get_current_user that also accepts an X-API-Key
+
+    For the data routes integrations use (calls, analytics, appointments).
+    Account, key, webhook and billing management stay JWT-only, so a leaked
+    key can't be used to mint more keys or take over the account.
+    """
+    if x_api_key:
+        user = await get_api_key_user(x_api_key, request)
+        _note_request(user, request)
+        return user
+    return await get_current_user(request, authorization)
+
+
+async def get_stream_user(
+    request: Request,
+    authorization: Optional[str] = Header(None),
+    x_api_key: Optional[str] = Header(None),
+    access_token: Optional[str] = Query(None),
+) -> User:
+    """
+    get_current_user for streaming endpoints
+
+    Browser EventSource can't send headers, so the JWT may also be passed as
+    ?access_token=. Only use this on endpoints that don't change anything.
+    """
+    if not authorization and not x_api_key and access_token:
+        authorization = f"Bearer {access_token}"
+    return await get_api_user(request, authorization, x_api_key)
+
+
 async def require_feature(feature_name: str):
     """Dependency factory to require specific feature access"""
     async def feature_checker(user: User = Depends(get_current_user)) -> User:
@@ -7,8 +7,9 @@ from fastapi import APIRouter, HTTPException, status, Header
 from typing import List, Optional
 from datetime import datetime, timedelta, date
 from pydantic import BaseModel
-from app.database import get_supabase
+from app.database import get_supabase, execute_async
 from app.schemas.calendar import AppointmentStatus
+from app.services.webhook_outbox import webhook_outbox
 import hmac
 import hashlib
 
@@ -41,8 +42,46 @@ class BookAppointmentRequest(BaseModel):
     notes: Optional[str] = None
 
 
-def verify_agent_token(agent_token: str, agent_id: str) -> bool:
-    """Verify that the agent token is valid for the given agent"""
+def build_slots(
+    day: str,
+    start_of_day: datetime,
+    end_of_day: datetime,
+    slot_minutes: int,
+    booked_appointments: List[dict],
+) -> List[AvailableSlot]:
+    """Split the day into slots, marking those that overlap a booked appointment"""
+    available_slots = []
+    current_time = start_of_day
+    slot_duration = timedelta(minutes=slot_minutes)
+
+    while current_time < end_of_day:
+        slot_end = current_time + slot_duration
+
+        # Check if this slot conflicts with any booked appointment
+        is_available = True
+        for appt in booked_appointments:
+            appt_start = datetime.fromisoformat(appt["start_time"])
+            appt_end = datetime.fromisoformat(appt["end_time"])
+
+            # Check for overlap
+            if current_time < appt_end and slot_end > appt_start:
+                is_available = False
+                break
+
+        available_slots.append(AvailableSlot(
+            date=day,
+            start_time=current_time.strftime("%H:%M"),
+            end_time=slot_end.strftime("%H:%M"),
+            available=is_available
+        ))
+
+        current_time = slot_end
+
+    return available_slots
+
+
+def get_verified_agent(agent_token: str, agent_id: str) -> Optional[dict]:
+    """The agent's row if the agent token is valid for it, else None"""
     try:
         supabase = get_supabase()
 
@@ -52,16 +91,23 @@ def verify_agent_token(agent_token: str, agent_id: str) -> bool:
         ).execute()
 
         if not agent_response.data:
-            return False
+            return None
 
         agent = agent_response.data[0]
         expected_token = agent.get("api_token")
 
         # Constant-time comparison to prevent timing attacks
-        return hmac.compare_digest(agent_token, expected_token) if expected_token else False
+        if expected_token and hmac.compare_digest(agent_token, expected_token):
+            return agent
+        return None
 
     except Exception:
-        return False
+        return None
+
+
+def verify_agent_token(agent_token: str, agent_id: str) -> bool:
+    """Verify that the agent token is valid for the given agent"""
+    return get_verified_agent(agent_token, agent_id) is not None
 
 
 @router.post("/check-availability/{agent_id}")
@@ -142,32 +188,9 @@ async def check_availability(
         booked_appointments = appointments_response.data
 
         # Generate available time slots
-        available_slots = []
-        current_time = start_of_day
-        slot_duration = timedelta(minutes=business_hours["slot_duration"])
-
-        while current_time < end_of_day:
-            slot_end = current_time + slot_duration
-
-            # Check if this slot conflicts with any booked appointment
-            is_available = True
-            for appt in booked_appointments:
-                appt_start = datetime.fromisoformat(appt["start_time"])
-                appt_end = datetime.fromisoformat(appt["end_time"])
-
-                # Check for overlap
-                if current_time < appt_end and slot_end > appt_start:
-                    is_available = False
-                    break
-
-            available_slots.append(AvailableSlot(
-                date=request.date,
-                start_time=current_time.strftime("%H:%M"),
-                end_time=slot_end.strftime("%H:%M"),
-                available=is_available
-            ))
-
-            current_time = slot_end
+        available_slots = build_slots(
+            request.date, start_of_day, end_of_day, business_hours["slot_duration"], booked_appointments
+        )
 
         # Filter to only available slots
         available_only = [slot for slot in available_slots if slot.available]
@@ -205,27 +228,15 @@ async def book_appointment(
     AI Agent: *calls this endpoint* "Great! I've booked your appointment for 2pm on December 15th."
     """
     try:
-        # Verify agent authentication
-        if not verify_agent_token(x_agent_token, agent_id):
+        # Verify agent authentication (the agent row also gives the owner)
+        agent = get_verified_agent(x_agent_token, agent_id)
+        if agent is None:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid agent token"
             )
 
-        supabase = get_supabase()
-
-        # Get agent's user_id
-        agent_response = supabase.table("agents").select("user_id").eq(
-            "agent_id", agent_id
-        ).execute()
-
-        if not agent_response.data:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Agent not found"
-            )
-
-        user_id = agent_response.data[0]["user_id"]
+        user_id = agent["user_id"]
 
         # Parse date and time
         try:
@@ -239,52 +250,43 @@ async def book_appointment(
                 detail="Invalid date/time format"
             )
 
-        # Check if slot is still available
-        existing_appts = supabase.table("appointments").select("*").eq(
-            "user_id", user_id
-        ).gte("start_time", start_datetime.isoformat()).lte(
-            "start_time", end_datetime.isoformat()
-        ).not_.in_("status", [AppointmentStatus.CANCELLED.value]).execute()
-
-        if existing_appts.data:
-            # Slot is already booked
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="This time slot is no longer available"
-            )
-
-        # Create appointment
-        appointment_data = {
-            "user_id": user_id,
-            "title": f"Appointment - {request.customer_name}",
-            "description": request.notes,
-            "start_time": start_datetime.isoformat(),
-            "end_time": end_datetime.isoformat(),
-            "timezone": "UTC",
-            "status": AppointmentStatus.SCHEDULED.value,
-            "attendee_name": request.customer_name,
-            "attendee_phone": request.customer_phone,
-            "attendee_email": request.customer_email,
-            "send_reminders": True,
-            "metadata": {
+        # Insert unless an appointment that isn't cancelled overlaps the slot,
+        # atomically and in one round trip (migrations/016_atomic_appointment_booking.sql)
+        appointment_response = await execute_async(get_supabase().rpc("book_appointment", {
+            "p_user_id": user_id,
+            "p_start_time": start_datetime.isoformat(),
+            "p_end_time": end_datetime.isoformat(),
+            "p_title": f"Appointment - {request.customer_name}",
+            "p_description": request.notes,
+            "p_timezone": "UTC",
+            "p_attendee_name": request.customer_name,
+            "p_attendee_phone": request.customer_phone,
+            "p_attendee_email": request.customer_email,
+            "p_metadata": {
                 "booked_via": "voice_ai",
                 "agent_id": agent_id
             },
-            "created_at": datetime.utcnow().isoformat()
-        }
-
-        appointment_response = supabase.table("appointments").insert(
-            appointment_data
-        ).execute()
+        }))
 
         if not appointment_response.data:
+            # Slot is already booked
             raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to create appointment"
+                status_code=status.HTTP_409_CONFLICT,
+                detail="This time slot is no longer available"
             )
 
         appointment = appointment_response.data[0]
 
+        await webhook_outbox.publish_safely(user_id, "appointment.booked", f"appointment.booked:{appointment['id']}", {
+            "appointment_id": appointment["id"],
+            "agent_id": agent_id,
+            "start_time": appointment["start_time"],
+            "end_time": appointment["end_time"],
+            "customer_name": request.customer_name,
+            "customer_phone": request.customer_phone,
+            "customer_email": request.customer_email,
+        })
+
         # TODO: Send confirmation email/SMS to customer
 
         return {
@@ -1,8 +1,12 @@
 from fastapi import APIRouter, Depends, Query, HTTPException
-from typing import List
-from app.schemas.analytics import ConversationResponse, AnalyticsStats
+from typing import List, Dict, Any
+from datetime import timedelta
+from app.schemas.analytics import ConversationResponse, MessageResponse, AnalyticsStats
+from app.models.conversation import Conversation
 from app.services.supabase_service import supabase_service
-from app.api.deps import get_current_user
+from app.services.transcript_store import transcript_store
+from app.services.transcript_parser import parse_transcript
+from app.api.deps import get_api_user
 from app.models.user import User
 
 router = APIRouter(prefix="/analytics", tags=["Analytics"])
@@ -12,7 +16,7 @@ router = APIRouter(prefix="/analytics", tags=["Analytics"])
 async def get_conversations(
     page: int = Query(1, ge=1),
     per_page: int = Query(20, ge=1, le=100),
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_api_user)
 ):
     """Get conversation history"""
     agent = await supabase_service.get_agent_by_user(user.id)
@@ -27,7 +31,7 @@ async def get_conversations(
 @router.get("/conversations/{conversation_id}", response_model=ConversationResponse)
 async def get_conversation(
     conversation_id: str,
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_api_user)
 ):
     """Get conversation details"""
     # Get user's agent first
@@ -43,13 +47,36 @@ async def get_conversation(
     if conversation.agent_id != agent.agent_id:
         raise HTTPException(status_code=403, detail="Access forbidden")
 
-    return conversation
+    # Turns live in blob storage and are fetched only here; conversations
+    # stored before they were parsed at ingestion are parsed from the payload
+    turns = await transcript_store.get_turns(conversation.turns_key)
+    if turns is None:
+        payload = await supabase_service.get_conversation_payload(conversation)
+        if payload:
+            turns = parse_transcript(payload.get("transcript"), conversation.duration_secs)
+
+    response = ConversationResponse.model_validate(conversation)
+    response.messages = _messages(conversation, turns or [])
+    return response
+
+
+def _messages(conversation: Conversation, turns: List[Dict[str, Any]]) -> List[MessageResponse]:
+    """Turns as messages, timestamped from the call start (the row is written when the call ends)"""
+    started_at = conversation.created_at - timedelta(seconds=conversation.duration_secs or 0)
+    return [
+        MessageResponse(
+            role="user" if turn["speaker"] == "customer" else turn["speaker"],
+            content=turn["text"],
+            timestamp=started_at + timedelta(seconds=turn.get("start_secs") or 0)
+        )
+        for turn in turns
+    ]
 
 
 @router.get("/stats", response_model=AnalyticsStats)
 async def get_stats(
     days: int = Query(7, ge=1, le=90),
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_api_user)
 ):
     """Get analytics stats"""
     agent = await supabase_service.get_agent_by_user(user.id)
@@ -11,13 +11,129 @@ from app.schemas.calendar import (
     AppointmentStatsResponse, CalendarProvider, AppointmentStatus, AvailabilitySlot
 )
 from app.models.user import User
-from app.api.deps import get_current_user
-from app.database import get_supabase
+from app.api.deps import get_current_user, get_api_user
+from app.database import get_supabase, get_read_client
 from app.config import settings
 
 router = APIRouter(prefix="/calendar", tags=["Calendar Management"])
 
 
+def appointment_response_from_row(appt_data: dict) -> AppointmentResponse:
+    """AppointmentResponse for an appointments row selected with `calendar_integrations(provider)`"""
+    integration_data = appt_data.get("calendar_integrations", {})
+    return AppointmentResponse(
+        id=appt_data["id"],
+        user_id=appt_data["user_id"],
+        calendar_integration_id=appt_data.get("calendar_integration_id"),
+        external_event_id=appt_data.get("external_event_id"),
+        title=appt_data["title"],
+        description=appt_data.get("description"),
+        start_time=appt_data["start_time"],
+        end_time=appt_data["end_time"],
+        location=appt_data.get("location"),
+        timezone=appt_data.get("timezone", "UTC"),
+        status=AppointmentStatus(appt_data["status"]),
+        attendee_email=appt_data.get("attendee_email"),
+        attendee_name=appt_data.get("attendee_name"),
+        attendee_phone=appt_data.get("attendee_phone"),
+        send_reminders=appt_data.get("send_reminders", True),
+        reminder_sent=appt_data.get("reminder_sent", False),
+        metadata=appt_data.get("metadata"),
+        created_at=appt_data["created_at"],
+        updated_at=appt_data.get("updated_at"),
+        cancelled_at=appt_data.get("cancelled_at"),
+        provider=CalendarProvider(integration_data["provider"]) if integration_data.get("provider") else None,
+        meeting_url=appt_data.get("meeting_url"),
+        is_synced=appt_data.get("is_synced", False)
+    )
+
+
+def build_availability_slots(
+    date_from: datetime,
+    date_to: datetime,
+    duration_minutes: int,
+    booked_slots: List[dict],
+) -> List[AvailabilitySlot]:
+    """Split [date_from, date_to) into slots, marking those that overlap a booked appointment"""
+    available_slots = []
+    current_time = date_from
+    slot_duration = timedelta(minutes=duration_minutes)
+
+    while current_time < date_to:
+        slot_end = current_time + slot_duration
+
+        # Check if slot overlaps with existing appointments
+        is_available = True
+        reason = None
+
+        for appointment in booked_slots:
+            appt_start = datetime.fromisoformat(appointment["start_time"])
+            appt_end = datetime.fromisoformat(appointment["end_time"])
+
+            if (current_time < appt_end and slot_end > appt_start):
+                is_available = False
+                reason = "booked"
+                break
+
+        available_slots.append(AvailabilitySlot(
+            start_time=current_time,
+            end_time=slot_end,
+            is_available=is_available,
+            reason=reason
+        ))
+
+        current_time = slot_end
+
+    return available_slots
+
+
+def appointment_stats(appointments: List[dict]) -> AppointmentStatsResponse:
+    """Reduce appointments rows to the stats endpoint's response"""
+    total_appointments = len(appointments)
+    upcoming_appointments = len([
+        a for a in appointments
+        if datetime.fromisoformat(a["start_time"]) > datetime.utcnow()
+        and a["status"] == AppointmentStatus.SCHEDULED.value
+    ])
+    completed_appointments = len([
+        a for a in appointments if a["status"] == AppointmentStatus.COMPLETED.value
+    ])
+    cancelled_appointments = len([
+        a for a in appointments if a["status"] == AppointmentStatus.CANCELLED.value
+    ])
+    no_show_count = len([
+        a for a in appointments if a["status"] == AppointmentStatus.NO_SHOW.value
+    ])
+
+    # Appointments by status
+    appointments_by_status = {}
+    for appointment in appointments:
+        status_val = appointment["status"]
+        appointments_by_status[status_val] = appointments_by_status.get(status_val, 0) + 1
+
+    # Calculate duration stats
+    durations = []
+    for appointment in appointments:
+        start = datetime.fromisoformat(appointment["start_time"])
+        end = datetime.fromisoformat(appointment["end_time"])
+        duration_minutes = (end - start).total_seconds() / 60
+        durations.append(duration_minutes)
+
+    average_duration_minutes = sum(durations) / len(durations) if durations else 0
+    total_hours_booked = sum(durations) / 60
+
+    return AppointmentStatsResponse(
+        total_appointments=total_appointments,
+        upcoming_appointments=upcoming_appointments,
+        completed_appointments=completed_appointments,
+        cancelled_appointments=cancelled_appointments,
+        no_show_count=no_show_count,
+        appointments_by_status=appointments_by_status,
+        average_duration_minutes=average_duration_minutes,
+        total_hours_booked=total_hours_booked
+    )
+
+
 @router.get("/integrations", response_model=List[CalendarIntegrationResponse])
 async def get_calendar_integrations(user: User = Depends(get_current_user)):
     """
@@ -221,7 +337,7 @@ async def get_appointments(
     status: Optional[AppointmentStatus] = None,
     date_from: Optional[date] = None,
     date_to: Optional[date] = None,
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_api_user)
 ):
     """
     Get paginated list of appointments
@@ -245,34 +361,7 @@ async def get_appointments(
             offset, offset + per_page - 1
         ).execute()
 
-        appointments = []
-        for appt_data in response.data:
-            integration_data = appt_data.get("calendar_integrations", {})
-            appointments.append(AppointmentResponse(
-                id=appt_data["id"],
-                user_id=appt_data["user_id"],
-                calendar_integration_id=appt_data.get("calendar_integration_id"),
-                external_event_id=appt_data.get("external_event_id"),
-                title=appt_data["title"],
-                description=appt_data.get("description"),
-                start_time=appt_data["start_time"],
-                end_time=appt_data["end_time"],
-                location=appt_data.get("location"),
-                timezone=appt_data.get("timezone", "UTC"),
-                status=AppointmentStatus(appt_data["status"]),
-                attendee_email=appt_data.get("attendee_email"),
-                attendee_name=appt_data.get("attendee_name"),
-                attendee_phone=appt_data.get("attendee_phone"),
-                send_reminders=appt_data.get("send_reminders", True),
-                reminder_sent=appt_data.get("reminder_sent", False),
-                metadata=appt_data.get("metadata"),
-                created_at=appt_data["created_at"],
-                updated_at=appt_data.get("updated_at"),
-                cancelled_at=appt_data.get("cancelled_at"),
-                provider=CalendarProvider(integration_data["provider"]) if integration_data.get("provider") else None,
-                meeting_url=appt_data.get("meeting_url"),
-                is_synced=appt_data.get("is_synced", False)
-            ))
+        appointments = [appointment_response_from_row(appt_data) for appt_data in response.data]
 
         total = response.count if response.count else 0
         pages = (total + per_page - 1) // per_page
@@ -295,7 +384,7 @@ async def get_appointments(
 @router.post("/appointments", response_model=AppointmentResponse)
 async def create_appointment(
     request: CreateAppointmentRequest,
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_api_user)
 ):
     """
     Create a new appointment
@@ -373,7 +462,7 @@ async def create_appointment(
 @router.get("/appointments/{appointment_id}", response_model=AppointmentResponse)
 async def get_appointment(
     appointment_id: str,
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_api_user)
 ):
     """
     Get a specific appointment
@@ -433,7 +522,7 @@ async def get_appointment(
 async def update_appointment(
     appointment_id: str,
     request: UpdateAppointmentRequest,
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_api_user)
 ):
     """
     Update an appointment
@@ -484,7 +573,7 @@ async def update_appointment(
 @router.delete("/appointments/{appointment_id}")
 async def delete_appointment(
     appointment_id: str,
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_api_user)
 ):
     """
     Delete an appointment
@@ -517,7 +606,7 @@ async def delete_appointment(
 async def reschedule_appointment(
     appointment_id: str,
     request: RescheduleAppointmentRequest,
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_api_user)
 ):
     """
     Reschedule an appointment
@@ -566,7 +655,7 @@ async def reschedule_appointment(
 async def cancel_appointment(
     appointment_id: str,
     request: CancelAppointmentRequest,
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_api_user)
 ):
     """
     Cancel an appointment
@@ -613,7 +702,7 @@ async def cancel_appointment(
 @router.post("/availability", response_model=AvailabilityResponse)
 async def check_availability(
     request: AvailabilityRequest,
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_api_user)
 ):
     """
     Check availability for booking appointments
@@ -631,34 +720,9 @@ async def check_availability(
         booked_slots = appointments_response.data
 
         # Generate time slots based on duration
-        available_slots = []
-        current_time = request.date_from
-        slot_duration = timedelta(minutes=request.duration_minutes)
-
-        while current_time < request.date_to:
-            slot_end = current_time + slot_duration
-
-            # Check if slot overlaps with existing appointments
-            is_available = True
-            reason = None
-
-            for appointment in booked_slots:
-                appt_start = datetime.fromisoformat(appointment["start_time"])
-                appt_end = datetime.fromisoformat(appointment["end_time"])
-
-                if (current_time < appt_end and slot_end > appt_start):
-                    is_available = False
-                    reason = "booked"
-                    break
-
-            available_slots.append(AvailabilitySlot(
-                start_time=current_time,
-                end_time=slot_end,
-                is_available=is_available,
-                reason=reason
-            ))
-
-            current_time = slot_end
+        available_slots = build_availability_slots(
+            request.date_from, request.date_to, request.duration_minutes, booked_slots
+        )
 
         available_count = len([s for s in available_slots if s.is_available])
 
@@ -682,13 +746,13 @@ async def check_availability(
 async def get_appointment_stats(
     date_from: Optional[date] = None,
     date_to: Optional[date] = None,
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_api_user)
 ):
     """
     Get appointment statistics
     """
     try:
-        supabase = get_supabase()
+        supabase = get_read_client(user.id)
 
         query = supabase.table("appointments").select("*").eq("user_id", user.id)
 
@@ -698,51 +762,7 @@ async def get_appointment_stats(
             query = query.lte("start_time", (date_to + timedelta(days=1)).isoformat())
 
         response = query.execute()
-        appointments = response.data
-
-        total_appointments = len(appointments)
-        upcoming_appointments = len([
-            a for a in appointments
-            if datetime.fromisoformat(a["start_time"]) > datetime.utcnow()
-            and a["status"] == AppointmentStatus.SCHEDULED.value
-        ])
-        completed_appointments = len([
-            a for a in appointments if a["status"] == AppointmentStatus.COMPLETED.value
-        ])
-        cancelled_appointments = len([
-            a for a in appointments if a["status"] == AppointmentStatus.CANCELLED.value
-        ])
-        no_show_count = len([
-            a for a in appointments if a["status"] == AppointmentStatus.NO_SHOW.value
-        ])
-
-        # Appointments by status
-        appointments_by_status = {}
-        for appointment in appointments:
-            status_val = appointment["status"]
-            appointments_by_status[status_val] = appointments_by_status.get(status_val, 0) + 1
-
-        # Calculate duration stats
-        durations = []
-        for appointment in appointments:
-            start = datetime.fromisoformat(appointment["start_time"])
-            end = datetime.fromisoformat(appointment["end_time"])
-            duration_minutes = (end - start).total_seconds() / 60
-            durations.append(duration_minutes)
-
-        average_duration_minutes = sum(durations) / len(durations) if durations else 0
-        total_hours_booked = sum(durations) / 60
-
-        return AppointmentStatsResponse(
-            total_appointments=total_appointments,
-            upcoming_appointments=upcoming_appointments,
-            completed_appointments=completed_appointments,
-            cancelled_appointments=cancelled_appointments,
-            no_show_count=no_show_count,
-            appointments_by_status=appointments_by_status,
-            average_duration_minutes=average_duration_minutes,
-            total_hours_booked=total_hours_booked
-        )
+        return appointment_stats(response.data)
 
     except Exception as e:
         raise HTTPException(
@@ -1,6 +1,9 @@
 from fastapi import APIRouter, HTTPException, status, Depends, Query
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from typing import List, Optional
-from datetime import datetime, date, timedelta
+from datetime import datetime, date, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from app.schemas.calls import (
     CreateCallRequest, CallResponse, CallListResponse, CallDetailResponse,
     EndCallRequest, CallFeedbackRequest, CallStatsResponse,
@@ -8,15 +11,44 @@ from app.schemas.calls import (
     BulkCallRequest, BulkCallResponse, CallStatus, CallSentiment, CallDirection
 )
 from app.models.user import User
-from app.api.deps import get_current_user
-from app.database import get_supabase
+from app.api.deps import get_api_user, get_stream_user
+from app.database import get_supabase, get_read_client, execute_async
 from app.services.supabase_service import supabase_service
 from app.services.elevenlabs_service import elevenlabs_service
+from app.services.transcript_store import transcript_store
+from app.services.transcript_parser import parse_text_transcript
+from app.services.event_bus import event_bus, json_dumps
+from app.services.call_state import call_state, call_status_callback_url
 from app.config import settings
 
 router = APIRouter(prefix="/calls", tags=["Calls Management"])
 
 
+def call_response_from_row(call_data: dict) -> CallResponse:
+    """CallResponse for a calls row selected with its agent (`*, agents(name)`)"""
+    agent_data = call_data.get("agents", {})
+    return CallResponse(
+        id=call_data["id"],
+        user_id=call_data["user_id"],
+        agent_id=call_data["agent_id"],
+        agent_name=agent_data.get("name") if agent_data else None,
+        phone_number=call_data["phone_number"],
+        status=CallStatus(call_data["status"]),
+        direction=CallDirection(call_data.get("direction", "outbound")),
+        duration_secs=call_data.get("duration_secs"),
+        recording_url=call_data.get("recording_url"),
+        transcript=call_data.get("transcript"),
+        summary=call_data.get("summary"),
+        sentiment=CallSentiment(call_data["sentiment"]) if call_data.get("sentiment") else None,
+        call_successful=call_data.get("call_successful"),
+        error_message=call_data.get("error_message"),
+        metadata=call_data.get("metadata"),
+        created_at=call_data["created_at"],
+        started_at=call_data.get("started_at"),
+        ended_at=call_data.get("ended_at")
+    )
+
+
 @router.get("", response_model=CallListResponse)
 async def get_calls(
     page: int = Query(1, ge=1),
@@ -26,13 +58,13 @@ async def get_calls(
     date_from: Optional[date] = None,
     date_to: Optional[date] = None,
     agent_id: Optional[str] = None,
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_api_user)
 ):
     """
     Get paginated list of calls with optional filtering
     """
     try:
-        supabase = get_supabase()
+        supabase = get_read_client(user.id)
         offset = (page - 1) * per_page
 
         # Build query
@@ -58,29 +90,7 @@ async def get_calls(
         ).execute()
 
         # Transform data
-        calls = []
-        for call_data in response.data:
-            agent_data = call_data.get("agents", {})
-            calls.append(CallResponse(
-                id=call_data["id"],
-                user_id=call_data["user_id"],
-                agent_id=call_data["agent_id"],
-                agent_name=agent_data.get("name") if agent_data else None,
-                phone_number=call_data["phone_number"],
-                status=CallStatus(call_data["status"]),
-                direction=CallDirection(call_data.get("direction", "outbound")),
-                duration_secs=call_data.get("duration_secs"),
-                recording_url=call_data.get("recording_url"),
-                transcript=call_data.get("transcript"),
-                summary=call_data.get("summary"),
-                sentiment=CallSentiment(call_data["sentiment"]) if call_data.get("sentiment") else None,
-                call_successful=call_data.get("call_successful"),
-                error_message=call_data.get("error_message"),
-                metadata=call_data.get("metadata"),
-                created_at=call_data["created_at"],
-                started_at=call_data.get("started_at"),
-                ended_at=call_data.get("ended_at")
-            ))
+        calls = [call_response_from_row(call_data) for call_data in response.data]
 
         total = response.count if response.count else 0
         pages = (total + per_page - 1) // per_page
@@ -100,10 +110,72 @@ async def get_calls(
         )
 
 
+@router.get("/stream")
+async def stream_call_events(user: User = Depends(get_stream_user)):
+    """
+    Live call updates as Server-Sent Events
+
+    Starts with a `snapshot` event listing the tenant's active calls, then
+    streams `call.status` transitions and `conversation.created` events as
+    they happen (see app/services/event_bus.py). A comment line is sent every
+    EVENT_STREAM_HEARTBEAT_SECONDS to keep proxies from closing the stream.
+    """
+    # Subscribe before taking the snapshot so no transition falls between them;
+    # one that lands in both is just applied twice by the dashboard
+    subscription = event_bus.subscribe(user.id)
+    try:
+        supabase = get_supabase()
+        active = await execute_async(
+            supabase.table("calls").select("id, agent_id, phone_number, status, started_at")
+            .eq("user_id", user.id)
+            .in_("status", [CallStatus.RINGING.value, CallStatus.IN_PROGRESS.value])
+        )
+    except Exception:
+        subscription.close()
+        raise
+    snapshot = json_dumps({"type": "snapshot", "calls": active.data or []})
+
+    async def events():
+        yield b"event: snapshot\ndata: " + snapshot + b"\n\n"
+        while True:
+            item = await subscription.get(timeout=settings.EVENT_STREAM_HEARTBEAT_SECONDS)
+            if item is None:
+                yield b": keepalive\n\n"
+                continue
+            event_type, payload = item
+            yield b"event: " + event_type.encode() + b"\ndata: " + payload + b"\n\n"
+
+    # The background task runs once the response ends, even if the client
+    # disconnected before the generator started
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(subscription.close),
+    )
+
+
+@router.get("/export")
+async def export_calls(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    agent_id: Optional[str] = None,
+    user: User = Depends(get_api_user)
+):
+    """
+    Download calls as CSV, streamed however many there are
+    """
+    return StreamingResponse(
+        supabase_service.export_calls_csv(user.id, date_from, date_to, agent_id),
+        media_type="text/csv",
+        headers={"Content-Disposition": 'attachment; filename="calls.csv"'},
+    )
+
+
 @router.post("", response_model=CallResponse)
 async def create_call(
     request: CreateCallRequest,
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_api_user)
 ):
     """
     Create a new outbound call
@@ -147,30 +219,29 @@ async def create_call(
             )
 
         call = call_response.data[0]
+        await event_bus.publish_call_status(user.id, call["id"], call["status"], agent_id=call["agent_id"])
 
         # If not scheduled, initiate call immediately via ElevenLabs
         if not request.scheduled_at:
             try:
                 # Initiate call using ElevenLabs conversational AI
-                call_id = await elevenlabs_service.initiate_call(
+                external_call_id = await elevenlabs_service.initiate_call(
                     phone_number=request.phone_number,
-                    agent_id=agent.get("elevenlabs_agent_id"),
-                    callback_url=f"{settings.BACKEND_URL}/api/webhooks/elevenlabs/call-status"
+                    agent_id=agent["agent_id"],
+                    callback_url=call_status_callback_url()
                 )
 
-                # Update call with ElevenLabs call ID
-                supabase.table("calls").update({
-                    "external_call_id": call_id,
-                    "status": CallStatus.IN_PROGRESS.value,
-                    "started_at": datetime.utcnow().isoformat()
-                }).eq("id", call["id"]).execute()
+                # Placed, not answered: the status webhook moves it to in_progress
+                updated = await execute_async(
+                    supabase.table("calls").update({"external_call_id": external_call_id}).eq("id", call["id"])
+                )
+                call = updated.data[0] if updated.data else call
 
             except Exception as call_error:
                 # Update call status to failed
-                supabase.table("calls").update({
-                    "status": CallStatus.FAILED.value,
-                    "error_message": str(call_error)
-                }).eq("id", call["id"]).execute()
+                await call_state.transition(
+                    CallStatus.FAILED, call_id=call["id"], values={"error_message": str(call_error)}
+                )
 
                 raise HTTPException(
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -210,7 +281,7 @@ async def create_call(
 @router.get("/{call_id}", response_model=CallDetailResponse)
 async def get_call(
     call_id: str,
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_api_user)
 ):
     """
     Get detailed information about a specific call
@@ -232,11 +303,17 @@ async def get_call(
         call_data = response.data[0]
         agent_data = call_data.get("agents", {})
 
-        # Get conversation turns if available
+        # Offloaded transcripts are fetched from blob storage only here
+        transcript = call_data.get("transcript")
+        if transcript is None and call_data.get("transcript_key"):
+            transcript = await transcript_store.get_transcript(call_data["transcript_key"])
+
+        # Turns are parsed at ingestion; only older inline transcripts are parsed here
         conversation_turns = None
-        if call_data.get("transcript"):
-            # Parse transcript into turns (simplified)
-            conversation_turns = []
+        if call_data.get("turns_key"):
+            conversation_turns = await transcript_store.get_turns(call_data["turns_key"])
+        if conversation_turns is None and transcript:
+            conversation_turns = parse_text_transcript(transcript, call_data.get("duration_secs"))
 
         return CallDetailResponse(
             id=call_data["id"],
@@ -248,7 +325,7 @@ async def get_call(
             direction=CallDirection(call_data.get("direction", "outbound")),
             duration_secs=call_data.get("duration_secs"),
             recording_url=call_data.get("recording_url"),
-            transcript=call_data.get("transcript"),
+            transcript=transcript,
             summary=call_data.get("summary"),
             sentiment=CallSentiment(call_data["sentiment"]) if call_data.get("sentiment") else None,
             call_successful=call_data.get("call_successful"),
@@ -276,7 +353,7 @@ async def get_call(
 async def end_call(
     call_id: str,
     request: EndCallRequest,
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_api_user)
 ):
     """
     End an active call
@@ -312,26 +389,19 @@ async def end_call(
                 # Log but don't fail
                 print(f"Failed to end external call: {e}")
 
-        # Calculate duration
-        duration_secs = None
-        if call.get("started_at"):
-            started = datetime.fromisoformat(call["started_at"])
-            ended = datetime.utcnow()
-            duration_secs = int((ended - started).total_seconds())
-
-        # Update call
-        update_data = {
-            "status": CallStatus.COMPLETED.value,
-            "ended_at": datetime.utcnow().isoformat(),
-            "duration_secs": duration_secs
-        }
-
+        # Duration is filled from started_at/ended_at by the database
+        update_data = {}
         if request.summary:
             update_data["summary"] = request.summary
         if request.metadata:
-            update_data["metadata"] = {**call.get("metadata", {}), **request.metadata}
+            update_data["metadata"] = {**(call.get("metadata") or {}), **request.metadata}
 
-        supabase.table("calls").update(update_data).eq("id", call_id).execute()
+        ended = await call_state.transition(
+            CallStatus.COMPLETED, call_id=call_id, where={"user_id": user.id}, values=update_data
+        )
+        if ended is None and update_data:
+            # The provider's status webhook ended it first; keep the notes anyway
+            supabase.table("calls").update(update_data).eq("id", call_id).execute()
 
         return {"message": "Call ended successfully"}
 
@@ -347,7 +417,7 @@ async def end_call(
 @router.get("/{call_id}/recording", response_model=CallRecordingResponse)
 async def get_call_recording(
     call_id: str,
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_api_user)
 ):
     """
     Get call recording URL
@@ -394,7 +464,7 @@ async def get_call_recording(
 async def submit_call_feedback(
     call_id: str,
     request: CallFeedbackRequest,
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_api_user)
 ):
     """
     Submit feedback for a call
@@ -441,69 +511,14 @@ async def get_call_stats(
     date_from: Optional[date] = None,
     date_to: Optional[date] = None,
     agent_id: Optional[str] = None,
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_api_user)
 ):
     """
     Get call statistics and metrics
     """
     try:
-        supabase = get_supabase()
-
-        # Build query
-        query = supabase.table("calls").select("*").eq("user_id", user.id)
-
-        if date_from:
-            query = query.gte("created_at", date_from.isoformat())
-        if date_to:
-            query = query.lte("created_at", (date_to + timedelta(days=1)).isoformat())
-        if agent_id:
-            query = query.eq("agent_id", agent_id)
-
-        response = query.execute()
-        calls = response.data
-
-        # Calculate stats
-        total_calls = len(calls)
-        successful_calls = len([c for c in calls if c.get("call_successful")])
-        failed_calls = len([c for c in calls if c["status"] == CallStatus.FAILED.value])
-
-        durations = [c.get("duration_secs", 0) for c in calls if c.get("duration_secs")]
-        average_duration = sum(durations) / len(durations) if durations else 0
-        total_duration = sum(durations)
-
-        # Calls by status
-        calls_by_status = {}
-        for call in calls:
-            status_val = call["status"]
-            calls_by_status[status_val] = calls_by_status.get(status_val, 0) + 1
-
-        # Calls by sentiment
-        calls_by_sentiment = {}
-        for call in calls:
-            if call.get("sentiment"):
-                sentiment_val = call["sentiment"]
-                calls_by_sentiment[sentiment_val] = calls_by_sentiment.get(sentiment_val, 0) + 1
-
-        success_rate = (successful_calls / total_calls * 100) if total_calls > 0 else 0
-
-        # Get average rating from feedback
-        feedback_response = supabase.table("call_feedback").select("rating").eq(
-            "user_id", user.id
-        ).execute()
-        ratings = [f["rating"] for f in feedback_response.data if f.get("rating")]
-        average_rating = sum(ratings) / len(ratings) if ratings else None
-
-        return CallStatsResponse(
-            total_calls=total_calls,
-            successful_calls=successful_calls,
-            failed_calls=failed_calls,
-            average_duration=average_duration,
-            total_duration=total_duration,
-            calls_by_status=calls_by_status,
-            calls_by_sentiment=calls_by_sentiment,
-            success_rate=success_rate,
-            average_rating=average_rating
-        )
+        stats = await supabase_service.get_call_stats(user.id, date_from, date_to, agent_id)
+        return CallStatsResponse(**stats)
 
     except Exception as e:
         raise HTTPException(
@@ -515,16 +530,36 @@ async def get_call_stats(
 @router.post("/schedule", response_model=CallResponse)
 async def schedule_call(
     request: ScheduleCallRequest,
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_api_user)
 ):
     """
     Schedule a call for future execution
     """
     try:
+        # Naive times are local to the requested timezone; store UTC
+        try:
+            tz = ZoneInfo(request.timezone)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown timezone: {request.timezone}"
+            )
+
+        scheduled_at = request.scheduled_at
+        if scheduled_at.tzinfo is None:
+            scheduled_at = scheduled_at.replace(tzinfo=tz)
+        scheduled_at = scheduled_at.astimezone(timezone.utc)
+
+        if scheduled_at <= datetime.now(timezone.utc):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Scheduled time must be in the future"
+            )
+
         create_request = CreateCallRequest(
             phone_number=request.phone_number,
             agent_id=request.agent_id,
-            scheduled_at=request.scheduled_at,
+            scheduled_at=scheduled_at,
             metadata={
                 **(request.metadata or {}),
                 "timezone": request.timezone
@@ -544,7 +579,7 @@ async def schedule_call(
 @router.post("/bulk", response_model=BulkCallResponse)
 async def create_bulk_calls(
     request: BulkCallRequest,
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_api_user)
 ):
     """
     Create multiple calls in bulk
@@ -0,0 +1,68 @@
+"""
+Diagnostics API
+
+Operator endpoints for the worker that serves the request: event-loop
+stalls caught by the watchdog, and on-demand sampling profiles. Protected
+by ADMIN_API_TOKEN (X-Admin-Token header) and disabled when it is unset.
+"""
+
+from fastapi import APIRouter, HTTPException, status, Header, Depends, Query
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+from app.config import settings
+from app.services.diagnostics import loop_watchdog, profiler, ProfilerBusy
+import asyncio
+import hmac
+import threading
+
+
+async def require_admin_token(x_admin_token: Optional[str] = Header(None, alias="X-Admin-Token")):
+    if not settings.ADMIN_API_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, settings.ADMIN_API_TOKEN):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid admin token")
+
+
+router = APIRouter(
+    prefix="/admin/diagnostics",
+    tags=["Diagnostics"],
+    dependencies=[Depends(require_admin_token)],
+)
+
+
+@router.get("/event-loop")
+async def get_event_loop_stalls():
+    """Watchdog counters and the most recent stalls, with the blocking stack of each"""
+    return {
+        "watchdog": loop_watchdog.stats(),
+        "recent_stalls": loop_watchdog.recent_stalls(),
+    }
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def capture_profile(
+    seconds: float = Query(10, gt=0),
+    rate_hz: float = Query(100, gt=0, le=1000),
+    threads: str = Query("all", pattern="^(all|loop)$"),
+):
+    """
+    Sample this worker's stacks for `seconds` (at most PROFILER_MAX_SECONDS)
+
+    Returns folded stacks, one "frame;frame;... count" line per distinct
+    stack, e.g. for `flamegraph.pl profile.txt > profile.svg` or speedscope.
+    threads=loop samples only the event-loop thread.
+    """
+    # Handlers run on the event-loop thread
+    thread_id = threading.get_ident() if threads == "loop" else None
+    try:
+        result = await asyncio.to_thread(profiler.profile, seconds, rate_hz, thread_id)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+    return PlainTextResponse(
+        result["folded"],
+        headers={
+            "X-Profile-Samples": str(result["samples"]),
+            "X-Profile-Seconds": str(result["seconds"]),
+        },
+    )
@@ -4,12 +4,13 @@ Phone Number Management API
 Endpoints for listing and assigning phone numbers from the Twilio pool
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from app.api.deps import get_current_user
 from app.models.user import User
 from app.services.phone_service import phone_service
+from app.database import get_supabase, execute_async
 
 router = APIRouter(prefix="/phone-numbers", tags=["Phone Numbers"])
 
@@ -26,6 +27,14 @@ class PhoneNumberResponse(BaseModel):
     status: str = "available"
 
 
+class OwnedNumberListResponse(BaseModel):
+    numbers: List[PhoneNumberResponse]
+    total: int
+    page: int
+    per_page: int
+    pages: int
+
+
 class AssignNumberRequest(BaseModel):
     phone_number: str
     phone_number_sid: str
@@ -37,6 +46,17 @@ class PurchaseNumberRequest(BaseModel):
     agent_id: str
 
 
+class BatchPurchaseItem(BaseModel):
+    agent_id: str
+    phone_number: Optional[str] = None
+    area_code: Optional[str] = None
+
+
+class BatchPurchaseRequest(BaseModel):
+    numbers: List[BatchPurchaseItem] = Field(..., min_length=1, max_length=50)
+    country: str = "US"
+
+
 @router.get("/available")
 async def list_available_numbers(
     area_code: Optional[str] = None,
@@ -86,15 +106,40 @@ async def list_available_numbers(
         )
 
 
-@router.get("/owned", response_model=List[PhoneNumberResponse])
-async def list_owned_numbers(user: User = Depends(get_current_user)):
+@router.get("/owned", response_model=OwnedNumberListResponse)
+async def list_owned_numbers(
+    page: int = Query(1, ge=1),
+    per_page: int = Query(50, ge=1, le=500),
+    is_assigned: Optional[bool] = None,
+    search: Optional[str] = None,
+    user: User = Depends(get_current_user)
+):
     """
     List ALL phone numbers owned in Twilio account
     Shows both assigned and available numbers (admin view)
+
+    Served from the local inventory mirror, refreshed in the background
+    every TWILIO_INVENTORY_SYNC_INTERVAL_SECONDS.
+
+    Query params:
+    - is_assigned: Only assigned (true) or available (false) numbers
+    - search: Match part of the phone number or friendly name
     """
     try:
-        numbers = await phone_service.list_owned_numbers()
-        return numbers
+        numbers, total = await phone_service.list_owned_numbers(
+            page=page,
+            per_page=per_page,
+            is_assigned=is_assigned,
+            search=search
+        )
+
+        return OwnedNumberListResponse(
+            numbers=numbers,
+            total=total,
+            page=page,
+            per_page=per_page,
+            pages=(total + per_page - 1) // per_page
+        )
 
     except Exception as e:
         raise HTTPException(
@@ -141,6 +186,42 @@ async def purchase_and_assign_number(
         )
 
 
+@router.post("/purchase-batch", status_code=status.HTTP_200_OK)
+async def purchase_numbers_batch(
+    request: BatchPurchaseRequest,
+    user: User = Depends(get_current_user)
+):
+    """
+    Purchase and assign numbers for several agents in one request
+
+    Used when onboarding multi-location customers. Numbers are bought
+    concurrently; each entry reports its own result, and an entry that fails
+    part way never leaves a purchased number behind.
+    """
+    agent_ids = {item.agent_id for item in request.numbers}
+    owned = await execute_async(
+        get_supabase().table("agents").select("agent_id").eq("user_id", user.id).in_("agent_id", list(agent_ids))
+    )
+    unknown = agent_ids - {row["agent_id"] for row in owned.data}
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Agents not found: {', '.join(sorted(unknown))}"
+        )
+
+    results = await phone_service.provision_phone_numbers(
+        user_id=user.id,
+        requests=[item.dict() for item in request.numbers],
+        country=request.country
+    )
+
+    return {
+        "results": results,
+        "succeeded": sum(1 for r in results if "error" not in r),
+        "failed": sum(1 for r in results if "error" in r)
+    }
+
+
 @router.post("/assign", status_code=status.HTTP_200_OK)
 async def assign_phone_number(
     request: AssignNumberRequest,
@@ -2,7 +2,6 @@ from fastapi import APIRouter, HTTPException, status, Depends
 from typing import List
 from datetime import datetime, timedelta
 import secrets
-import hashlib
 from app.schemas.settings import (
     SettingsResponse, UpdateSettingsRequest, UserProfileUpdate,
     UpdatePasswordRequest, APIKeyCreate, APIKeyResponse,
@@ -16,6 +15,8 @@ from app.models.user import User
 from app.api.deps import get_current_user
 from app.database import get_supabase
 from app.services.supabase_service import supabase_service
+from app.services.api_keys import api_key_store, hash_key, DEFAULT_PERMISSIONS, PERMISSIONS
+from app.services.webhook_outbox import webhook_outbox
 
 router = APIRouter(prefix="/settings", tags=["Settings Management"])
 
@@ -294,7 +295,17 @@ async def create_api_key(
 ):
     """
     Create a new API key
+
+    Only signed-in users (not API keys) can manage keys; permissions must be known.
     """
+    permissions = request.permissions or DEFAULT_PERMISSIONS
+    unknown = set(permissions) - PERMISSIONS
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown permissions: {', '.join(sorted(unknown))}"
+        )
+
     try:
         supabase = get_supabase()
 
@@ -302,14 +313,14 @@ async def create_api_key(
         api_key = f"vami_{secrets.token_urlsafe(32)}"
 
         # Hash the key for storage
-        key_hash = hashlib.sha256(api_key.encode()).hexdigest()
+        key_hash = hash_key(api_key)
 
         key_data = {
             "user_id": user.id,
             "name": request.name,
             "description": request.description,
             "api_key": key_hash,  # Store hash
-            "permissions": request.permissions,
+            "permissions": permissions,
             "created_at": datetime.utcnow().isoformat(),
             "is_active": True
         }
@@ -366,6 +377,7 @@ async def delete_api_key(
         response = supabase.table("api_keys").delete().eq(
             "id", key_id
         ).eq("user_id", user.id).execute()
+        api_key_store.invalidate_key(key_id)
 
         if not response.data:
             raise HTTPException(
@@ -409,6 +421,7 @@ async def get_webhooks(user: User = Depends(get_current_user)):
                 events=webhook_data["events"],
                 secret_preview=secret_preview,
                 is_active=webhook_data["is_active"],
+                batch_size=webhook_data.get("batch_size", 1),
                 created_at=webhook_data["created_at"],
                 last_triggered_at=webhook_data.get("last_triggered_at"),
                 success_count=webhook_data.get("success_count", 0),
@@ -444,12 +457,14 @@ async def create_webhook(
             "events": request.events,
             "secret": secret,
             "is_active": request.is_active,
+            "batch_size": request.batch_size,
             "created_at": datetime.utcnow().isoformat(),
             "success_count": 0,
             "failure_count": 0
         }
 
         response = supabase.table("webhook_endpoints").insert(webhook_data).execute()
+        webhook_outbox.invalidate_user(user.id)
 
         if not response.data:
             raise HTTPException(
@@ -467,6 +482,7 @@ async def create_webhook(
             events=webhook["events"],
             secret_preview=secret_preview,
             is_active=webhook["is_active"],
+            batch_size=webhook.get("batch_size", 1),
             created_at=webhook["created_at"],
             last_triggered_at=webhook.get("last_triggered_at"),
             success_count=webhook["success_count"],
@@ -482,6 +498,58 @@ async def create_webhook(
         )
 
 
+@router.post("/webhooks/{webhook_id}/enable", response_model=WebhookEndpointResponse)
+async def enable_webhook(
+    webhook_id: str,
+    user: User = Depends(get_current_user)
+):
+    """
+    Re-enable a webhook endpoint
+
+    Also resets the failure streak of an endpoint that was disabled after
+    repeated delivery failures; its pending events are delivered again.
+    """
+    try:
+        supabase = get_supabase()
+
+        response = supabase.table("webhook_endpoints").update({
+            "is_active": True,
+            "consecutive_failures": 0,
+            "disabled_at": None
+        }).eq("id", webhook_id).eq("user_id", user.id).execute()
+        webhook_outbox.invalidate_user(user.id)
+
+        if not response.data:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Webhook not found"
+            )
+
+        webhook = response.data[0]
+
+        return WebhookEndpointResponse(
+            id=webhook["id"],
+            user_id=webhook["user_id"],
+            url=webhook["url"],
+            events=webhook["events"],
+            secret_preview=f"{webhook['secret'][:8]}..." if webhook.get("secret") else None,
+            is_active=webhook["is_active"],
+            batch_size=webhook.get("batch_size", 1),
+            created_at=webhook["created_at"],
+            last_triggered_at=webhook.get("last_triggered_at"),
+            success_count=webhook.get("success_count", 0),
+            failure_count=webhook.get("failure_count", 0)
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to enable webhook: {str(e)}"
+        )
+
+
 @router.delete("/webhooks/{webhook_id}")
 async def delete_webhook(
     webhook_id: str,
@@ -496,6 +564,7 @@ async def delete_webhook(
         response = supabase.table("webhook_endpoints").delete().eq(
             "id", webhook_id
         ).eq("user_id", user.id).execute()
+        webhook_outbox.invalidate_user(user.id)
 
         if not response.data:
             raise HTTPException(
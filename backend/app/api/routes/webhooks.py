@@ -3,16 +3,39 @@ from app.services.stripe_service import stripe_service
 from app.services.elevenlabs_service import elevenlabs_service
 from app.services.supabase_service import supabase_service
 from app.services.email_service import email_service
+from app.services.idempotency import idempotency_store, Claim
+from app.services.batch_writer import conversation_writer, usage_writer
+from app.services.transcript_store import transcript_store
+from app.services.transcript_parser import parse_transcript, render_transcript
+from app.services.webhook_outbox import webhook_outbox
+from app.services.event_bus import event_bus
+from app.services.call_state import call_state, provider_status, parse_event_time, TERMINAL
+from app.services.phone_service import phone_service
 from app.models.user import SubscriptionPlan
-from datetime import datetime
+from app.schemas.calls import CallStatus, CallDirection
+from app.database import execute_async
+from app.config import settings
+from twilio.request_validator import RequestValidator
+from datetime import datetime, date
+from dateutil.relativedelta import relativedelta
 from slowapi import Limiter
 from slowapi.util import get_remote_address
+import asyncio
 
 limiter = Limiter(key_func=get_remote_address)
 
 router = APIRouter(prefix="/webhooks", tags=["Webhooks"])
 
 
+def raise_in_progress():
+    """A redelivery of an event another worker is still processing: make the provider retry it later"""
+    raise HTTPException(
+        status_code=409,
+        detail="Event is already being processed",
+        headers={"Retry-After": "60"},
+    )
+
+
 @router.post("/stripe")
 @limiter.limit("100/minute")  # Allow burst of webhook events
 async def stripe_webhook(request: Request, stripe_signature: str = Header(None)):
@@ -21,62 +44,23 @@ async def stripe_webhook(request: Request, stripe_signature: str = Header(None))
         payload = await request.body()
         event = stripe_service.verify_webhook_signature(payload, stripe_signature)
 
-        if event["type"] == "checkout.session.completed":
-            session = event["data"]["object"]
-            customer_id = session["customer"]
-            subscription_id = session["subscription"]
-
-            # Get user by Stripe customer ID
-            result = supabase_service.db.table("users").select("*").eq("stripe_customer_id", customer_id).execute()
-            if not result.data:
-                return {"status": "user_not_found"}
-
-            user_id = result.data[0]["id"]
-            user_email = result.data[0]["email"]
-            company_name = result.data[0]["company_name"]
-            plan = SubscriptionPlan(session["metadata"].get("plan", "starter_trial"))
-
-            # Get subscription details
-            subscription = await stripe_service.get_subscription(subscription_id)
-
-            # Update user subscription
-            await supabase_service.update_user_subscription(
-                user_id=user_id,
-                stripe_customer_id=customer_id,
-                stripe_subscription_id=subscription_id,
-                status=subscription["status"],
-                current_period_end=datetime.fromtimestamp(subscription["current_period_end"]),
-                plan=plan
-            )
-
-            # Create ElevenLabs agent
-            agent_response = await elevenlabs_service.create_agent(
-                name=f"{company_name or user_email} Agent",
-                prompt="You are a friendly and professional receptionist. Help customers book appointments and answer questions.",
-            )
-
-            # Save agent to database
-            await supabase_service.create_agent(
-                user_id=user_id,
-                agent_id=agent_response["agent_id"],
-                agent_name=agent_response["name"],
-                metadata=agent_response.get("metadata")
-            )
-
-            # Send welcome email
-            await email_service.send_welcome_email(user_email, company_name or user_email, agent_response["agent_id"])
+        claim = await idempotency_store.claim("stripe", event["id"])
+        if claim == Claim.COMPLETED:
+            return {"status": "duplicate"}
+        if claim == Claim.IN_PROGRESS:
+            raise_in_progress()
 
-        elif event["type"] == "invoice.payment_failed":
-            # Handle payment failure
-            invoice = event["data"]["object"]
-            customer_id = invoice["customer"]
+        try:
+            result = await process_stripe_event(event)
+        except Exception:
+            await idempotency_store.release("stripe", event["id"])
+            raise
 
-            result = supabase_service.db.table("users").select("email, company_name").eq("stripe_customer_id", customer_id).execute()
-            if result.data:
-                await email_service.send_payment_failed_email(result.data[0]["email"], result.data[0]["company_name"])
-
-        return {"status": "success"}
+        await idempotency_store.complete("stripe", event["id"])
+        return result
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -99,48 +83,298 @@ async def elevenlabs_webhook(
         if not elevenlabs_service.verify_webhook_signature(payload, xi_signature, xi_timestamp):
             raise HTTPException(status_code=401, detail="Invalid webhook signature")
 
-        # Parse JSON from payload
-        import json
-        data = json.loads(payload.decode('utf-8'))
+        # Parse JSON straight from the raw body
+        data = elevenlabs_service.parse_webhook_payload(payload)
 
-        # Store conversation
-        conversation_data = {
-            "conversation_id": data.get("conversation_id"),
-            "agent_id": data.get("agent_id"),
-            "end_user_id": data.get("end_user_id"),
-            "duration_secs": data.get("duration_secs"),
-            "call_successful": data.get("call_successful"),
-            "summary": data.get("summary"),
-            "title": data.get("title"),
-            "sentiment": data.get("sentiment"),
-            "intent": data.get("intent"),
-            "webhook_payload": data
-        }
+        conversation_id = data.get("conversation_id")
+        claim = await idempotency_store.claim("elevenlabs", conversation_id)
+        if claim == Claim.COMPLETED:
+            return {"status": "duplicate"}
+        if claim == Claim.IN_PROGRESS:
+            raise_in_progress()
 
-        await supabase_service.create_conversation(conversation_data)
-
-        # Record usage
-        if data.get("duration_secs"):
-            minutes = data["duration_secs"] / 60
-            # Get agent and user
-            agent = await supabase_service.get_agent_by_id(data["agent_id"])
-            if agent:
-                from datetime import date
-                from dateutil.relativedelta import relativedelta
-
-                today = date.today()
-                period_start = today.replace(day=1)
-                period_end = (period_start + relativedelta(months=1)) - relativedelta(days=1)
-
-                await supabase_service.record_usage(
-                    user_id=agent.user_id,
-                    conversation_id=data["conversation_id"],
-                    minutes_used=minutes,
-                    billing_period_start=period_start,
-                    billing_period_end=period_end
-                )
+        try:
+            await process_elevenlabs_conversation(data)
+        except Exception:
+            await idempotency_store.release("elevenlabs", conversation_id)
+            raise
 
+        await idempotency_store.complete("elevenlabs", conversation_id)
         return {"status": "success"}
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/elevenlabs/call-status")
+@limiter.limit("600/minute")
+async def elevenlabs_call_status(
+    request: Request,
+    xi_signature: str = Header(None, alias="xi-signature"),
+    xi_timestamp: str = Header(None, alias="xi-timestamp")
+):
+    """
+    Handle call status updates for outbound calls
+
+    The call is identified by the payload's conversation_id, which is
+    covered by the signature (the call's external_call_id). Updates that
+    arrive late or twice are ignored by the state machine.
+    """
+    payload = await request.body()
+
+    if not xi_signature or not xi_timestamp:
+        raise HTTPException(status_code=401, detail="Missing webhook signature headers")
+    if not elevenlabs_service.verify_webhook_signature(payload, xi_signature, xi_timestamp):
+        raise HTTPException(status_code=401, detail="Invalid webhook signature")
+
+    try:
+        data = elevenlabs_service.parse_webhook_payload(payload)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON payload")
+
+    new_status = provider_status(data.get("status"))
+    if new_status is None:
+        return {"status": "ignored"}
+
+    external_call_id = data.get("conversation_id")
+    if not external_call_id:
+        raise HTTPException(status_code=400, detail="Missing conversation_id")
+
+    values = {}
+    if data.get("duration_secs") is not None:
+        try:
+            values["duration_secs"] = int(data["duration_secs"])
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid duration_secs")
+    if data.get("error") and new_status == CallStatus.FAILED:
+        values["error_message"] = str(data["error"])[:1000]
+
+    call = await call_state.transition(
+        new_status,
+        external_call_id=external_call_id,
+        values=values,
+        at=parse_event_time(data.get("timestamp")),
+    )
+    return {"status": "applied" if call else "ignored"}
+
+
+@router.post("/call/status")
+@limiter.limit("600/minute")
+async def twilio_call_status(
+    request: Request,
+    x_twilio_signature: str = Header(None, alias="X-Twilio-Signature")
+):
+    """
+    Handle Twilio status callbacks for calls to our numbers
+
+    Numbers are provisioned with this URL as their status callback (see
+    PhoneService), which Twilio calls once the call has ended. Inbound calls
+    are routed to their agent through the in-memory routing table
+    (phone_service.get_agent_by_phone_number) and recorded in calls;
+    outbound calls are tracked through the ElevenLabs status webhook instead.
+    """
+    form = {key: value for key, value in (await request.form()).items()}
+
+    url = f"{settings.WEBHOOK_BASE_URL}/api/webhooks/call/status"
+    if not x_twilio_signature or not RequestValidator(settings.TWILIO_AUTH_TOKEN).validate(
+        url, form, x_twilio_signature
+    ):
+        raise HTTPException(status_code=401, detail="Invalid webhook signature")
+
+    new_status = provider_status(form.get("CallStatus"))
+    if form.get("Direction") != CallDirection.INBOUND.value or new_status not in TERMINAL:
+        return {"status": "ignored"}
+
+    agent = await phone_service.get_agent_by_phone_number(form.get("To", ""))
+    if not agent:
+        return {"status": "unrouted"}
+
+    call_sid = form.get("CallSid")
+    claim = await idempotency_store.claim("twilio", call_sid)
+    if claim == Claim.COMPLETED:
+        return {"status": "duplicate"}
+    if claim == Claim.IN_PROGRESS:
+        raise_in_progress()
+
+    try:
+        await execute_async(supabase_service.db.table("calls").insert({
+            "user_id": agent["user_id"],
+            "agent_id": agent["agent_id"],
+            "phone_number": form.get("From"),
+            "status": new_status.value,
+            "direction": CallDirection.INBOUND.value,
+            "external_call_id": call_sid,
+            "duration_secs": int(form.get("CallDuration") or 0),
+            "ended_at": datetime.utcnow().isoformat(),
+            "created_at": datetime.utcnow().isoformat(),
+        }))
+    except Exception:
+        await idempotency_store.release("twilio", call_sid)
+        raise
+
+    await idempotency_store.complete("twilio", call_sid)
+    return {"status": "success"}
+
+
+async def process_stripe_event(event) -> dict:
+    """Apply a verified Stripe event (called once per event id)"""
+    if event["type"] == "checkout.session.completed":
+        session = event["data"]["object"]
+        customer_id = session["customer"]
+        subscription_id = session["subscription"]
+
+        # Get user by Stripe customer ID
+        result = supabase_service.db.table("users").select("*").eq("stripe_customer_id", customer_id).execute()
+        if not result.data:
+            return {"status": "user_not_found"}
+
+        user_id = result.data[0]["id"]
+        user_email = result.data[0]["email"]
+        company_name = result.data[0]["company_name"]
+        plan = SubscriptionPlan(session["metadata"].get("plan", "starter_trial"))
+
+        # Get subscription details
+        subscription = await stripe_service.get_subscription(subscription_id)
+
+        # Update user subscription
+        await supabase_service.update_user_subscription(
+            user_id=user_id,
+            stripe_customer_id=customer_id,
+            stripe_subscription_id=subscription_id,
+            status=subscription["status"],
+            current_period_end=datetime.fromtimestamp(subscription["current_period_end"]),
+            plan=plan
+        )
+
+        # Create ElevenLabs agent
+        agent_response = await elevenlabs_service.create_agent(
+            name=f"{company_name or user_email} Agent",
+            prompt="You are a friendly and professional receptionist. Help customers book appointments and answer questions.",
+        )
+
+        # Save agent to database
+        await supabase_service.create_agent(
+            user_id=user_id,
+            agent_id=agent_response["agent_id"],
+            agent_name=agent_response["name"],
+            metadata=agent_response.get("metadata")
+        )
+
+        # Send welcome email
+        await email_service.send_welcome_email(user_email, company_name or user_email, agent_response["agent_id"])
+
+    elif event["type"] == "invoice.payment_failed":
+        # Handle payment failure
+        invoice = event["data"]["object"]
+        customer_id = invoice["customer"]
+
+        result = supabase_service.db.table("users").select("email, company_name").eq("stripe_customer_id", customer_id).execute()
+        if result.data:
+            await email_service.send_payment_failed_email(result.data[0]["email"], result.data[0]["company_name"])
+
+    return {"status": "success"}
+
+
+async def process_elevenlabs_conversation(data: dict):
+    """Store a finished conversation and bill its minutes (called once per conversation)"""
+    # Store conversation
+    conversation_data = {
+        "conversation_id": data.get("conversation_id"),
+        "agent_id": data.get("agent_id"),
+        "end_user_id": data.get("end_user_id"),
+        "duration_secs": data.get("duration_secs"),
+        "call_successful": data.get("call_successful"),
+        "summary": data.get("summary"),
+        "title": data.get("title"),
+        "sentiment": data.get("sentiment"),
+        "intent": data.get("intent"),
+        "created_at": datetime.utcnow().isoformat()
+    }
+
+    # The raw payload and the transcript (parsed once, here) go to blob storage
+    # before the rows that point at them
+    conversation_id = data.get("conversation_id")
+    turns = parse_transcript(data.get("transcript"), data.get("duration_secs"))
+    turns_key = transcript_key = None
+    if conversation_id:
+        if turns:
+            payload_key, turns_key, transcript_key = await asyncio.gather(
+                transcript_store.put_payload(conversation_id, data),
+                transcript_store.put_turns(conversation_id, turns),
+                transcript_store.put_transcript(conversation_id, render_transcript(turns)),
+            )
+        else:
+            payload_key = await transcript_store.put_payload(conversation_id, data)
+        conversation_data["payload_key"] = payload_key
+        conversation_data["turns_key"] = turns_key
+    else:
+        conversation_data["webhook_payload"] = data
+
+    # Both writes are batched with other webhooks and return once committed;
+    # usage references the conversation, so it goes second
+    await conversation_writer.write(conversation_data)
+
+    # Outbound calls placed through /calls carry the conversation ID: end the
+    # call (if the status webhook hasn't) and link the transcript
+    if conversation_id:
+        call_values = {"conversation_id": conversation_id}
+        if turns_key:
+            call_values.update(transcript_key=transcript_key, turns_key=turns_key)
+        if data.get("duration_secs") is not None:
+            call_values["duration_secs"] = data["duration_secs"]
+        ended = await call_state.transition(
+            CallStatus.COMPLETED, external_call_id=conversation_id, values=call_values
+        )
+        if ended is None:
+            call_values.pop("duration_secs", None)
+            await execute_async(
+                supabase_service.db.table("calls").update(call_values).eq("external_call_id", conversation_id)
+            )
+
+    user_id = None
+    if data.get("agent_id"):
+        user_id = await supabase_service.get_agent_owner(data["agent_id"])
+
+    # Record usage
+    if data.get("duration_secs") and user_id:
+        today = date.today()
+        period_start = today.replace(day=1)
+        period_end = (period_start + relativedelta(months=1)) - relativedelta(days=1)
+
+        await usage_writer.write({
+            "user_id": user_id,
+            "conversation_id": data["conversation_id"],
+            "minutes_used": str(data["duration_secs"] / 60),
+            "billing_period_start": period_start.isoformat(),
+            "billing_period_end": period_end.isoformat(),
+            "created_at": datetime.utcnow().isoformat()
+        })
+
+    # Customer webhooks (queued in the outbox; redeliveries of this webhook don't duplicate them)
+    if user_id and conversation_id:
+        await event_bus.publish(user_id, {
+            "type": "conversation.created",
+            "conversation_id": conversation_id,
+            "agent_id": data.get("agent_id"),
+            "duration_secs": data.get("duration_secs"),
+            "call_successful": data.get("call_successful"),
+            "title": data.get("title"),
+        })
+        if data.get("duration_secs"):
+            await webhook_outbox.publish(user_id, "usage.recorded", f"usage.recorded:{conversation_id}", {
+                "conversation_id": conversation_id,
+                "minutes_used": data["duration_secs"] / 60,
+                "billing_period_start": period_start.isoformat(),
+                "billing_period_end": period_end.isoformat(),
+            })
+        await webhook_outbox.publish(user_id, "call.completed", f"call.completed:{conversation_id}", {
+            "conversation_id": conversation_id,
+            "agent_id": data.get("agent_id"),
+            "duration_secs": data.get("duration_secs"),
+            "call_successful": data.get("call_successful"),
+            "summary": data.get("summary"),
+            "sentiment": data.get("sentiment"),
+            "intent": data.get("intent"),
+        })
@@ -20,6 +20,12 @@ class Settings(BaseSettings):
     # ElevenLabs
     ELEVENLABS_API_KEY: str
     ELEVENLABS_WEBHOOK_SECRET: str
+    ELEVENLABS_API_BASE_URL: str = "https://api.elevenlabs.io"
+    ELEVENLABS_AGENT_PHONE_NUMBER_ID: str = ""
+    ELEVENLABS_MAX_CONNECTIONS: int = 50
+    ELEVENLABS_MAX_RETRIES: int = 2
+    ELEVENLABS_CIRCUIT_FAILURE_THRESHOLD: int = 5
+    ELEVENLABS_CIRCUIT_RESET_SECONDS: float = 30
 
     # Stripe
     STRIPE_SECRET_KEY: str
@@ -39,11 +45,115 @@ class Settings(BaseSettings):
     SENDGRID_API_KEY: str
     SENDGRID_FROM_EMAIL: str
     SENDGRID_FROM_NAME: str = "Vami Platform"
+    EMAIL_QUEUE_MAX_SIZE: int = 10000
+    EMAIL_WORKER_CONCURRENCY: int = 4
+    EMAIL_MAX_RETRIES: int = 5
 
     # Twilio
     TWILIO_ACCOUNT_SID: str
     TWILIO_AUTH_TOKEN: str
     TWILIO_PHONE_NUMBER: str
+    TWILIO_API_BASE_URL: str = "https://api.twilio.com"
+    SMS_RATE_PER_SECOND: float = 1.0  # Twilio long-code throughput per sender number
+    SMS_BURST: int = 1
+    SMS_WORKER_CONCURRENCY: int = 4
+    SMS_QUEUE_MAX_SIZE: int = 10000
+    SMS_MAX_RETRIES: int = 5
+
+    # Appointment reminders
+    REMINDER_WORKER_ENABLED: bool = True
+    REMINDER_LOOKAHEAD_MINUTES: int = 120
+    REMINDER_POLL_INTERVAL_SECONDS: float = 30
+    # A batch has to be delivered within the lease: at most about
+    # REMINDER_LEASE_SECONDS * SMS_RATE_PER_SECOND / 2 (the worker caps it)
+    REMINDER_BATCH_SIZE: int = 150
+    REMINDER_LEASE_SECONDS: int = 300
+
+    # Scheduled outbound calls
+    CALL_SCHEDULER_ENABLED: bool = False  # Places real calls; enable once ElevenLabs outbound calling is configured
+    CALL_SCHEDULER_POLL_INTERVAL_SECONDS: float = 5
+    CALL_SCHEDULER_LOOKAHEAD_SECONDS: int = 60
+    CALL_SCHEDULER_BATCH_SIZE: int = 100
+    CALL_SCHEDULER_LEASE_SECONDS: int = 180
+    CALL_SCHEDULER_MAX_CONCURRENCY: int = 50
+    CALL_SCHEDULER_MAX_ATTEMPTS: int = 3
+    CALL_SCHEDULER_RETRY_BASE_SECONDS: float = 60
+    CALL_WINDOW_START_HOUR: int = 8  # Retries are only placed inside the callee's local calling hours
+    CALL_WINDOW_END_HOUR: int = 21
+
+    # Inbound call routing cache
+    PHONE_ROUTING_REFRESH_SECONDS: float = 5
+
+    # Twilio number inventory mirror
+    TWILIO_INVENTORY_SYNC_ENABLED: bool = True
+    TWILIO_INVENTORY_SYNC_INTERVAL_SECONDS: int = 300
+    TWILIO_INVENTORY_PAGE_SIZE: int = 1000
+
+    # Available number search cache
+    PHONE_SEARCH_CACHE_TTL_SECONDS: float = 30
+    PHONE_SEARCH_PREFETCH_TOP_N: int = 10
+    PHONE_SEARCH_PREFETCH_AREA_CODES: str = '[]'
+
+    # Phone provisioning
+    PHONE_PROVISION_CONCURRENCY: int = 5
+
+    # Webhook idempotency
+    IDEMPOTENCY_CACHE_SIZE: int = 10000
+    IDEMPOTENCY_LEASE_SECONDS: int = 300
+
+    # Webhook write batching
+    BATCH_WRITE_MAX_ROWS: int = 200
+    BATCH_WRITE_MAX_DELAY_MS: float = 20
+
+    # Transcript / payload blob storage
+    TRANSCRIPT_BUCKET: str = "transcripts"
+    TRANSCRIPT_CACHE_SIZE: int = 256
+
+    # API key authentication
+    API_KEY_CACHE_SIZE: int = 10000
+    API_KEY_CACHE_TTL_SECONDS: float = 60
+    API_KEY_NEGATIVE_CACHE_TTL_SECONDS: float = 10
+    API_KEY_LAST_USED_FLUSH_SECONDS: float = 30
+
+    # Customer webhook delivery
+    WEBHOOK_DELIVERY_ENABLED: bool = True
+    WEBHOOK_DELIVERY_POLL_INTERVAL_SECONDS: float = 1
+    WEBHOOK_DELIVERY_BATCH_SIZE: int = 200
+    WEBHOOK_DELIVERY_LEASE_SECONDS: int = 60
+    WEBHOOK_DELIVERY_MAX_CONCURRENCY: int = 100
+    WEBHOOK_DELIVERY_MAX_ATTEMPTS: int = 8
+    WEBHOOK_DELIVERY_RETRY_BASE_SECONDS: float = 10
+    WEBHOOK_DELIVERY_TIMEOUT_SECONDS: float = 10
+    WEBHOOK_ENDPOINT_CONCURRENCY: int = 4
+    WEBHOOK_ENDPOINT_DISABLE_AFTER: int = 20
+    WEBHOOK_ENDPOINT_CACHE_SECONDS: float = 30
+
+    # Live event streaming ("local" or "postgres"; postgres needs DATABASE_URL)
+    EVENT_BUS_BACKEND: str = "local"
+    EVENT_STREAM_QUEUE_SIZE: int = 100
+    EVENT_STREAM_HEARTBEAT_SECONDS: float = 15
+
+    # Direct Postgres connection string (optional)
+    DATABASE_URL: str = ""
+    # Use DATABASE_URL for aggregates, exports and batch inserts instead of PostgREST
+    DATABASE_DIRECT_QUERIES: bool = False
+    DATABASE_POOL_MIN_SIZE: int = 1
+    DATABASE_POOL_MAX_SIZE: int = 10
+    DATABASE_STATEMENT_TIMEOUT_MS: int = 30000
+    # CSV exports running at once; each holds a pooled connection and a COPY thread
+    DATABASE_EXPORT_CONCURRENCY: int = 4
+
+    # Read replicas for staleness-tolerant reads (JSON list of Supabase API URLs)
+    SUPABASE_READ_REPLICA_URLS: str = "[]"
+    READ_REPLICA_STICKY_SECONDS: float = 5
+
+    # Event-loop watchdog and profiling
+    LOOP_WATCHDOG_ENABLED: bool = True
+    LOOP_WATCHDOG_THRESHOLD_MS: float = 100
+    LOOP_WATCHDOG_INTERVAL_MS: float = 20
+    # Token for /api/admin/diagnostics (X-Admin-Token); the endpoints are off when empty
+    ADMIN_API_TOKEN: str = ""
+    PROFILER_MAX_SECONDS: float = 60
 
     # URLs
     FRONTEND_URL: str = "http://localhost:5173"
@@ -56,6 +166,14 @@ class Settings(BaseSettings):
     def cors_origins_list(self) -> List[str]:
         return json.loads(self.CORS_ORIGINS)
 
+    @property
+    def supabase_read_replica_urls_list(self) -> List[str]:
+        return json.loads(self.SUPABASE_READ_REPLICA_URLS)
+
+    @property
+    def phone_search_prefetch_area_codes_list(self) -> List[str]:
+        return json.loads(self.PHONE_SEARCH_PREFETCH_AREA_CODES)
+
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -1,10 +1,110 @@
-from supabase import create_client, Client
+"""
+Supabase clients
+
+All writes, and reads that must see them, use the primary client
+(get_supabase()). Reads that tolerate a few seconds of replication lag
+(dashboard stats, analytics, list pages) can use get_read_client(), which
+spreads them over the read replicas in SUPABASE_READ_REPLICA_URLS.
+
+Read-your-writes: after a user makes a write request (see
+app.api.deps), their reads stay on the primary for
+READ_REPLICA_STICKY_SECONDS, so a page reloaded after a change shows it.
+Routing decisions are counted per reason (routing_stats()).
+
+Clients are registered lazily (app/services/registry.py): the Supabase SDK
+is imported and the clients built on first query, not at import.
+"""
+from typing import Optional, List, Dict, TYPE_CHECKING
+from collections import Counter
 from app.config import settings
+from app.services.registry import registry
+import asyncio
+import itertools
+import time
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+
+def create_client(url: str) -> "Client":
+    from supabase import create_client as create_supabase_client
 
-# Initialize Supabase client
-supabase: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_KEY)
+    return create_supabase_client(url, settings.SUPABASE_SERVICE_KEY)
 
 
-def get_supabase() -> Client:
+# Supabase client (built on first use)
+supabase: "Client" = registry.register("supabase", lambda: create_client(settings.SUPABASE_URL))
+
+
+def get_supabase() -> "Client":
     """Get Supabase client instance"""
-    return supabase
\ No newline at end of file
+    return supabase
+
+
+async def execute_async(query):
+    """Run a (blocking) Supabase query builder's execute() in a worker thread"""
+    return await asyncio.to_thread(query.execute)
+
+
+class ReadRouter:
+    def __init__(self, primary: "Client", replica_urls: List[str], sticky_seconds: float = 5):
+        self.primary = primary
+        self.replicas: List["Client"] = [
+            registry.register(f"supabase_replica_{i}", lambda url=url: create_client(url))
+            for i, url in enumerate(replica_urls)
+        ]
+        self.sticky_seconds = sticky_seconds
+        self._next = itertools.cycle(range(len(self.replicas)))
+        # user_id -> monotonic time of their last write request
+        self._recent_writes: Dict[str, float] = {}
+        self.decisions: Counter = Counter()
+
+    def note_write(self, user_id: str):
+        """Pin the user's reads to the primary for the next sticky_seconds"""
+        if not self.replicas:
+            return
+        now = time.monotonic()
+        self._recent_writes[user_id] = now
+        if len(self._recent_writes) > 10000:
+            self._recent_writes = {
+                uid: at for uid, at in self._recent_writes.items() if now - at < self.sticky_seconds
+            }
+
+    def read_client(self, user_id: Optional[str] = None) -> "Client":
+        if not self.replicas:
+            self.decisions["primary:no_replicas"] += 1
+            return self.primary
+        if user_id is not None:
+            wrote_at = self._recent_writes.get(user_id)
+            if wrote_at is not None and time.monotonic() - wrote_at < self.sticky_seconds:
+                self.decisions["primary:read_your_writes"] += 1
+                return self.primary
+        index = next(self._next)
+        self.decisions[f"replica:{index}"] += 1
+        return self.replicas[index]
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.decisions)
+
+
+read_router = ReadRouter(
+    supabase,
+    settings.supabase_read_replica_urls_list,
+    sticky_seconds=settings.READ_REPLICA_STICKY_SECONDS,
+)
+
+
+def get_read_client(user_id: Optional[str] = None) -> "Client":
+    """
+    Client for staleness-tolerant reads: a read replica if any are
+    configured, unless `user_id` wrote recently. Never use it for writes.
+    """
+    return read_router.read_client(user_id)
+
+
+def note_write(user_id: str):
+    read_router.note_write(user_id)
+
+
+def routing_stats() -> Dict[str, int]:
+    return read_router.stats()
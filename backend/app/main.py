@@ -1,11 +1,27 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
+from app.database import routing_stats
+from app.services.registry import registry
 from app.api.routes import (
     auth, agents, analytics, billing, webhooks, integrations,
-    team, calls, calendar, agent_actions, phone_numbers, templates
+    team, calls, calendar, agent_actions, phone_numbers, templates, diagnostics
 )
 from app.api.routes import settings as settings_routes
+from app.services.email_service import email_service
+from app.services.sms_service import sms_service
+from app.services.phone_service import phone_service
+from app.services.elevenlabs_service import elevenlabs_service
+from app.services.batch_writer import conversation_writer, usage_writer
+from app.services.api_keys import api_key_store
+from app.services.webhook_outbox import webhook_outbox
+from app.services.event_bus import event_bus
+from app.services.postgres import postgres
+from app.services.diagnostics import loop_watchdog
+from app.workers.reminders import reminder_worker
+from app.workers.call_scheduler import call_scheduler
+from app.workers.twilio_inventory import twilio_inventory_sync
+from app.workers.webhook_delivery import webhook_delivery
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
@@ -71,6 +87,49 @@ app.include_router(settings_routes.router, prefix="/api")
 app.include_router(agent_actions.router, prefix="/api")
 app.include_router(phone_numbers.router, prefix="/api")
 app.include_router(templates.router, prefix="/api")
+app.include_router(diagnostics.router, prefix="/api")
+
+
+@app.on_event("startup")
+async def start_background_services():
+    """Start background dispatchers and workers"""
+    if settings.LOOP_WATCHDOG_ENABLED:
+        loop_watchdog.start()
+    await email_service.start()
+    await sms_service.start()
+    await phone_service.routing.start()
+    await event_bus.start()
+    phone_service.search_cache.start()
+    api_key_store.start()
+    if settings.REMINDER_WORKER_ENABLED:
+        reminder_worker.start()
+    if settings.CALL_SCHEDULER_ENABLED:
+        call_scheduler.start()
+    if settings.TWILIO_INVENTORY_SYNC_ENABLED:
+        twilio_inventory_sync.start()
+    if settings.WEBHOOK_DELIVERY_ENABLED:
+        webhook_delivery.start()
+
+
+@app.on_event("shutdown")
+async def stop_background_services():
+    """Drain queues and close pooled clients"""
+    await twilio_inventory_sync.stop()
+    await webhook_delivery.stop()
+    await call_scheduler.stop()
+    await reminder_worker.stop()
+    await phone_service.routing.stop()
+    await phone_service.search_cache.stop()
+    await conversation_writer.stop()
+    await usage_writer.stop()
+    await webhook_outbox.stop()
+    await api_key_store.stop()
+    await email_service.stop()
+    await sms_service.stop()
+    await event_bus.stop()
+    await elevenlabs_service.close()
+    postgres.close()
+    await loop_watchdog.stop()
 
 
 @app.get("/")
@@ -101,7 +160,11 @@ async def health_check():
     return {
         "status": "healthy",
         "version": "2.0.0",
-        "timestamp": "now"
+        "timestamp": "now",
+        "read_routing": routing_stats(),
+        "services": registry.stats(),
+        "event_bus": event_bus.stats(),
+        "event_loop": loop_watchdog.stats()
     }
 
 
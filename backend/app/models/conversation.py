@@ -42,6 +42,8 @@ class Conversation(BaseModel):
     sentiment: Optional[Sentiment] = None
     intent: Optional[str] = None
     webhook_payload: Optional[Dict[str, Any]] = None
+    payload_key: Optional[str] = None
+    turns_key: Optional[str] = None
     created_at: datetime
 
     class Config:
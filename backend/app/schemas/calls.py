@@ -86,6 +86,15 @@ class CallListResponse(BaseModel):
     pages: int
 
 
+class ConversationTurn(BaseModel):
+    """One speaker turn of a parsed transcript"""
+    speaker: str  # "agent" or "customer"
+    text: str
+    start_secs: Optional[float] = None
+    end_secs: Optional[float] = None
+    duration_secs: Optional[float] = None
+
+
 class CallDetailResponse(BaseModel):
     """Detailed response for a single call"""
     id: str
@@ -108,7 +117,7 @@ class CallDetailResponse(BaseModel):
     ended_at: Optional[datetime] = None
 
     # Additional details
-    conversation_turns: Optional[List[Dict[str, Any]]] = None
+    conversation_turns: Optional[List[ConversationTurn]] = None
     sentiment_analysis: Optional[Dict[str, Any]] = None
     extracted_data: Optional[Dict[str, Any]] = None
     follow_up_required: Optional[bool] = None
@@ -184,12 +193,6 @@ class ScheduleCallRequest(BaseModel):
     timezone: str = "UTC"
     metadata: Optional[Dict[str, Any]] = None
 
-    @validator('scheduled_at')
-    def validate_future_time(cls, v):
-        if v <= datetime.utcnow():
-            raise ValueError("Scheduled time must be in the future")
-        return v
-
 
 class BulkCallRequest(BaseModel):
     """Request schema for bulk calls"""
@@ -98,6 +98,7 @@ class WebhookEndpoint(BaseModel):
     events: List[str]
     secret: Optional[str] = None
     is_active: bool = True
+    batch_size: int = 1  # Events per POST; >1 sends {"events": [...]}
 
     @validator('url')
     def validate_url(cls, v):
@@ -105,6 +106,12 @@ class WebhookEndpoint(BaseModel):
             raise ValueError("URL must start with http:// or https://")
         return v
 
+    @validator('batch_size')
+    def validate_batch_size(cls, v):
+        if v < 1 or v > 100:
+            raise ValueError("batch_size must be between 1 and 100")
+        return v
+
 
 class WebhookEndpointResponse(BaseModel):
     """Response schema for webhook endpoint"""
@@ -114,6 +121,7 @@ class WebhookEndpointResponse(BaseModel):
     events: List[str]
     secret_preview: Optional[str] = None
     is_active: bool
+    batch_size: int = 1
     created_at: datetime
     last_triggered_at: Optional[datetime] = None
     success_count: int = 0
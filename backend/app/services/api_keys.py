@@ -0,0 +1,191 @@
+"""
+API key authentication
+
+Server-to-server integrations send `X-API-Key: vami_...` instead of a
+Supabase JWT. Keys are stored as SHA-256 hashes (api_keys.api_key, unique),
+so a lookup is one indexed equality query, and its result is cached:
+
+- valid keys are kept in an LRU for cache_ttl_seconds together with the
+  profile of the user they belong to, so a cached key costs no query at
+  all; revocations, permission changes and profile changes (e.g. a plan
+  change) made by other processes apply within that window (this process
+  drops its own entries immediately, see invalidate_key)
+- unknown hashes are cached too, for a shorter time, so a client retrying a
+  bad key can't turn every request into a database query
+- last_used_at is not written per request: uses are collected in memory and
+  written every flush_interval_seconds with one update per flush
+"""
+from typing import Optional, Dict, Any, List
+from collections import OrderedDict
+from datetime import datetime, timezone
+from app.config import settings
+from app.database import get_supabase, execute_async
+from app.models.user import User
+import asyncio
+import hashlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "vami_"
+
+# GET-style requests need "read"; everything else needs "write"
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+ADMIN_PERMISSIONS = {"admin", "*"}
+PERMISSIONS = {"read", "write"} | ADMIN_PERMISSIONS
+DEFAULT_PERMISSIONS = ["read"]
+
+
+def hash_key(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+
+def has_permission(permissions: Optional[List[str]], method: str) -> bool:
+    granted = set(permissions or DEFAULT_PERMISSIONS)
+    if granted & ADMIN_PERMISSIONS:
+        return True
+    return ("read" if method.upper() in READ_METHODS else "write") in granted
+
+
+def is_expired(record: Dict[str, Any]) -> bool:
+    expires_at = record.get("expires_at")
+    if not expires_at:
+        return False
+    expires = datetime.fromisoformat(expires_at.replace("Z", "+00:00"))
+    if expires.tzinfo is None:
+        expires = expires.replace(tzinfo=timezone.utc)
+    return expires <= datetime.now(timezone.utc)
+
+
+class APIKeyStore:
+    def __init__(
+        self,
+        cache_size: int = 10000,
+        cache_ttl_seconds: float = 60,
+        negative_ttl_seconds: float = 10,
+        flush_interval_seconds: float = 30,
+    ):
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl_seconds
+        self.negative_ttl = negative_ttl_seconds
+        self.flush_interval = flush_interval_seconds
+        self.db = get_supabase()
+
+        # key hash -> (record or None, cached at)
+        self._cache: OrderedDict = OrderedDict()
+        # key id -> last use (ISO timestamp) not yet written
+        self._last_used: Dict[str, str] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    # Lifecycle
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop(), name="api-key-last-used")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    # Lookup
+    async def authenticate(self, api_key: str) -> Optional[Dict[str, Any]]:
+        """
+        Resolve a raw key to its api_keys row
+
+        The row's "user" is the owner's User (None if the profile is gone).
+        Returns None for unknown or inactive keys. Expiry and permissions are
+        checked by the caller (see app.api.deps) so it can say which failed.
+        """
+        if not api_key.startswith(KEY_PREFIX):
+            return None
+
+        key_hash = hash_key(api_key)
+        entry = self._cache.get(key_hash)
+        if entry is not None:
+            record, cached_at = entry
+            ttl = self.cache_ttl if record is not None else self.negative_ttl
+            if time.monotonic() - cached_at < ttl:
+                self._cache.move_to_end(key_hash)
+                return record
+
+        result = await execute_async(
+            self.db.table("api_keys")
+            .select("id, user_id, permissions, expires_at, is_active")
+            .eq("api_key", key_hash)
+            .limit(1)
+        )
+        record = result.data[0] if result.data else None
+        if record is not None and record.get("is_active") is False:
+            record = None
+        if record is not None:
+            user = await execute_async(
+                self.db.table("users").select("*").eq("id", record["user_id"]).limit(1)
+            )
+            record["user"] = User(**user.data[0]) if user.data else None
+
+        self._cache[key_hash] = (record, time.monotonic())
+        self._cache.move_to_end(key_hash)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return record
+
+    def invalidate_key(self, key_id: str):
+        """Forget a key that was deleted or changed through this process"""
+        for key_hash, (record, _) in list(self._cache.items()):
+            if record is not None and record["id"] == key_id:
+                del self._cache[key_hash]
+        self._last_used.pop(key_id, None)
+
+    def invalidate_user(self, user_id: str):
+        """Forget every cached key of a user whose profile changed through this process"""
+        for key_hash, (record, _) in list(self._cache.items()):
+            if record is not None and record["user_id"] == user_id:
+                del self._cache[key_hash]
+
+    # Usage tracking
+    def touch(self, key_id: str):
+        self._last_used[key_id] = datetime.utcnow().isoformat()
+
+    async def flush(self):
+        """Write buffered last_used_at values (one update for the whole batch)"""
+        if not self._last_used:
+            return
+        pending, self._last_used = self._last_used, {}
+        # Keys used within one interval all get the latest use time; the
+        # column is informational, so interval precision is enough
+        try:
+            await execute_async(
+                self.db.table("api_keys")
+                .update({"last_used_at": max(pending.values())})
+                .in_("id", list(pending))
+            )
+        except Exception as e:
+            logger.error(f"Failed to record API key usage for {len(pending)} keys: {e}")
+            for key_id, used_at in pending.items():
+                self._last_used.setdefault(key_id, used_at)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cached_keys": len(self._cache),
+            "pending_last_used": len(self._last_used),
+        }
+
+
+# Singleton instance
+api_key_store = APIKeyStore(
+    cache_size=settings.API_KEY_CACHE_SIZE,
+    cache_ttl_seconds=settings.API_KEY_CACHE_TTL_SECONDS,
+    negative_ttl_seconds=settings.API_KEY_NEGATIVE_CACHE_TTL_SECONDS,
+    flush_interval_seconds=settings.API_KEY_LAST_USED_FLUSH_SECONDS,
+)
@@ -0,0 +1,151 @@
+"""
+Micro-batched inserts for webhook bursts
+
+During busy hours post-call webhooks arrive many per second, and each used to
+insert its conversation and usage rows with separate round trips. A
+BatchWriter buffers rows for a few milliseconds (or until max_rows are
+waiting) and writes them with one multi-row upsert, over a direct Postgres
+connection when DATABASE_DIRECT_QUERIES is on (see app/services/postgres.py).
+
+Writes are acknowledged only after their batch is committed: write() returns
+once the row is in the database and raises if it could not be stored, so the
+webhook handler only answers 2xx for persisted data and the provider
+redelivers anything lost in a crash. If a batch fails as a whole, its rows
+are retried one by one so one bad row can't fail its neighbours.
+"""
+from typing import Optional, List, Dict, Any, Tuple
+from app.config import settings
+from app.database import get_supabase, execute_async
+from app.services.postgres import postgres
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWriter:
+    def __init__(
+        self,
+        table: str,
+        on_conflict: str,
+        max_rows: int = 200,
+        max_delay_ms: float = 20,
+    ):
+        self.table = table
+        self.on_conflict = on_conflict
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000
+        self.db = get_supabase()
+
+        self._pending: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self.rows_written = 0
+        self.batches_written = 0
+
+    # Lifecycle
+    def _ensure_started(self):
+        if self._task is None:
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._flush_loop(), name=f"batch-writer-{self.table}")
+
+    async def stop(self):
+        """Flush whatever is buffered, then stop the flusher"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+
+    # Writing
+    async def write(self, row: Dict[str, Any]):
+        """Queue a row and wait until its batch is committed"""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((row, future))
+        # Wake the flusher on the first row (starts the delay) and when a batch is full
+        if len(self._pending) == 1 or len(self._pending) >= self.max_rows:
+            self._wakeup.set()
+        await future
+
+    async def _flush_loop(self):
+        while True:
+            while not self._pending:
+                if self._stopping:
+                    return
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            self._wakeup.clear()
+            if len(self._pending) < self.max_rows and not self._stopping:
+                # Give the burst a few ms to fill the batch
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.max_delay)
+                except asyncio.TimeoutError:
+                    pass
+
+            batch, self._pending = self._pending[:self.max_rows], self._pending[self.max_rows:]
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                logger.error(f"Batch writer for {self.table} failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    async def _flush(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        try:
+            await self._upsert([row for row, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                raise
+            logger.warning(f"Batch insert into {self.table} failed ({len(batch)} rows), retrying rows individually: {e}")
+        else:
+            self.batches_written += 1
+            self.rows_written += len(batch)
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+            return
+
+        for row, future in batch:
+            try:
+                await self._upsert([row])
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                self.rows_written += 1
+                if not future.done():
+                    future.set_result(None)
+
+    async def _upsert(self, rows: List[Dict[str, Any]]):
+        if postgres.enabled:
+            await postgres.insert_rows(self.table, rows, on_conflict=self.on_conflict)
+            return
+        from postgrest.types import ReturnMethod
+
+        await execute_async(
+            self.db.table(self.table).upsert(
+                rows, on_conflict=self.on_conflict, ignore_duplicates=True, returning=ReturnMethod.minimal
+            )
+        )
+
+
+# Singleton instances
+conversation_writer = BatchWriter(
+    "conversations",
+    on_conflict="conversation_id",
+    max_rows=settings.BATCH_WRITE_MAX_ROWS,
+    max_delay_ms=settings.BATCH_WRITE_MAX_DELAY_MS,
+)
+usage_writer = BatchWriter(
+    "usage_records",
+    on_conflict="conversation_id",
+    max_rows=settings.BATCH_WRITE_MAX_ROWS,
+    max_delay_ms=settings.BATCH_WRITE_MAX_DELAY_MS,
+)
@@ -1,12 +1,12 @@
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Any
 from app.config import settings
 
 
+# The Google client libraries are imported where they are used: they are slow
+# to import and most processes never talk to Google
+
+
 class CalendarService:
     SCOPES = ['https://www.googleapis.com/auth/calendar']
 
@@ -23,6 +23,8 @@ class CalendarService:
 
     def get_authorization_url(self, state: str) -> str:
         """Generate Google OAuth authorization URL"""
+        from google_auth_oauthlib.flow import Flow
+
         flow = Flow.from_client_config(
             self.client_config,
             scopes=self.SCOPES,
@@ -40,6 +42,8 @@ class CalendarService:
 
     async def exchange_code_for_tokens(self, code: str) -> Dict[str, Any]:
         """Exchange authorization code for access and refresh tokens"""
+        from google_auth_oauthlib.flow import Flow
+
         flow = Flow.from_client_config(
             self.client_config,
             scopes=self.SCOPES,
@@ -58,6 +62,9 @@ class CalendarService:
 
     def refresh_access_token(self, refresh_token: str) -> Dict[str, Any]:
         """Refresh access token using refresh token"""
+        from google.auth.transport.requests import Request
+        from google.oauth2.credentials import Credentials
+
         credentials = Credentials(
             token=None,
             refresh_token=refresh_token,
@@ -76,6 +83,9 @@ class CalendarService:
 
     def _get_calendar_service(self, access_token: str):
         """Get authenticated calendar service"""
+        from google.oauth2.credentials import Credentials
+        from googleapiclient.discovery import build
+
         credentials = Credentials(token=access_token)
         return build('calendar', 'v3', credentials=credentials)
 
@@ -0,0 +1,133 @@
+"""
+Call state machine
+
+Every call status change goes through transition(), which applies it as a
+single conditional UPDATE: the row only changes if its current status is one
+the new status may be entered from (TRANSITIONS). Provider events that
+arrive late or twice therefore match no row and are ignored instead of
+moving a finished call back to "ringing", and no SELECT is needed first.
+
+started_at is set when a call goes in progress and ended_at when it reaches
+a terminal status; duration_secs is filled from those by a trigger (see
+migrations/014_call_state_machine.sql) unless the provider reported it.
+Applied transitions are published to the tenant's live event stream.
+"""
+from typing import Optional, Dict, Any, Union
+from datetime import datetime, timezone
+from app.config import settings
+from app.database import get_supabase, execute_async
+from app.schemas.calls import CallStatus
+from app.services.event_bus import event_bus
+import logging
+
+logger = logging.getLogger(__name__)
+
+TERMINAL = {CallStatus.COMPLETED, CallStatus.FAILED, CallStatus.CANCELLED, CallStatus.NO_ANSWER}
+
+# New status -> statuses it may be entered from
+TRANSITIONS = {
+    CallStatus.RINGING: {CallStatus.PENDING},
+    CallStatus.IN_PROGRESS: {CallStatus.PENDING, CallStatus.RINGING},
+    CallStatus.COMPLETED: {CallStatus.PENDING, CallStatus.RINGING, CallStatus.IN_PROGRESS},
+    CallStatus.FAILED: {CallStatus.PENDING, CallStatus.RINGING, CallStatus.IN_PROGRESS},
+    CallStatus.NO_ANSWER: {CallStatus.PENDING, CallStatus.RINGING},
+    CallStatus.CANCELLED: {CallStatus.PENDING, CallStatus.RINGING},
+}
+
+# Provider (ElevenLabs / Twilio) status names -> our statuses
+PROVIDER_STATUSES = {
+    "queued": CallStatus.RINGING,
+    "initiated": CallStatus.RINGING,
+    "ringing": CallStatus.RINGING,
+    "in-progress": CallStatus.IN_PROGRESS,
+    "in_progress": CallStatus.IN_PROGRESS,
+    "answered": CallStatus.IN_PROGRESS,
+    "completed": CallStatus.COMPLETED,
+    "done": CallStatus.COMPLETED,
+    "busy": CallStatus.NO_ANSWER,
+    "no-answer": CallStatus.NO_ANSWER,
+    "no_answer": CallStatus.NO_ANSWER,
+    "failed": CallStatus.FAILED,
+    "canceled": CallStatus.CANCELLED,
+    "cancelled": CallStatus.CANCELLED,
+}
+
+
+def call_status_callback_url() -> str:
+    """Provider status webhook for calls (see webhooks.elevenlabs_call_status)"""
+    return f"{settings.WEBHOOK_BASE_URL}/api/webhooks/elevenlabs/call-status"
+
+
+def provider_status(value: Optional[str]) -> Optional[CallStatus]:
+    return PROVIDER_STATUSES.get((value or "").strip().lower())
+
+
+def parse_event_time(value: Union[str, int, float, None]) -> Optional[datetime]:
+    """Unix seconds or ISO 8601 -> aware UTC datetime"""
+    if value is None or value == "":
+        return None
+    try:
+        if isinstance(value, (int, float)) or str(value).replace(".", "", 1).isdigit():
+            return datetime.fromtimestamp(float(value), tz=timezone.utc)
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+    except (ValueError, OverflowError):
+        return None
+
+
+class CallStateMachine:
+    def __init__(self):
+        self.db = get_supabase()
+
+    async def transition(
+        self,
+        status: CallStatus,
+        *,
+        call_id: Optional[str] = None,
+        external_call_id: Optional[str] = None,
+        where: Optional[Dict[str, Any]] = None,
+        values: Optional[Dict[str, Any]] = None,
+        at: Optional[datetime] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Move a call (by id or external_call_id) to `status`
+
+        `where` adds equality conditions (e.g. user_id, lease_owner) and
+        `values` are written along with the status. Returns the updated row,
+        or None if the call doesn't exist or its current status doesn't allow
+        the transition.
+        """
+        if call_id is None and external_call_id is None:
+            raise ValueError("call_id or external_call_id is required")
+
+        timestamp = (at or datetime.now(timezone.utc)).isoformat()
+        update = {"status": status.value, **(values or {})}
+        if status == CallStatus.IN_PROGRESS:
+            update.setdefault("started_at", timestamp)
+        if status in TERMINAL:
+            update.setdefault("ended_at", timestamp)
+
+        query = self.db.table("calls").update(update).in_(
+            "status", [s.value for s in TRANSITIONS[status]]
+        )
+        if call_id is not None:
+            query = query.eq("id", call_id)
+        if external_call_id is not None:
+            query = query.eq("external_call_id", external_call_id)
+        for column, value in (where or {}).items():
+            query = query.eq(column, value)
+
+        result = await execute_async(query)
+        if not result.data:
+            logger.info(f"Ignored call transition to {status.value} for {call_id or external_call_id}")
+            return None
+
+        call = result.data[0]
+        await event_bus.publish_call_status(
+            call["user_id"], call["id"], status.value, duration_secs=call.get("duration_secs")
+        )
+        return call
+
+
+# Singleton instance
+call_state = CallStateMachine()
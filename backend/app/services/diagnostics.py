@@ -0,0 +1,214 @@
+"""
+Event-loop watchdog and sampling profiler
+
+Handlers that call a blocking SDK inside `async def` stall every request
+on the worker, not just their own, and PerformanceMonitoringMiddleware only
+sees the (slow) request that did it. LoopWatchdog catches those stalls as
+they happen: a heartbeat task on the loop stamps the time every interval,
+and a monitor thread checks the stamp. When the loop has been stuck for
+longer than the threshold, the thread logs the task that is running and
+the stack of the loop thread at that moment, which points at the blocking
+call. The heartbeat measures how long each stall lasted.
+
+SamplingProfiler records the stacks of the worker's threads at a fixed
+rate for a few seconds and returns them in the collapsed ("folded") format
+that flamegraph.pl, speedscope and inferno read. It only runs while a
+profile is requested.
+"""
+from typing import Optional, List, Dict, Any
+from collections import Counter, deque
+from datetime import datetime, timezone
+from app.config import settings
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+# Stalls kept for the diagnostics endpoint
+RECENT_STALLS = 20
+
+
+class LoopWatchdog:
+    def __init__(self, threshold_ms: float = 100, interval_ms: float = 20):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._monitor: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._last_beat = 0.0
+        self._pending: Optional[Dict[str, Any]] = None
+
+        self.stalls = 0
+        self.blocked_seconds = 0.0
+        self.max_lag = 0.0
+        self.recent: deque = deque(maxlen=RECENT_STALLS)
+
+    @property
+    def running(self) -> bool:
+        return self._heartbeat is not None
+
+    def start(self):
+        """Start watching the running event loop"""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopping.clear()
+        self._heartbeat = asyncio.create_task(self._beat(), name="loop-watchdog")
+        self._monitor = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._monitor.start()
+
+    async def stop(self):
+        if not self.running:
+            return
+        self._stopping.set()
+        self._heartbeat.cancel()
+        try:
+            await self._heartbeat
+        except asyncio.CancelledError:
+            pass
+        self._heartbeat = None
+        await asyncio.to_thread(self._monitor.join, 1)
+        self._monitor = None
+
+    async def _beat(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = now - self._last_beat - self.interval
+            self._last_beat = now
+            if lag > self.max_lag:
+                self.max_lag = lag
+            if lag > self.threshold:
+                self._record_stall(lag)
+
+    def _record_stall(self, lag: float):
+        self.stalls += 1
+        self.blocked_seconds += lag
+        stall, self._pending = self._pending, None
+        if stall is None:
+            # Ended between two checks of the monitor thread
+            stall = {"at": datetime.now(timezone.utc).isoformat(), "task": None, "stack": None}
+        stall["blocked_ms"] = round(lag * 1000, 1)
+        self.recent.append(stall)
+        if stall["stack"]:
+            logger.warning(f"Event loop was blocked for {stall['blocked_ms']:.0f} ms by {stall['task']}")
+
+    def _watch(self):
+        reported_beat = None
+        while not self._stopping.wait(self.interval):
+            beat = self._last_beat
+            stuck_for = time.monotonic() - beat - self.interval
+            if stuck_for <= self.threshold or beat == reported_beat:
+                continue
+            reported_beat = beat
+            self._pending = self._capture(stuck_for)
+            logger.warning(
+                f"Event loop blocked for more than {stuck_for * 1000:.0f} ms by {self._pending['task']}:\n"
+                f"{self._pending['stack']}"
+            )
+
+    def _capture(self, stuck_for: float) -> Dict[str, Any]:
+        """Running task and loop-thread stack, taken from the monitor thread while the loop is stuck"""
+        task = asyncio.current_task(self._loop)
+        frame = sys._current_frames().get(self._loop_thread_id)
+        return {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "task": _describe_task(task),
+            "stack": "".join(traceback.format_stack(frame)) if frame else None,
+            "detected_after_ms": round(stuck_for * 1000, 1),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "threshold_ms": self.threshold * 1000,
+            "stalls": self.stalls,
+            "blocked_ms": round(self.blocked_seconds * 1000, 1),
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+        }
+
+    def recent_stalls(self) -> List[Dict[str, Any]]:
+        return list(self.recent)
+
+
+def _describe_task(task: Optional[asyncio.Task]) -> str:
+    if task is None:
+        return "a callback outside any task"
+    coro = task.get_coro()
+    name = getattr(coro, "__qualname__", None) or repr(coro)
+    return f"task {task.get_name()} ({name})"
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+class SamplingProfiler:
+    def __init__(self, max_seconds: float = 60):
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+
+    def profile(self, seconds: float, rate_hz: float = 100, thread_id: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Sample stacks for `seconds` (blocking; run it in a thread)
+
+        Samples every thread, or only `thread_id` (e.g. the event loop's).
+        Returns the folded stacks ("thread;outer;...;inner count" lines) and
+        the number of samples taken. Only one profile runs at a time.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+        try:
+            return self._sample(min(seconds, self.max_seconds), 1 / rate_hz, thread_id)
+        finally:
+            self._lock.release()
+
+    def _sample(self, seconds: float, interval: float, only_thread: Optional[int]) -> Dict[str, Any]:
+        me = threading.get_ident()
+        stacks: Counter = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        next_sample = time.monotonic()
+
+        while next_sample < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me or (only_thread is not None and thread_id != only_thread):
+                    continue
+                stacks[_fold(names.get(thread_id, str(thread_id)), frame)] += 1
+            samples += 1
+            next_sample += interval
+            delay = next_sample - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        folded = "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
+        return {"folded": folded + "\n" if folded else "", "samples": samples, "seconds": seconds}
+
+
+def _fold(thread_name: str, frame) -> str:
+    """One stack as `thread;outermost;...;innermost`, each frame as `function (file:first line)`"""
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+        frame = frame.f_back
+    frames.append(thread_name)
+    return ";".join(reversed(frames)).replace("\n", " ")
+
+
+# Singleton instances
+loop_watchdog = LoopWatchdog(
+    threshold_ms=settings.LOOP_WATCHDOG_THRESHOLD_MS,
+    interval_ms=settings.LOOP_WATCHDOG_INTERVAL_MS,
+)
+profiler = SamplingProfiler(max_seconds=settings.PROFILER_MAX_SECONDS)
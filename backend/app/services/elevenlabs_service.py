@@ -1,34 +1,184 @@
+"""
+ElevenLabs Conversational AI client
+
+Talks to the ElevenLabs REST API over a pooled async HTTP client instead of
+the blocking SDK. Every operation has its own deadline (covering retries),
+transient failures are retried within a shared retry budget, and a circuit
+breaker makes calls fail fast while ElevenLabs is down so request handlers
+and workers are never stuck waiting on it.
+
+Without a real API key the service runs in mock mode for local development.
+"""
 from typing import Optional, Dict, Any
 from app.config import settings
+from app.services.retry import (
+    RETRYABLE_STATUS_CODES, CircuitBreaker, CircuitOpenError, RetryBudget,
+    backoff_delay, retry_after_seconds,
+)
+import asyncio
+import hashlib
+import hmac
+import logging
 import secrets
+import time
+import httpx
 
 try:
-    from elevenlabs.client import ElevenLabs
-    ELEVENLABS_AVAILABLE = True
+    from orjson import loads as json_loads
 except ImportError:
-    ELEVENLABS_AVAILABLE = False
-    print("Warning: ElevenLabs SDK not installed. Install with: pip install elevenlabs")
+    from json import loads as json_loads
+
+logger = logging.getLogger(__name__)
+
+# Deadline in seconds for each operation, retries included
+OPERATION_TIMEOUTS = {
+    "create_agent": 20.0,
+    "update_agent": 15.0,
+    "delete_agent": 10.0,
+    "initiate_call": 8.0,
+    "end_call": 5.0,
+    "get_conversation": 10.0,
+}
+
+WEBHOOK_TOLERANCE_SECONDS = 300
+
+
+class ElevenLabsError(Exception):
+    """An ElevenLabs API call failed"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
 
 
 class ElevenLabsService:
-    def __init__(self):
-        """Initialize ElevenLabs client"""
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        """Configure the client; the connection pool is opened on first use"""
         self.api_key = settings.ELEVENLABS_API_KEY
+        self.base_url = settings.ELEVENLABS_API_BASE_URL
+        self.max_retries = settings.ELEVENLABS_MAX_RETRIES
+        self.use_mock = not self.api_key or self.api_key.startswith("placeholder")
+        if self.use_mock:
+            logger.warning("ELEVENLABS_API_KEY not set - using mock ElevenLabs service")
+
+        self.breaker = CircuitBreaker(
+            "elevenlabs",
+            failure_threshold=settings.ELEVENLABS_CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=settings.ELEVENLABS_CIRCUIT_RESET_SECONDS,
+        )
+        self.retry_budget = RetryBudget()
+
+        # Pre-keyed webhook HMAC, copied per request
+        self._webhook_mac = hmac.new(settings.ELEVENLABS_WEBHOOK_SECRET.encode(), digestmod=hashlib.sha256)
+
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._twilio_client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"xi-api-key": self.api_key},
+                timeout=httpx.Timeout(10.0, connect=3.0),
+                limits=httpx.Limits(
+                    max_connections=settings.ELEVENLABS_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.ELEVENLABS_MAX_CONNECTIONS,
+                    keepalive_expiry=60.0,
+                ),
+                transport=self._transport,
+            )
+        return self._client
+
+    def _get_twilio_client(self) -> httpx.AsyncClient:
+        """Small pool for Twilio call control (hang-ups)"""
+        if self._twilio_client is None:
+            self._twilio_client = httpx.AsyncClient(
+                base_url=settings.TWILIO_API_BASE_URL,
+                auth=(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN),
+                timeout=httpx.Timeout(OPERATION_TIMEOUTS["end_call"], connect=3.0),
+                limits=httpx.Limits(max_connections=10, max_keepalive_connections=10),
+                transport=self._transport,
+            )
+        return self._twilio_client
+
+    async def close(self):
+        """Release the connection pools"""
+        for client in (self._client, self._twilio_client):
+            if client is not None:
+                await client.aclose()
+        self._client = None
+        self._twilio_client = None
+
+    # HTTP plumbing
+    async def _request(
+        self,
+        operation: str,
+        method: str,
+        path: str,
+        idempotent: bool,
+        **kwargs
+    ) -> httpx.Response:
+        """Send one API request under the operation deadline, circuit breaker and retry budget"""
+        try:
+            return await asyncio.wait_for(
+                self._request_with_retries(operation, method, path, idempotent, **kwargs),
+                timeout=OPERATION_TIMEOUTS[operation],
+            )
+        except asyncio.TimeoutError:
+            self.breaker.record_failure()
+            raise ElevenLabsError(f"ElevenLabs {operation} timed out after {OPERATION_TIMEOUTS[operation]}s")
 
-        if ELEVENLABS_AVAILABLE and self.api_key and not self.api_key.startswith("placeholder"):
+    async def _request_with_retries(self, operation, method, path, idempotent, **kwargs) -> httpx.Response:
+        self.retry_budget.record_request()
+        attempt = 0
+        while True:
             try:
-                self.client = ElevenLabs(api_key=self.api_key)
-                self.use_mock = False
-            except Exception as e:
-                print(f"Warning: Failed to initialize ElevenLabs client: {e}")
-                self.client = None
-                self.use_mock = True
-        else:
-            self.client = None
-            self.use_mock = True
-            if not ELEVENLABS_AVAILABLE:
-                print("Using mock ElevenLabs service - install elevenlabs package for real integration")
+                self.breaker.before_call()
+            except CircuitOpenError as e:
+                raise ElevenLabsError(str(e), status_code=503)
 
+            delay = None
+            try:
+                response = await self._get_client().request(method, path, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                # Never reached ElevenLabs, so even non-idempotent calls are safe to retry
+                self.breaker.record_failure()
+                error = ElevenLabsError(f"ElevenLabs {operation} connection failed: {e}")
+            except httpx.TransportError as e:
+                self.breaker.record_failure()
+                error = ElevenLabsError(f"ElevenLabs {operation} request failed: {e}")
+                if not idempotent:
+                    raise error
+            else:
+                if response.status_code < 400:
+                    self.breaker.record_success()
+                    return response
+
+                if response.status_code >= 500:
+                    self.breaker.record_failure()
+                else:
+                    # 4xx is our problem, not an outage
+                    self.breaker.record_success()
+
+                error = ElevenLabsError(
+                    f"ElevenLabs {operation} failed ({response.status_code}): {response.text[:200]}",
+                    status_code=response.status_code,
+                )
+                retryable = response.status_code == 429 or (
+                    idempotent and response.status_code in RETRYABLE_STATUS_CODES
+                )
+                if not retryable:
+                    raise error
+                delay = retry_after_seconds(response.headers, default=backoff_delay(attempt), cap=5.0)
+
+            if attempt >= self.max_retries or not self.retry_budget.try_spend():
+                raise error
+
+            await asyncio.sleep(delay if delay is not None else backoff_delay(attempt))
+            attempt += 1
+
+    # Agents
     async def create_agent(
         self,
         name: str,
@@ -50,66 +200,49 @@ class ElevenLabsService:
         Returns:
             Dict with agent_id, name, status, and metadata
         """
-        try:
-            # Set default first message if not provided
-            if not first_message:
-                first_message = f"Hello! I'm {name}. How can I help you today?"
-
-            # If using real API
-            if not self.use_mock and self.client:
-                try:
-                    # Create agent using ElevenLabs SDK
-                    response = self.client.conversational_ai.agents.create(
-                        name=name,
-                        tags=["vami-platform"],  # Tag for identification
-                        conversation_config={
-                            "tts": {
-                                "voice_id": voice_id,
-                                "model_id": "eleven_turbo_v2_5"  # Fast, low-latency model
-                            },
-                            "agent": {
-                                "prompt": {
-                                    "prompt": prompt
-                                },
-                                "first_message": first_message,
-                                "language": language
-                            }
-                        }
-                    )
-
-                    return {
-                        "agent_id": response.agent_id,
-                        "name": name,
-                        "status": "active",
-                        "metadata": {
-                            "voice_id": voice_id,
-                            "language": language,
-                            "prompt": prompt,
-                            "first_message": first_message
-                        }
-                    }
-                except Exception as api_error:
-                    print(f"ElevenLabs API error: {api_error}")
-                    # Fall back to mock if API fails
-                    pass
-
-            # Mock implementation for development/testing
-            mock_agent_id = f"agent_{secrets.token_urlsafe(16)}"
+        # Set default first message if not provided
+        if not first_message:
+            first_message = f"Hello! I'm {name}. How can I help you today?"
+
+        metadata = {
+            "voice_id": voice_id,
+            "language": language,
+            "prompt": prompt,
+            "first_message": first_message
+        }
+
+        if self.use_mock:
             return {
-                "agent_id": mock_agent_id,
+                "agent_id": f"agent_{secrets.token_urlsafe(16)}",
                 "name": name,
                 "status": "active",
-                "metadata": {
+                "metadata": {**metadata, "mock": True}
+            }
+
+        response = await self._request("create_agent", "POST", "/v1/convai/agents/create", idempotent=False, json={
+            "name": name,
+            "tags": ["vami-platform"],  # Tag for identification
+            "conversation_config": {
+                "tts": {
                     "voice_id": voice_id,
-                    "language": language,
-                    "prompt": prompt,
+                    "model_id": "eleven_turbo_v2_5"  # Fast, low-latency model
+                },
+                "agent": {
+                    "prompt": {
+                        "prompt": prompt
+                    },
                     "first_message": first_message,
-                    "mock": True
+                    "language": language
                 }
             }
+        })
 
-        except Exception as e:
-            raise Exception(f"Failed to create ElevenLabs agent: {str(e)}")
+        return {
+            "agent_id": response.json()["agent_id"],
+            "name": name,
+            "status": "active",
+            "metadata": metadata
+        }
 
     async def update_agent(self, agent_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -117,30 +250,16 @@ class ElevenLabsService:
 
         Args:
             agent_id: ElevenLabs agent ID
-            updates: Dictionary of fields to update (name, prompt, voice_id, etc.)
+            updates: Dictionary of fields to update (name, conversation_config, etc.)
 
         Returns:
             Updated agent information
         """
-        try:
-            if not self.use_mock and self.client:
-                try:
-                    # Update agent using ElevenLabs SDK
-                    # Note: Update API may require specific format
-                    response = self.client.conversational_ai.agents.update(
-                        agent_id=agent_id,
-                        **updates
-                    )
-                    return {"agent_id": agent_id, "status": "updated"}
-                except Exception as api_error:
-                    print(f"ElevenLabs API error: {api_error}")
-                    pass
-
-            # Mock response
+        if self.use_mock:
             return {"agent_id": agent_id, "status": "updated", "mock": True}
 
-        except Exception as e:
-            raise Exception(f"Failed to update agent: {str(e)}")
+        await self._request("update_agent", "PATCH", f"/v1/convai/agents/{agent_id}", idempotent=True, json=updates)
+        return {"agent_id": agent_id, "status": "updated"}
 
     async def delete_agent(self, agent_id: str) -> bool:
         """
@@ -152,20 +271,15 @@ class ElevenLabsService:
         Returns:
             True if successful
         """
-        try:
-            if not self.use_mock and self.client:
-                try:
-                    self.client.conversational_ai.agents.delete(agent_id=agent_id)
-                    return True
-                except Exception as api_error:
-                    print(f"ElevenLabs API error: {api_error}")
-                    pass
-
-            # Mock response
+        if self.use_mock:
             return True
 
-        except Exception as e:
-            raise Exception(f"Failed to delete agent: {str(e)}")
+        try:
+            await self._request("delete_agent", "DELETE", f"/v1/convai/agents/{agent_id}", idempotent=True)
+        except ElevenLabsError as e:
+            if e.status_code != 404:
+                raise
+        return True
 
     async def add_knowledge_base(
         self, agent_id: str, content: str, content_type: str = "text"
@@ -178,45 +292,119 @@ class ElevenLabsService:
         except Exception as e:
             raise Exception(f"Failed to add knowledge base: {str(e)}")
 
-    async def get_conversation(self, conversation_id: str) -> Dict[str, Any]:
-        """Get conversation details"""
+    # Calls
+    async def initiate_call(
+        self,
+        phone_number: str,
+        agent_id: str,
+        callback_url: Optional[str] = None,
+        agent_phone_number_id: Optional[str] = None,
+        dynamic_variables: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """
+        Start an outbound call from an agent through ElevenLabs' Twilio integration
+
+        Args:
+            phone_number: Number to call in E.164 format
+            agent_id: ElevenLabs agent ID
+            callback_url: Status webhook for this call. ElevenLabs delivers
+                call webhooks to the URL configured on the workspace, so this
+                is passed along as a dynamic variable for the agent only.
+            agent_phone_number_id: ElevenLabs phone number ID to call from
+                (default: ELEVENLABS_AGENT_PHONE_NUMBER_ID)
+            dynamic_variables: Values for the agent's prompt variables
+
+        Returns:
+            The ElevenLabs conversation ID, used as the call's external_call_id
+        """
+        if self.use_mock:
+            return f"conv_mock_{secrets.token_urlsafe(12)}"
+
+        variables = dict(dynamic_variables or {})
+        if callback_url:
+            variables.setdefault("callback_url", callback_url)
+
+        response = await self._request("initiate_call", "POST", "/v1/convai/twilio/outbound-call", idempotent=False, json={
+            "agent_id": agent_id,
+            "agent_phone_number_id": agent_phone_number_id or settings.ELEVENLABS_AGENT_PHONE_NUMBER_ID,
+            "to_number": phone_number,
+            "conversation_initiation_client_data": {"dynamic_variables": variables},
+        })
+
+        data = response.json()
+        if not data.get("success", True) or not data.get("conversation_id"):
+            raise ElevenLabsError(f"ElevenLabs could not start the call: {data.get('message', 'unknown error')}")
+        return data["conversation_id"]
+
+    async def end_call(self, conversation_id: str) -> bool:
+        """
+        Hang up an ongoing call
+
+        ElevenLabs has no hang-up endpoint for Twilio calls, so this looks up
+        the conversation's Twilio call SID and completes the call in Twilio.
+
+        Returns:
+            True if a live call was ended, False if it had already finished
+        """
+        if self.use_mock:
+            return True
+
+        conversation = await self.get_conversation(conversation_id)
+        call_sid = ((conversation.get("metadata") or {}).get("phone_call") or {}).get("call_sid")
+        if not call_sid:
+            return False
+
         try:
-            # response = self.client.conversations.get(conversation_id)
-            return {"conversation_id": conversation_id}
-        except Exception as e:
-            raise Exception(f"Failed to get conversation: {str(e)}")
+            response = await self._get_twilio_client().post(
+                f"/2010-04-01/Accounts/{settings.TWILIO_ACCOUNT_SID}/Calls/{call_sid}.json",
+                data={"Status": "completed"},
+            )
+        except httpx.TransportError as e:
+            raise ElevenLabsError(f"Failed to end call {call_sid}: {e}")
+
+        if response.status_code >= 400:
+            raise ElevenLabsError(f"Failed to end call {call_sid} ({response.status_code})", status_code=response.status_code)
+        return True
 
+    async def get_conversation(self, conversation_id: str) -> Dict[str, Any]:
+        """Get conversation details (status, transcript, metadata, analysis)"""
+        if self.use_mock:
+            return {"conversation_id": conversation_id, "mock": True}
+
+        response = await self._request(
+            "get_conversation", "GET", f"/v1/convai/conversations/{conversation_id}", idempotent=True
+        )
+        return response.json()
+
+    # Webhooks
     def verify_webhook_signature(self, payload: bytes, signature: str, timestamp: str) -> bool:
-        """Verify ElevenLabs webhook signature using HMAC and check timestamp"""
-        import hmac
-        import hashlib
-        from datetime import datetime, timedelta
+        """
+        Verify ElevenLabs webhook signature using HMAC and check timestamp
 
+        The HMAC is keyed once at startup; each call copies that state and
+        feeds it `timestamp.payload` piecewise, so the (possibly multi-MB)
+        body is never decoded or concatenated.
+        """
         # Verify timestamp is recent (within 5 minutes) to prevent replay attacks
         try:
-            webhook_time = datetime.fromtimestamp(int(timestamp))
-            current_time = datetime.utcnow()
-            time_diff = abs((current_time - webhook_time).total_seconds())
-
-            # Reject if timestamp is more than 5 minutes old
-            if time_diff > 300:  # 5 minutes
+            if abs(time.time() - int(timestamp)) > WEBHOOK_TOLERANCE_SECONDS:
                 return False
         except (ValueError, TypeError):
             # Invalid timestamp format
             return False
 
-        # Create the signed payload string
-        signed_payload = f"{timestamp}.{payload.decode('utf-8')}"
-
-        # Compute the expected signature
-        expected_signature = hmac.new(
-            settings.ELEVENLABS_WEBHOOK_SECRET.encode(),
-            signed_payload.encode(),
-            hashlib.sha256
-        ).hexdigest()
+        mac = self._webhook_mac.copy()
+        mac.update(timestamp.encode())
+        mac.update(b".")
+        mac.update(payload)
 
         # Compare signatures using constant-time comparison
-        return hmac.compare_digest(expected_signature, signature)
+        return hmac.compare_digest(mac.hexdigest(), signature)
+
+    @staticmethod
+    def parse_webhook_payload(payload: bytes) -> Dict[str, Any]:
+        """Parse a webhook body straight from bytes"""
+        return json_loads(payload)
 
 
 # Singleton instance
@@ -1,31 +1,39 @@
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail, Email, To, Content
-from typing import Optional
+"""
+Transactional email service
+
+Emails are rendered from pre-built templates and handed to a background
+dispatcher, so request handlers never wait on SendGrid. The dispatcher owns
+a bounded in-memory outbox, a pooled async HTTP client, and retries
+throttled or failed sends with exponential backoff.
+"""
+from dataclasses import dataclass, field
+from string import Template
+from typing import Optional, List, Dict, Any
 from app.config import settings
+from app.services.retry import RETRYABLE_STATUS_CODES, backoff_delay, retry_after_seconds
+import asyncio
 import html
+import logging
+import httpx
 
+logger = logging.getLogger(__name__)
 
-class EmailService:
-    def __init__(self):
-        self.client = SendGridAPIClient(settings.SENDGRID_API_KEY)
-        self.from_email = Email(settings.SENDGRID_FROM_EMAIL, settings.SENDGRID_FROM_NAME)
+SENDGRID_API_URL = "https://api.sendgrid.com"
+SENDGRID_SEND_PATH = "/v3/mail/send"
 
-    def _sanitize(self, text: str) -> str:
-        """Sanitize user input for HTML email templates"""
-        if not text:
-            return ""
-        return html.escape(str(text))
+# SendGrid accepts at most 1000 personalizations per request
+MAX_PERSONALIZATIONS = 1000
 
-    async def send_welcome_email(self, to_email: str, company_name: str, agent_id: str):
-        """Send welcome email to new user"""
-        company_name = self._sanitize(company_name)
-        agent_id = self._sanitize(agent_id)
-        subject = f"Welcome to {settings.APP_NAME}!"
 
-        html_content = f"""
+# Raw templates. `$frontend_url` / `$app_name` are filled in once at startup,
+# everything else is filled per message.
+EMAIL_TEMPLATES: Dict[str, Dict[str, str]] = {
+    "welcome": {
+        "subject": "Welcome to $app_name!",
+        "html": """
         <html>
             <body>
-                <h1>Welcome to Vami, {company_name}!</h1>
+                <h1>Welcome to Vami, $company_name!</h1>
                 <p>Your AI voice agent is now active and ready to handle calls 24/7.</p>
 
                 <h2>Next Steps:</h2>
@@ -36,10 +44,10 @@ class EmailService:
                     <li>Test your agent</li>
                 </ol>
 
-                <p>Your Agent ID: <strong>{agent_id}</strong></p>
+                <p>Your Agent ID: <strong>$agent_id</strong></p>
 
                 <p>
-                    <a href="{settings.FRONTEND_URL}/dashboard" style="background-color: #4CAF50; color: white; padding: 14px 20px; text-decoration: none; border-radius: 4px;">
+                    <a href="$frontend_url/dashboard" style="background-color: #4CAF50; color: white; padding: 14px 20px; text-decoration: none; border-radius: 4px;">
                         Go to Dashboard
                     </a>
                 </p>
@@ -49,79 +57,75 @@ class EmailService:
                 <p>Best regards,<br>The Vami Team</p>
             </body>
         </html>
-        """
-
-        await self._send_email(to_email, subject, html_content)
-
-    async def send_appointment_confirmation(
-        self,
-        to_email: str,
-        patient_name: str,
-        appointment_date: str,
-        appointment_time: str,
-        business_name: str
-    ):
-        """Send appointment confirmation email"""
-        patient_name = self._sanitize(patient_name)
-        appointment_date = self._sanitize(appointment_date)
-        appointment_time = self._sanitize(appointment_time)
-        business_name = self._sanitize(business_name)
-        subject = f"Appointment Confirmation - {business_name}"
-
-        html_content = f"""
+        """,
+    },
+    "appointment_confirmation": {
+        "subject": "Appointment Confirmation - $business_name",
+        "html": """
         <html>
             <body>
                 <h1>Appointment Confirmed</h1>
-                <p>Hello {patient_name},</p>
+                <p>Hello $patient_name,</p>
 
                 <p>Your appointment has been confirmed:</p>
 
                 <div style="background-color: #f5f5f5; padding: 20px; border-radius: 5px; margin: 20px 0;">
-                    <p><strong>Date:</strong> {appointment_date}</p>
-                    <p><strong>Time:</strong> {appointment_time}</p>
-                    <p><strong>Location:</strong> {business_name}</p>
+                    <p><strong>Date:</strong> $appointment_date</p>
+                    <p><strong>Time:</strong> $appointment_time</p>
+                    <p><strong>Location:</strong> $business_name</p>
                 </div>
 
                 <p>Please arrive 10 minutes early for check-in.</p>
 
                 <p>If you need to cancel or reschedule, please call us as soon as possible.</p>
 
-                <p>Best regards,<br>{business_name}</p>
+                <p>Best regards,<br>$business_name</p>
             </body>
         </html>
-        """
+        """,
+    },
+    "appointment_reminder": {
+        "subject": "Appointment Reminder - $business_name",
+        "html": """
+        <html>
+            <body>
+                <h1>Appointment Reminder</h1>
+                <p>Hello $patient_name,</p>
 
-        await self._send_email(to_email, subject, html_content)
+                <p>This is a reminder of your upcoming appointment:</p>
 
-    async def send_usage_alert(
-        self,
-        to_email: str,
-        company_name: str,
-        minutes_used: float,
-        minutes_limit: int,
-        percentage: float
-    ):
-        """Send usage alert when approaching limit"""
-        company_name = self._sanitize(company_name)
-        subject = f"Usage Alert: {percentage:.0f}% of Monthly Minutes Used"
+                <div style="background-color: #f5f5f5; padding: 20px; border-radius: 5px; margin: 20px 0;">
+                    <p><strong>Date:</strong> $appointment_date</p>
+                    <p><strong>Time:</strong> $appointment_time</p>
+                    <p><strong>Location:</strong> $business_name</p>
+                </div>
+
+                <p>If you need to cancel or reschedule, please call us as soon as possible.</p>
 
-        html_content = f"""
+                <p>Best regards,<br>$business_name</p>
+            </body>
+        </html>
+        """,
+    },
+    "usage_alert": {
+        "subject": "Usage Alert: $percentage_rounded% of Monthly Minutes Used",
+        "html": """
         <html>
             <body>
                 <h1>Usage Alert</h1>
-                <p>Hello {company_name},</p>
+                <p>Hello $company_name,</p>
 
-                <p>You've used {percentage:.0f}% of your monthly minute allowance:</p>
+                <p>You've used $percentage_rounded% of your monthly minute allowance:</p>
 
                 <div style="background-color: #fff3cd; padding: 20px; border-radius: 5px; margin: 20px 0; border-left: 4px solid #ffc107;">
-                    <p><strong>Minutes Used:</strong> {minutes_used:.1f} / {minutes_limit}</p>
-                    <p><strong>Percentage:</strong> {percentage:.1f}%</p>
+                    <p><strong>Minutes Used:</strong> $minutes_used / $minutes_limit</p>
+                    <p><strong>Percentage:</strong> $percentage%</p>
                 </div>
 
                 <p>Consider upgrading your plan to avoid service interruption.</p>
 
                 <p>
-                    <a href="{settings.FRONTEND_URL}/billing" style="background-color: #007bff; color: white; padding: 14px 20px; text-decoration: none; border-radius: 4px;">
+                    <a href="$frontend_url/billing" style="background-color: #007bff; color: white; padding: 14px 20px; text-decoration: none; border-radius: 4px;">
                         View Billing
                     </a>
                 </p>
@@ -129,27 +133,22 @@ class EmailService:
                 <p>Best regards,<br>The Vami Team</p>
             </body>
         </html>
-        """
-
-        await self._send_email(to_email, subject, html_content)
-
-    async def send_payment_failed_email(self, to_email: str, company_name: str):
-        """Send payment failed notification"""
-        company_name = self._sanitize(company_name)
-        subject = "Payment Failed - Action Required"
-
-        html_content = f"""
+        """,
+    },
+    "payment_failed": {
+        "subject": "Payment Failed - Action Required",
+        "html": """
         <html>
             <body>
                 <h1>Payment Failed</h1>
-                <p>Hello {company_name},</p>
+                <p>Hello $company_name,</p>
 
                 <p style="color: #d32f2f;">We were unable to process your recent payment.</p>
 
                 <p>Please update your payment method to avoid service interruption.</p>
 
                 <p>
-                    <a href="{settings.FRONTEND_URL}/billing" style="background-color: #d32f2f; color: white; padding: 14px 20px; text-decoration: none; border-radius: 4px;">
+                    <a href="$frontend_url/billing" style="background-color: #d32f2f; color: white; padding: 14px 20px; text-decoration: none; border-radius: 4px;">
                         Update Payment Method
                     </a>
                 </p>
@@ -159,26 +158,325 @@ class EmailService:
                 <p>Best regards,<br>The Vami Team</p>
             </body>
         </html>
-        """
+        """,
+    },
+}
+
+
+class PreparedTemplate:
+    """A template with its static parts (URLs, app name) already substituted"""
+
+    def __init__(self, subject: str, html_content: str, static_values: Dict[str, str]):
+        self.subject = Template(Template(subject).safe_substitute(static_values))
+        self.html = Template(Template(html_content).safe_substitute(static_values))
+
+    def render(self, values: Dict[str, str]) -> tuple:
+        """Render subject and body for a single recipient"""
+        return self.subject.substitute(values), self.html.substitute(values)
+
+    def render_for_batch(self, keys: List[str]) -> tuple:
+        """Render subject and body with SendGrid substitution tags (-key-) for each per-recipient field"""
+        tags = {key: f"-{key}-" for key in keys}
+        return self.subject.substitute(tags), self.html.substitute(tags)
+
+
+@dataclass
+class EmailMessage:
+    """A queued SendGrid send: one subject/body shared by one or more personalizations"""
+    subject: str
+    html_content: str
+    personalizations: List[Dict[str, Any]]
+    attempts: int = field(default=0)
+
+    def to_payload(self, from_email: Dict[str, str]) -> Dict[str, Any]:
+        return {
+            "personalizations": self.personalizations,
+            "from": from_email,
+            "subject": self.subject,
+            "content": [{"type": "text/html", "value": self.html_content}],
+        }
+
+
+class EmailDispatcher:
+    """
+    Background sender for queued emails
+
+    Messages go into a bounded queue and are delivered by a small pool of
+    worker tasks sharing one keep-alive HTTP client.
+    """
 
-        await self._send_email(to_email, subject, html_content)
+    def __init__(
+        self,
+        api_key: str,
+        from_email: Dict[str, str],
+        max_queue_size: int = 10000,
+        concurrency: int = 4,
+        max_retries: int = 5,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.api_key = api_key
+        self.from_email = from_email
+        self.max_queue_size = max_queue_size
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.transport = transport
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._workers: List[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def _ensure_started(self):
+        """Create the queue, HTTP client and workers on the running event loop"""
+        if self.running:
+            return
+
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._client = httpx.AsyncClient(
+            base_url=SENDGRID_API_URL,
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=self.concurrency,
+                max_keepalive_connections=self.concurrency,
+            ),
+            transport=self.transport,
+        )
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"email-dispatcher-{i}")
+            for i in range(self.concurrency)
+        ]
+
+    async def start(self):
+        """Start worker tasks (also done lazily on first enqueue)"""
+        self._ensure_started()
+
+    async def stop(self, timeout: float = 10.0):
+        """Drain the outbox (up to `timeout` seconds) and release the HTTP pool"""
+        if not self.running:
+            return
 
-    async def _send_email(self, to_email: str, subject: str, html_content: str):
-        """Internal method to send email"""
         try:
-            message = Mail(
-                from_email=self.from_email,
-                to_emails=To(to_email),
-                subject=subject,
-                html_content=Content("text/html", html_content)
-            )
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Email outbox not drained on shutdown, {self._queue.qsize()} messages dropped")
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
 
-            response = self.client.send(message)
-            return response.status_code == 202
-        except Exception as e:
-            print(f"Failed to send email: {str(e)}")
+        await self._client.aclose()
+        self._client = None
+
+    def enqueue(self, message: EmailMessage) -> bool:
+        """Queue a message without waiting. Returns False if the outbox is full."""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            logger.error(f"Email outbox full, dropping message: {message.subject}")
             return False
 
+    async def _worker(self):
+        while True:
+            message = await self._queue.get()
+            try:
+                await self._deliver(message)
+            except Exception as e:
+                logger.error(f"Unexpected error sending email: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, message: EmailMessage) -> bool:
+        """Send one message, retrying transient failures with backoff"""
+        payload = message.to_payload(self.from_email)
+
+        while True:
+            retry_delay = backoff_delay(message.attempts)
+            try:
+                response = await self._client.post(SENDGRID_SEND_PATH, json=payload)
+                if response.status_code == 202:
+                    return True
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    logger.error(f"Failed to send email ({response.status_code}): {response.text}")
+                    return False
+                retry_delay = retry_after_seconds(response.headers, retry_delay)
+                error = f"HTTP {response.status_code}"
+            except httpx.TransportError as e:
+                error = str(e)
+
+            message.attempts += 1
+            if message.attempts > self.max_retries:
+                logger.error(f"Giving up on email after {message.attempts} attempts: {error}")
+                return False
+
+            await asyncio.sleep(retry_delay)
+
+
+class EmailService:
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.from_email = {"email": settings.SENDGRID_FROM_EMAIL, "name": settings.SENDGRID_FROM_NAME}
+        self.dispatcher = EmailDispatcher(
+            api_key=settings.SENDGRID_API_KEY,
+            from_email=self.from_email,
+            max_queue_size=settings.EMAIL_QUEUE_MAX_SIZE,
+            concurrency=settings.EMAIL_WORKER_CONCURRENCY,
+            max_retries=settings.EMAIL_MAX_RETRIES,
+            transport=transport,
+        )
+
+        # Pre-render the static parts of every template once
+        static_values = {"frontend_url": settings.FRONTEND_URL, "app_name": settings.APP_NAME}
+        self.templates = {
+            name: PreparedTemplate(template["subject"], template["html"], static_values)
+            for name, template in EMAIL_TEMPLATES.items()
+        }
+
+    def _sanitize(self, text: str) -> str:
+        """Sanitize user input for HTML email templates"""
+        if not text:
+            return ""
+        return html.escape(str(text))
+
+    async def start(self):
+        await self.dispatcher.start()
+
+    async def stop(self):
+        await self.dispatcher.stop()
+
+    async def send_welcome_email(self, to_email: str, company_name: str, agent_id: str):
+        """Send welcome email to new user"""
+        return self._send_template(to_email, "welcome", {
+            "company_name": self._sanitize(company_name),
+            "agent_id": self._sanitize(agent_id),
+        })
+
+    async def send_appointment_confirmation(
+        self,
+        to_email: str,
+        patient_name: str,
+        appointment_date: str,
+        appointment_time: str,
+        business_name: str
+    ):
+        """Send appointment confirmation email"""
+        return self._send_template(to_email, "appointment_confirmation", {
+            "patient_name": self._sanitize(patient_name),
+            "appointment_date": self._sanitize(appointment_date),
+            "appointment_time": self._sanitize(appointment_time),
+            "business_name": self._sanitize(business_name),
+        })
+
+    async def send_appointment_reminder(
+        self,
+        to_email: str,
+        patient_name: str,
+        appointment_date: str,
+        appointment_time: str,
+        business_name: str
+    ):
+        """Send appointment reminder email"""
+        return self._send_template(to_email, "appointment_reminder", {
+            "patient_name": self._sanitize(patient_name),
+            "appointment_date": self._sanitize(appointment_date),
+            "appointment_time": self._sanitize(appointment_time),
+            "business_name": self._sanitize(business_name),
+        })
+
+    async def send_usage_alert(
+        self,
+        to_email: str,
+        company_name: str,
+        minutes_used: float,
+        minutes_limit: int,
+        percentage: float
+    ):
+        """Send usage alert when approaching limit"""
+        return self._send_template(
+            to_email,
+            "usage_alert",
+            self._usage_alert_values(company_name, minutes_used, minutes_limit, percentage)
+        )
+
+    async def send_usage_alerts(self, alerts: List[Dict[str, Any]]) -> bool:
+        """
+        Send many usage alerts as batched SendGrid requests
+
+        Args:
+            alerts: Dicts with to_email, company_name, minutes_used, minutes_limit and percentage
+
+        Returns:
+            True if every batch was queued
+        """
+        personalizations = [
+            {
+                "to": [{"email": alert["to_email"]}],
+                "substitutions": {
+                    f"-{key}-": value
+                    for key, value in self._usage_alert_values(
+                        alert["company_name"],
+                        alert["minutes_used"],
+                        alert["minutes_limit"],
+                        alert["percentage"],
+                    ).items()
+                },
+            }
+            for alert in alerts
+        ]
+        return self._send_batch("usage_alert", personalizations)
+
+    async def send_payment_failed_email(self, to_email: str, company_name: str):
+        """Send payment failed notification"""
+        return self._send_template(to_email, "payment_failed", {
+            "company_name": self._sanitize(company_name),
+        })
+
+    def _usage_alert_values(
+        self, company_name: str, minutes_used: float, minutes_limit: int, percentage: float
+    ) -> Dict[str, str]:
+        return {
+            "company_name": self._sanitize(company_name),
+            "minutes_used": f"{minutes_used:.1f}",
+            "minutes_limit": str(minutes_limit),
+            "percentage": f"{percentage:.1f}",
+            "percentage_rounded": f"{percentage:.0f}",
+        }
+
+    def _send_template(self, to_email: str, template_name: str, values: Dict[str, str]) -> bool:
+        """Render a prepared template for one recipient and queue it"""
+        subject, html_content = self.templates[template_name].render(values)
+        return self._send_email(to_email, subject, html_content)
+
+    def _send_batch(self, template_name: str, personalizations: List[Dict[str, Any]]) -> bool:
+        """Queue one request per MAX_PERSONALIZATIONS recipients using substitution tags"""
+        if not personalizations:
+            return True
+
+        keys = [tag.strip("-") for tag in personalizations[0]["substitutions"]]
+        subject, html_content = self.templates[template_name].render_for_batch(keys)
+
+        queued = True
+        for i in range(0, len(personalizations), MAX_PERSONALIZATIONS):
+            queued &= self.dispatcher.enqueue(EmailMessage(
+                subject=subject,
+                html_content=html_content,
+                personalizations=personalizations[i:i + MAX_PERSONALIZATIONS],
+            ))
+        return queued
+
+    def _send_email(self, to_email: str, subject: str, html_content: str) -> bool:
+        """Internal method to queue an email for background delivery"""
+        return self.dispatcher.enqueue(EmailMessage(
+            subject=subject,
+            html_content=html_content,
+            personalizations=[{"to": [{"email": to_email}]}],
+        ))
+
 
 # Singleton instance
 email_service = EmailService()
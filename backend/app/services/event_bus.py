@@ -0,0 +1,285 @@
+"""
+Per-tenant event bus for live dashboard updates
+
+Call state transitions and new conversations are published here by the
+code paths that cause them (call creation, the scheduler, provider
+webhooks) and streamed to open dashboards by GET /calls/stream, which
+replaces polling /calls.
+
+Events are published to a topic (the tenant's user ID) and go through a
+backend:
+- "local": in-process only, enough for a single API worker
+- "postgres": LISTEN/NOTIFY on DATABASE_URL, so an event published by any
+  worker or process reaches subscribers on all of them
+
+Each event is encoded once no matter how many subscribers receive it, and
+each subscriber has a small bounded queue; a subscriber that falls behind
+loses its oldest events instead of slowing publishers down.
+"""
+from typing import Optional, Dict, Any, Set, Tuple, Callable
+from collections import defaultdict
+from app.config import settings
+import asyncio
+import logging
+
+try:
+    from orjson import dumps as json_dumps, loads as json_loads
+except ImportError:
+    import json
+
+    def json_dumps(value) -> bytes:
+        return json.dumps(value, separators=(",", ":")).encode()
+
+    json_loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+# pg_notify payloads are limited to 8000 bytes
+MAX_NOTIFY_BYTES = 7900
+
+# Backoff between attempts to re-establish a dropped LISTEN connection
+RECONNECT_MIN_SECONDS = 1.0
+RECONNECT_MAX_SECONDS = 30.0
+
+
+class Subscription:
+    """A subscriber's queue of (event type, encoded event) pairs"""
+
+    def __init__(self, bus: "EventBus", topic: str, max_queue: int):
+        self.bus = bus
+        self.topic = topic
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def put(self, item: Tuple[str, bytes]):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(item)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Tuple[str, bytes]]:
+        """Next event, or None if nothing arrived within `timeout` seconds"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class LocalBackend:
+    """Delivers events to this process's subscribers only"""
+
+    def __init__(self):
+        self._dispatch: Optional[Callable[[str, bytes], None]] = None
+
+    async def start(self, dispatch: Callable[[str, bytes], None]):
+        self._dispatch = dispatch
+
+    async def stop(self):
+        pass
+
+    async def publish(self, topic: str, payload: bytes):
+        if self._dispatch:
+            self._dispatch(topic, payload)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "local", "connected": True}
+
+
+class PostgresBackend:
+    """
+    Postgres LISTEN/NOTIFY fan-out between workers
+
+    Notifications are read on the event loop from a dedicated autocommit
+    psycopg2 connection (loop.add_reader); publishing runs pg_notify() in a
+    thread on a second connection. Every process, including the publisher,
+    receives events through LISTEN.
+
+    If the LISTEN connection drops, it is closed and re-established in the
+    background with exponential backoff; events published in the meantime
+    don't reach this process's subscribers.
+    """
+
+    def __init__(self, dsn: str, channel: str = "vami_events"):
+        self.dsn = dsn
+        self.channel = channel
+        self._listen_conn = None
+        self._notify_conn = None
+        self._notify_lock = asyncio.Lock()
+        self._dispatch: Optional[Callable[[str, bytes], None]] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self.reconnects = 0
+
+    @property
+    def connected(self) -> bool:
+        return self._listen_conn is not None
+
+    def _connect(self):
+        import psycopg2
+
+        conn = psycopg2.connect(self.dsn)
+        conn.autocommit = True
+        return conn
+
+    async def start(self, dispatch: Callable[[str, bytes], None]):
+        self._dispatch = dispatch
+        self._loop = asyncio.get_running_loop()
+        await self._listen()
+
+    async def stop(self):
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            try:
+                await self._reconnect_task
+            except asyncio.CancelledError:
+                pass
+            self._reconnect_task = None
+        self._close_listener()
+        if self._notify_conn is not None:
+            self._notify_conn.close()
+            self._notify_conn = None
+
+    def _listen_on(self):
+        conn = self._connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {self.channel}")
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    async def _listen(self):
+        self._listen_conn = await asyncio.to_thread(self._listen_on)
+        self._loop.add_reader(self._listen_conn.fileno(), self._on_readable)
+
+    def _close_listener(self):
+        conn, self._listen_conn = self._listen_conn, None
+        if conn is None:
+            return
+        try:
+            self._loop.remove_reader(conn.fileno())
+        except Exception:
+            # The socket is already gone
+            pass
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    async def _reconnect(self):
+        delay = RECONNECT_MIN_SECONDS
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self._listen()
+            except Exception as e:
+                delay = min(delay * 2, RECONNECT_MAX_SECONDS)
+                logger.error(f"Event bus LISTEN reconnect failed, retrying in {delay:.0f}s: {e}")
+                continue
+            self.reconnects += 1
+            self._reconnect_task = None
+            logger.info("Event bus LISTEN connection re-established")
+            return
+
+    def _on_readable(self):
+        try:
+            self._listen_conn.poll()
+        except Exception as e:
+            # Stop watching the dead socket (it stays readable) and reconnect
+            logger.error(f"Event bus LISTEN connection failed, reconnecting: {e}")
+            self._close_listener()
+            if self._reconnect_task is None:
+                self._reconnect_task = asyncio.create_task(self._reconnect(), name="event-bus-reconnect")
+            return
+        while self._listen_conn.notifies:
+            notify = self._listen_conn.notifies.pop(0)
+            topic, _, payload = notify.payload.partition(" ")
+            self._dispatch(topic, payload.encode())
+
+    def _notify(self, message: str):
+        if self._notify_conn is None or self._notify_conn.closed:
+            self._notify_conn = self._connect()
+        with self._notify_conn.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", (self.channel, message))
+
+    async def publish(self, topic: str, payload: bytes):
+        message = f"{topic} {payload.decode()}"
+        if len(message.encode()) > MAX_NOTIFY_BYTES:
+            logger.warning(f"Event for {topic} too large for NOTIFY ({len(message)} bytes), dropped")
+            return
+        async with self._notify_lock:
+            await asyncio.to_thread(self._notify, message)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "postgres", "connected": self.connected, "reconnects": self.reconnects}
+
+
+class EventBus:
+    def __init__(self, backend=None, max_queue: int = 100):
+        self.backend = backend or LocalBackend()
+        self.max_queue = max_queue
+        self._subscribers: Dict[str, Set[Subscription]] = defaultdict(set)
+        self._started = False
+
+    async def start(self):
+        if not self._started:
+            await self.backend.start(self._dispatch)
+            self._started = True
+
+    async def stop(self):
+        if self._started:
+            await self.backend.stop()
+            self._started = False
+
+    # Subscribing
+    def subscribe(self, topic: str) -> Subscription:
+        subscription = Subscription(self, topic, self.max_queue)
+        self._subscribers[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.topic)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.topic]
+
+    def _dispatch(self, topic: str, payload: bytes):
+        subscribers = self._subscribers.get(topic)
+        if not subscribers:
+            return
+        event_type = json_loads(payload).get("type", "message")
+        for subscription in subscribers:
+            subscription.put((event_type, payload))
+
+    # Publishing
+    async def publish(self, topic: str, event: Dict[str, Any]):
+        """Publish an event ({"type": ..., ...}) to a tenant's subscribers; never raises"""
+        try:
+            await self.backend.publish(topic, json_dumps(event))
+        except Exception as e:
+            logger.error(f"Failed to publish {event.get('type')} event for {topic}: {e}")
+
+    async def publish_call_status(self, user_id: str, call_id: str, status: str, **fields):
+        await self.publish(user_id, {"type": "call.status", "call_id": call_id, "status": status, **fields})
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "topics": len(self._subscribers),
+            "subscribers": sum(len(s) for s in self._subscribers.values()),
+            **self.backend.stats(),
+        }
+
+
+def create_backend():
+    if settings.EVENT_BUS_BACKEND == "postgres":
+        return PostgresBackend(settings.DATABASE_URL)
+    return LocalBackend()
+
+
+# Singleton instance
+event_bus = EventBus(backend=create_backend(), max_queue=settings.EVENT_STREAM_QUEUE_SIZE)
@@ -0,0 +1,111 @@
+"""
+Webhook idempotency store
+
+Providers redeliver webhooks whenever they don't get a timely 2xx, so the same
+event can arrive several times, sometimes concurrently. Handlers claim an
+event key before doing any work:
+
+- completed keys are remembered in a bounded in-process LRU, so most replays
+  are rejected in O(1) without touching the database
+- otherwise the claim_event() database function decides, backed by the
+  processed_events primary key, so only one worker processes an event
+- a claim is completed on success and released on failure (so the provider's
+  retry can process it); a claim abandoned by a crashed worker expires after
+  the lease
+- a replay that arrives while another worker still holds the claim is told
+  apart from one of a completed event, so the handler can answer it with a
+  non-2xx: if that worker fails and releases the claim, the provider retries
+  instead of treating the event as delivered
+
+Rows are deleted once past the providers' redelivery window by
+cleanup_processed_events() (migrations/009_webhook_idempotency.sql).
+"""
+from typing import Optional
+from collections import OrderedDict
+from datetime import datetime
+from enum import Enum
+from app.config import settings
+from app.database import get_supabase, execute_async
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Claim(str, Enum):
+    CLAIMED = "claimed"          # process it
+    COMPLETED = "completed"      # already processed
+    IN_PROGRESS = "in_progress"  # another worker is processing it
+
+
+class IdempotencyStore:
+    def __init__(self, max_entries: int = 10000, lease_seconds: int = 300):
+        self.max_entries = max_entries
+        self.lease_seconds = lease_seconds
+        self.db = get_supabase()
+        self._completed: OrderedDict = OrderedDict()
+
+    def _remember(self, key: tuple):
+        self._completed[key] = None
+        self._completed.move_to_end(key)
+        if len(self._completed) > self.max_entries:
+            self._completed.popitem(last=False)
+
+    def is_completed(self, source: str, event_id: str) -> bool:
+        """In-memory check only"""
+        key = (source, event_id)
+        if key in self._completed:
+            self._completed.move_to_end(key)
+            return True
+        return False
+
+    async def claim(self, source: str, event_id: Optional[str]) -> Claim:
+        """
+        Claim an event for processing
+
+        Only Claim.CLAIMED means the caller should process it. Events without
+        an id can't be deduplicated and are always processed.
+        """
+        if not event_id:
+            return Claim.CLAIMED
+        if self.is_completed(source, event_id):
+            return Claim.COMPLETED
+
+        result = await execute_async(self.db.rpc("claim_event", {
+            "p_source": source,
+            "p_event_id": event_id,
+            "p_lease_seconds": self.lease_seconds,
+        }))
+        claim = Claim(result.data)
+        if claim == Claim.COMPLETED:
+            self._remember((source, event_id))
+        return claim
+
+    async def complete(self, source: str, event_id: Optional[str]):
+        if not event_id:
+            return
+        await execute_async(
+            self.db.table("processed_events").update({
+                "completed_at": datetime.utcnow().isoformat()
+            }).eq("source", source).eq("event_id", event_id)
+        )
+        self._remember((source, event_id))
+
+    async def release(self, source: str, event_id: Optional[str]):
+        """Give up a claim after a failure so a redelivery can process the event"""
+        if not event_id:
+            return
+        try:
+            await execute_async(
+                self.db.table("processed_events").delete()
+                .eq("source", source).eq("event_id", event_id).is_("completed_at", "null")
+            )
+        except Exception as e:
+            # The claim expires after the lease anyway
+            logger.error(f"Failed to release {source} event {event_id}: {e}")
+
+
+# Singleton instance
+idempotency_store = IdempotencyStore(
+    max_entries=settings.IDEMPOTENCY_CACHE_SIZE,
+    lease_seconds=settings.IDEMPOTENCY_LEASE_SECONDS,
+)
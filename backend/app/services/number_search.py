@@ -0,0 +1,150 @@
+"""
+Available phone number search cache
+
+Onboarding searches Twilio's marketplace as the customer types, so the same
+(country, area code) query arrives many times within seconds, often
+concurrently. This layer sits in front of the blocking Twilio search:
+
+- results are cached for a short TTL, keyed by (country, area_code, limit)
+- concurrent identical searches share one upstream call (single-flight)
+- the most searched keys, plus any configured area codes, are refreshed in
+  the background shortly before they expire so popular searches stay warm
+"""
+from typing import Optional, List, Dict, Any, Tuple, Callable, Awaitable
+from collections import Counter
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+SearchKey = Tuple[str, Optional[str], int]
+
+
+class NumberSearchCache:
+    def __init__(
+        self,
+        fetch: Callable[[str, Optional[str], int], Awaitable[List[Dict[str, Any]]]],
+        ttl_seconds: float = 30,
+        prefetch_top_n: int = 10,
+        prefetch_area_codes: Optional[List[str]] = None,
+        prefetch_country: str = "US",
+        prefetch_limit: int = 20,
+    ):
+        self.fetch = fetch
+        self.ttl_seconds = ttl_seconds
+        self.prefetch_top_n = prefetch_top_n
+        self.prefetch_keys: List[SearchKey] = [
+            (prefetch_country, code, prefetch_limit) for code in (prefetch_area_codes or [])
+        ]
+
+        # key -> (expires_at, results)
+        self._entries: Dict[SearchKey, Tuple[float, List[Dict[str, Any]]]] = {}
+        self._in_flight: Dict[SearchKey, asyncio.Task] = {}
+        self._popularity: Counter = Counter()
+        self._task: Optional[asyncio.Task] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    # Lifecycle
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._prefetch_loop(), name="number-search-prefetch")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for task in list(self._in_flight.values()):
+            task.cancel()
+
+    # Lookups
+    async def search(self, country: str, area_code: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        key = (country.upper(), area_code or None, limit)
+        self._popularity[key] += 1
+
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+
+        if key in self._in_flight:
+            self.coalesced += 1
+            return await asyncio.shield(self._in_flight[key])
+
+        self.misses += 1
+        return await self._load(key)
+
+    async def _load(self, key: SearchKey) -> List[Dict[str, Any]]:
+        """
+        Fetch a key upstream; concurrent callers for the same key wait on the same task
+
+        The fetch runs in a task of its own, so the caller that started it
+        being cancelled (e.g. its client disconnected) doesn't cancel it, or
+        leave the callers coalesced onto it waiting forever.
+        """
+        task = asyncio.create_task(self.fetch(*key), name=f"number-search-{key[0]}-{key[1]}")
+        self._in_flight[key] = task
+        task.add_done_callback(lambda done: self._loaded(key, done))
+        return await asyncio.shield(task)
+
+    def _loaded(self, key: SearchKey, task: asyncio.Task):
+        # Runs before the waiters resume, so they find the cache entry
+        self._in_flight.pop(key, None)
+        if task.cancelled():
+            return
+        # Retrieving the exception also keeps an unawaited failure quiet
+        if task.exception() is None:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, task.result())
+
+    def discard_number(self, phone_number: str):
+        """Drop a number that was just purchased from every cached result"""
+        for key, (expires_at, results) in list(self._entries.items()):
+            if any(num["phone_number"] == phone_number for num in results):
+                self._entries[key] = (
+                    expires_at,
+                    [num for num in results if num["phone_number"] != phone_number],
+                )
+
+    # Prefetching
+    async def _prefetch_loop(self):
+        # Refresh shortly before expiry so popular keys never go cold
+        interval = max(1.0, self.ttl_seconds * 0.8)
+        while True:
+            try:
+                await self.prefetch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Number search prefetch failed: {e}")
+            await asyncio.sleep(interval)
+
+    async def prefetch(self):
+        now = time.monotonic()
+        for key in [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]:
+            del self._entries[key]
+
+        keys = list(dict.fromkeys(
+            self.prefetch_keys + [key for key, _ in self._popularity.most_common(self.prefetch_top_n)]
+        ))
+        # Decay so yesterday's popular searches eventually stop being refreshed
+        self._popularity = Counter({key: count // 2 for key, count in self._popularity.items() if count > 1})
+
+        results = await asyncio.gather(
+            *(self._load(key) for key in keys if key not in self._in_flight),
+            return_exceptions=True,
+        )
+        failed = [r for r in results if isinstance(r, Exception)]
+        if failed:
+            logger.warning(f"{len(failed)} of {len(results)} number search prefetches failed: {failed[0]}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+        }
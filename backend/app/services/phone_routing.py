@@ -0,0 +1,153 @@
+"""
+Inbound call routing table
+
+Keeps an in-memory phone number -> agent map so inbound calls resolve their
+agent with a dict lookup instead of a database query. The map is warmed at
+startup and updated in place when this worker assigns, provisions or
+releases a number. Other workers' changes are picked up through a version
+stamp (routing_versions.phone_routing) that database triggers bump whenever
+agent routing data changes; each worker polls that single row and reloads
+when it moves.
+
+Only the routing columns (ROUTING_COLUMNS) are cached, and the trigger fires
+on exactly those, so a cached route is never staler than the refresh
+interval. Anything else about the agent or its owner has to be read from
+the database by the caller.
+"""
+from typing import Optional, Dict, Any
+from app.database import execute_async
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+ROUTING_VERSION_KEY = "phone_routing"
+# Keep in sync with the agents trigger in migrations/007_phone_routing_version.sql
+ROUTING_COLUMNS = "agent_id, user_id, phone_number, phone_number_status, status"
+PAGE_SIZE = 1000
+
+
+class PhoneRoutingTable:
+    def __init__(self, db, refresh_interval_seconds: float = 5):
+        self.db = db
+        self.refresh_interval_seconds = refresh_interval_seconds
+
+        self.routes: Dict[str, Dict[str, Any]] = {}
+        self.version: Optional[int] = None
+        self.warmed = False
+        self._task: Optional[asyncio.Task] = None
+
+    # Lookups
+    def lookup(self, phone_number: str) -> Optional[Dict[str, Any]]:
+        """O(1) route lookup, no database access"""
+        return self.routes.get(phone_number)
+
+    async def resolve(self, phone_number: str) -> Optional[Dict[str, Any]]:
+        """lookup(), falling back to the database for numbers the table doesn't have yet"""
+        route = self.lookup(phone_number)
+        if route:
+            return route
+
+        # Miss: the table is not warmed yet, or another worker assigned the
+        # number since our last version check
+        result = await execute_async(
+            self.db.table("agents").select(ROUTING_COLUMNS)
+            .eq("phone_number", phone_number)
+            .eq("status", "active")
+            .limit(1)
+        )
+        if not result.data:
+            return None
+        route = result.data[0]
+        if route.get("phone_number_status") == "active":
+            self.routes[phone_number] = route
+        return route
+
+    # Lifecycle
+    async def start(self):
+        """Warm the table and keep it in sync with other workers"""
+        try:
+            await self.warm()
+        except Exception as e:
+            logger.error(f"Failed to warm phone routing table: {e}")
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop(), name="phone-routing-refresh")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval_seconds)
+            try:
+                await self.refresh_if_stale()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Phone routing refresh failed: {e}")
+
+    # Loading
+    async def _read_version(self) -> int:
+        result = await execute_async(
+            self.db.table("routing_versions").select("version").eq("name", ROUTING_VERSION_KEY)
+        )
+        return result.data[0]["version"] if result.data else 0
+
+    async def refresh_if_stale(self) -> bool:
+        """Reload the table if another worker changed routing. Returns True if reloaded."""
+        if await self._read_version() == self.version:
+            return False
+        await self.warm()
+        return True
+
+    async def warm(self):
+        """Load every active routed agent"""
+        # Read the version first: a change made during the load bumps it again,
+        # so the next refresh reloads rather than missing it
+        version = await self._read_version()
+
+        routes: Dict[str, Dict[str, Any]] = {}
+        offset = 0
+        while True:
+            result = await execute_async(
+                self.db.table("agents").select(ROUTING_COLUMNS)
+                .eq("status", "active")
+                .eq("phone_number_status", "active")
+                .not_.is_("phone_number", "null")
+                .order("id")
+                .range(offset, offset + PAGE_SIZE - 1)
+            )
+            for agent in result.data:
+                routes[agent["phone_number"]] = agent
+            if len(result.data) < PAGE_SIZE:
+                break
+            offset += PAGE_SIZE
+
+        self.routes = routes
+        self.version = version
+        self.warmed = True
+        logger.info(f"Phone routing table loaded: {len(routes)} numbers (version {version})")
+
+    # Local updates
+    def remove_agent(self, agent_id: str):
+        """Drop every route pointing at an agent"""
+        for phone_number in [p for p, agent in self.routes.items() if agent.get("agent_id") == agent_id]:
+            del self.routes[phone_number]
+
+    async def reload_agent(self, agent_id: str):
+        """Re-read one agent's routing after this worker changed it"""
+        result = await execute_async(
+            self.db.table("agents").select(ROUTING_COLUMNS).eq("agent_id", agent_id)
+        )
+        self.remove_agent(agent_id)
+        for agent in result.data:
+            if agent.get("phone_number") and agent.get("status") == "active" \
+                    and agent.get("phone_number_status") == "active":
+                self.routes[agent["phone_number"]] = agent
+
+    def stats(self) -> Dict[str, Any]:
+        return {"numbers": len(self.routes), "version": self.version, "warmed": self.warmed}
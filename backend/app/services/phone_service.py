@@ -6,23 +6,36 @@ Each user/agent gets their own dedicated phone number.
 """
 
 from typing import Optional, Dict, Any
-from twilio.rest import Client
+from datetime import datetime
 from twilio.base.exceptions import TwilioRestException
 from app.config import settings
-from app.database import get_supabase
+from app.database import get_supabase, execute_async
+from app.services.registry import twilio_client
+from app.services.phone_routing import PhoneRoutingTable
+from app.services.number_search import NumberSearchCache
+from app.workers.twilio_inventory import twilio_inventory_sync
+import asyncio
 import logging
+import re
 
 logger = logging.getLogger(__name__)
 
 
 class PhoneService:
     def __init__(self):
-        """Initialize Twilio client"""
-        self.client = Client(
-            settings.TWILIO_ACCOUNT_SID,
-            settings.TWILIO_AUTH_TOKEN
-        )
+        # Shared with the inventory sync; built on first Twilio call
+        self.client = twilio_client
         self.db = get_supabase()
+        self.routing = PhoneRoutingTable(
+            self.db,
+            refresh_interval_seconds=settings.PHONE_ROUTING_REFRESH_SECONDS
+        )
+        self.search_cache = NumberSearchCache(
+            self._search_available_numbers,
+            ttl_seconds=settings.PHONE_SEARCH_CACHE_TTL_SECONDS,
+            prefetch_top_n=settings.PHONE_SEARCH_PREFETCH_TOP_N,
+            prefetch_area_codes=settings.phone_search_prefetch_area_codes_list
+        )
 
     async def list_available_numbers(
         self,
@@ -41,12 +54,25 @@ class PhoneService:
         Returns:
             List of available phone numbers with details
         """
+        return await self.search_cache.search(country, area_code, limit)
+
+    async def _search_available_numbers(
+        self,
+        country: str,
+        area_code: Optional[str],
+        limit: int
+    ) -> list[Dict[str, Any]]:
+        """Uncached Twilio marketplace search, run off the event loop"""
+        return await asyncio.to_thread(self._search_available_numbers_sync, country, area_code, limit)
+
+    def _search_available_numbers_sync(
+        self,
+        country: str,
+        area_code: Optional[str],
+        limit: int
+    ) -> list[Dict[str, Any]]:
         try:
-            search_params = {
-                "country": country,
-                "voice_enabled": True,
-                "capabilities": {"voice": True}
-            }
+            search_params = {"voice_enabled": True}
 
             if area_code:
                 search_params["area_code"] = area_code
@@ -79,37 +105,44 @@ class PhoneService:
             logger.error(f"Twilio error listing numbers: {e}")
             raise Exception(f"Failed to list available numbers: {str(e)}")
 
-    async def list_owned_numbers(self) -> list[Dict[str, Any]]:
+    async def list_owned_numbers(
+        self,
+        page: int = 1,
+        per_page: int = 50,
+        is_assigned: Optional[bool] = None,
+        search: Optional[str] = None
+    ) -> tuple[list[Dict[str, Any]], int]:
         """
-        List all phone numbers already owned in Twilio account
+        List phone numbers owned in the Twilio account with assignment status
+
+        Served from the twilio_inventory mirror kept current by the inventory
+        sync worker, not from Twilio directly.
+
+        Args:
+            page: 1-based page number
+            per_page: Numbers per page
+            is_assigned: Only assigned (True) or unassigned (False) numbers
+            search: Substring of the phone number or friendly name
 
         Returns:
-            List of owned phone numbers with assignment status
+            (numbers, total matching count)
         """
         try:
-            # Get all incoming phone numbers from Twilio
-            incoming_numbers = self.client.incoming_phone_numbers.list()
-
-            # Get assigned numbers from database
-            assigned_result = self.db.table("phone_numbers").select("phone_number, user_id, agent_id, status").execute()
-            assigned_map = {row["phone_number"]: row for row in assigned_result.data}
-
-            numbers_list = []
-            for num in incoming_numbers:
-                phone_number = num.phone_number
-                assigned_info = assigned_map.get(phone_number)
-
-                numbers_list.append({
-                    "phone_number": phone_number,
-                    "phone_number_sid": num.sid,
-                    "friendly_name": num.friendly_name,
-                    "is_assigned": phone_number in assigned_map,
-                    "assigned_to_user": assigned_info["user_id"] if assigned_info else None,
-                    "assigned_to_agent": assigned_info["agent_id"] if assigned_info else None,
-                    "status": assigned_info["status"] if assigned_info else "available"
-                })
+            query = self.db.table("twilio_inventory").select("*", count="exact")
+
+            if is_assigned is not None:
+                query = query.eq("is_assigned", is_assigned)
+            # Keep PostgREST filter syntax (commas, parentheses) out of the pattern
+            search = re.sub(r"[^\w +-]", "", search or "").strip()
+            if search:
+                query = query.or_(f"phone_number.ilike.*{search}*,friendly_name.ilike.*{search}*")
+
+            offset = (page - 1) * per_page
+            result = await execute_async(
+                query.order("phone_number").range(offset, offset + per_page - 1)
+            )
 
-            return numbers_list
+            return result.data, result.count or 0
 
         except Exception as e:
             logger.error(f"Error listing owned numbers: {e}")
@@ -135,58 +168,49 @@ class PhoneService:
         Returns:
             Assignment details
         """
+        phone_data = {
+            "user_id": user_id,
+            "agent_id": agent_id,
+            "phone_number": phone_number,
+            "phone_number_sid": phone_number_sid,
+            "provider": "twilio",
+            "status": "active",
+            "provisioned_at": datetime.utcnow().isoformat()
+        }
+
         try:
             # Check if number is already assigned
-            existing = self.db.table("phone_numbers").select("*").eq("phone_number", phone_number).execute()
+            existing = await execute_async(
+                self.db.table("phone_numbers").select("id").eq("phone_number", phone_number)
+            )
 
             if existing.data:
                 raise Exception(f"Phone number {phone_number} is already assigned")
 
-            # Update the phone number's webhook to point to ElevenLabs
-            # This connects incoming calls to the specific agent
-            elevenlabs_webhook = f"{settings.ELEVENLABS_WEBHOOK_URL}/{agent_id}"
-
-            self.client.incoming_phone_numbers(phone_number_sid).update(
-                voice_url=elevenlabs_webhook,
-                voice_method="POST",
-                status_callback=f"{settings.WEBHOOK_BASE_URL}/api/webhooks/call/status",
-                status_callback_method="POST"
-            )
-
-            # Store assignment in database
-            phone_data = {
-                "user_id": user_id,
-                "agent_id": agent_id,
-                "phone_number": phone_number,
-                "phone_number_sid": phone_number_sid,
-                "provider": "twilio",
-                "status": "active",
-                "provisioned_at": "now()"
-            }
-
-            result = self.db.table("phone_numbers").insert(phone_data).execute()
-
-            # Update agents table for quick lookup
-            self.db.table("agents").update({
-                "phone_number": phone_number,
-                "phone_number_sid": phone_number_sid,
-                "phone_number_provider": "twilio",
-                "phone_number_status": "active"
-            }).eq("agent_id", agent_id).execute()
-
-            logger.info(f"Assigned phone number {phone_number} to agent {agent_id}")
-
-            return {
-                "phone_number": phone_number,
-                "phone_number_sid": phone_number_sid,
-                "status": "active",
-                "assigned_at": phone_data["provisioned_at"]
-            }
+            # Claim the number in the database first: a concurrent assignment
+            # of the same number fails here, before Twilio is touched
+            assignment = await self._record_assignment(phone_data)
+            try:
+                await asyncio.to_thread(self._point_webhook_at_agent, phone_number_sid, agent_id)
+            except Exception:
+                await self._undo_assignment(assignment)
+                raise
 
         except Exception as e:
             logger.error(f"Error assigning phone number: {e}")
             raise Exception(f"Failed to assign phone number: {str(e)}")
 
+        await self._refresh_route(agent_id)
+
+        logger.info(f"Assigned phone number {phone_number} to agent {agent_id}")
+
+        return {
+            "phone_number": phone_number,
+            "phone_number_sid": phone_number_sid,
+            "status": "active",
+            "assigned_at": phone_data["provisioned_at"]
+        }
+
     async def provision_phone_number(
         self,
         user_id: str,
@@ -211,89 +235,14 @@ class PhoneService:
             Phone number details including number and SID
         """
         try:
-            # If specific phone number provided, purchase that one
-            if phone_number:
-                # Purchase the specific phone number the customer selected
-                elevenlabs_webhook = f"{settings.ELEVENLABS_WEBHOOK_URL}/{agent_id}"
-
-                purchased_number = self.client.incoming_phone_numbers.create(
-                    phone_number=phone_number,
-                    voice_url=elevenlabs_webhook,
-                    voice_method="POST",
-                    status_callback=f"{settings.WEBHOOK_BASE_URL}/api/webhooks/call/status",
-                    status_callback_method="POST"
-                )
-            else:
-                # Search for available phone numbers
-                search_params = {
-                    "country": country,
-                    "voice_enabled": True,
-                    "capabilities": {"voice": True}
-                }
-
-                if area_code:
-                    search_params["area_code"] = area_code
-
-                # Find available numbers
-                available_numbers = self.client.available_phone_numbers(country).local.list(
-                    **search_params,
-                    limit=1
-                )
-
-                if not available_numbers:
+            if not phone_number:
+                candidates = await self._search_available_numbers(country, area_code, 1)
+                if not candidates:
                     raise Exception(f"No available phone numbers in {country}" +
                                   (f" with area code {area_code}" if area_code else ""))
+                phone_number = candidates[0]["phone_number"]
 
-                selected_number = available_numbers[0]
-
-                # Purchase the phone number
-                elevenlabs_webhook = f"{settings.ELEVENLABS_WEBHOOK_URL}/{agent_id}"
-
-                purchased_number = self.client.incoming_phone_numbers.create(
-                    phone_number=selected_number.phone_number,
-                    voice_url=elevenlabs_webhook,
-                    voice_method="POST",
-                    status_callback=f"{settings.WEBHOOK_BASE_URL}/api/webhooks/call/status",
-                    status_callback_method="POST"
-                )
-
-            # Store in database
-            phone_data = {
-                "user_id": user_id,
-                "agent_id": agent_id,
-                "phone_number": purchased_number.phone_number,
-                "phone_number_sid": purchased_number.sid,
-                "provider": "twilio",
-                "status": "active",
-                "country_code": country,
-                "friendly_name": purchased_number.friendly_name,
-                "capabilities": {
-                    "voice": True,
-                    "sms": purchased_number.capabilities.get("sms", False) if hasattr(purchased_number, 'capabilities') else False,
-                    "mms": purchased_number.capabilities.get("mms", False) if hasattr(purchased_number, 'capabilities') else False
-                },
-                "provisioned_at": "now()"
-            }
-
-            result = self.db.table("phone_numbers").insert(phone_data).execute()
-
-            # Also update agents table for quick lookup
-            self.db.table("agents").update({
-                "phone_number": purchased_number.phone_number,
-                "phone_number_sid": purchased_number.sid,
-                "phone_number_provider": "twilio",
-                "phone_number_status": "active"
-            }).eq("agent_id", agent_id).execute()
-
-            logger.info(f"Provisioned phone number {purchased_number.phone_number} for agent {agent_id}")
-
-            return {
-                "phone_number": purchased_number.phone_number,
-                "phone_number_sid": purchased_number.sid,
-                "friendly_name": purchased_number.friendly_name,
-                "capabilities": phone_data["capabilities"],
-                "status": "active"
-            }
+            return await self._purchase_and_assign(user_id, agent_id, phone_number, country)
 
         except TwilioRestException as e:
             logger.error(f"Twilio error provisioning phone number: {e}")
@@ -303,6 +252,198 @@ class PhoneService:
             logger.error(f"Error provisioning phone number: {e}")
             raise
 
+    async def provision_phone_numbers(
+        self,
+        user_id: str,
+        requests: list[Dict[str, Any]],
+        country: str = "US"
+    ) -> list[Dict[str, Any]]:
+        """
+        Buy and assign several numbers at once (e.g. one per location)
+
+        Numbers are purchased concurrently, up to PHONE_PROVISION_CONCURRENCY
+        at a time. Requests without a specific number share one search per
+        area code, so they get distinct numbers. Each request succeeds or
+        fails on its own; a failed request never leaves a purchased number
+        behind.
+
+        Args:
+            user_id: User ID
+            requests: [{"agent_id", "phone_number"?, "area_code"?}, ...]
+            country: Country code (default: "US")
+
+        Returns:
+            One result per request, in order: the provisioned number details
+            plus "agent_id", or {"agent_id", "error"}
+        """
+        # One search per area code for requests that did not pick a number
+        wanted: Dict[Optional[str], int] = {}
+        for request in requests:
+            if not request.get("phone_number"):
+                wanted[request.get("area_code")] = wanted.get(request.get("area_code"), 0) + 1
+
+        searches = await asyncio.gather(
+            *(self._search_available_numbers(country, code, count) for code, count in wanted.items()),
+            return_exceptions=True
+        )
+        pools = {code: ([] if isinstance(found, Exception) else [n["phone_number"] for n in found])
+                 for code, found in zip(wanted, searches)}
+
+        slots = asyncio.Semaphore(settings.PHONE_PROVISION_CONCURRENCY)
+
+        async def provision_one(request: Dict[str, Any]) -> Dict[str, Any]:
+            agent_id = request["agent_id"]
+            phone_number = request.get("phone_number")
+            if not phone_number:
+                pool = pools.get(request.get("area_code")) or []
+                if not pool:
+                    return {"agent_id": agent_id, "error": "No available phone numbers" +
+                            (f" with area code {request['area_code']}" if request.get("area_code") else "")}
+                phone_number = pool.pop()
+
+            async with slots:
+                try:
+                    result = await self._purchase_and_assign(user_id, agent_id, phone_number, country)
+                    return {"agent_id": agent_id, **result}
+                except Exception as e:
+                    return {"agent_id": agent_id, "error": str(e)}
+
+        return await asyncio.gather(*(provision_one(request) for request in requests))
+
+    async def _purchase_and_assign(
+        self,
+        user_id: str,
+        agent_id: str,
+        phone_number: str,
+        country: str
+    ) -> Dict[str, Any]:
+        """Purchase a number and record it, releasing it again if recording fails"""
+        purchased_number = await asyncio.to_thread(self._purchase, phone_number, agent_id)
+
+        phone_data = {
+            "user_id": user_id,
+            "agent_id": agent_id,
+            "phone_number": purchased_number.phone_number,
+            "phone_number_sid": purchased_number.sid,
+            "provider": "twilio",
+            "status": "active",
+            "country_code": country,
+            "friendly_name": purchased_number.friendly_name,
+            "capabilities": {
+                "voice": True,
+                "sms": purchased_number.capabilities.get("sms", False) if purchased_number.capabilities else False,
+                "mms": purchased_number.capabilities.get("mms", False) if purchased_number.capabilities else False
+            },
+            "provisioned_at": datetime.utcnow().isoformat()
+        }
+
+        try:
+            await self._record_assignment(phone_data)
+        except Exception as e:
+            logger.error(f"Recording {purchased_number.phone_number} failed, releasing it: {e}")
+            await self._rollback_purchase(purchased_number.sid, agent_id)
+            raise
+
+        self.search_cache.discard_number(purchased_number.phone_number)
+        await asyncio.gather(
+            self._refresh_route(agent_id),
+            self._mirror(twilio_inventory_sync.upsert(purchased_number))
+        )
+
+        logger.info(f"Provisioned phone number {purchased_number.phone_number} for agent {agent_id}")
+
+        return {
+            "phone_number": purchased_number.phone_number,
+            "phone_number_sid": purchased_number.sid,
+            "friendly_name": purchased_number.friendly_name,
+            "capabilities": phone_data["capabilities"],
+            "status": "active"
+        }
+
+    def _purchase(self, phone_number: str, agent_id: str):
+        """Buy a number with its voice webhook already pointing at the agent"""
+        return self.client.incoming_phone_numbers.create(
+            phone_number=phone_number,
+            voice_url=f"{settings.ELEVENLABS_WEBHOOK_URL}/{agent_id}",
+            voice_method="POST",
+            status_callback=f"{settings.WEBHOOK_BASE_URL}/api/webhooks/call/status",
+            status_callback_method="POST"
+        )
+
+    def _point_webhook_at_agent(self, phone_number_sid: str, agent_id: str):
+        """Connect incoming calls on an owned number to the agent's ElevenLabs endpoint"""
+        self.client.incoming_phone_numbers(phone_number_sid).update(
+            voice_url=f"{settings.ELEVENLABS_WEBHOOK_URL}/{agent_id}",
+            voice_method="POST",
+            status_callback=f"{settings.WEBHOOK_BASE_URL}/api/webhooks/call/status",
+            status_callback_method="POST"
+        )
+
+    async def _record_assignment(self, phone_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Write the phone_numbers row and the agents lookup columns concurrently
+
+        Returns what _undo_assignment needs to take exactly these writes back:
+        the id of the inserted row and the agent's previous number.
+        """
+        previous = await execute_async(
+            self.db.table("agents")
+            .select("phone_number, phone_number_sid, phone_number_provider, phone_number_status")
+            .eq("agent_id", phone_data["agent_id"])
+        )
+        assignment = {
+            "agent_id": phone_data["agent_id"],
+            "phone_number_sid": phone_data["phone_number_sid"],
+            "row_id": None,
+            "previous_agent": previous.data[0] if previous.data else None,
+        }
+
+        inserted, updated = await asyncio.gather(
+            execute_async(self.db.table("phone_numbers").insert(phone_data)),
+            execute_async(self.db.table("agents").update({
+                "phone_number": phone_data["phone_number"],
+                "phone_number_sid": phone_data["phone_number_sid"],
+                "phone_number_provider": "twilio",
+                "phone_number_status": "active"
+            }).eq("agent_id", phone_data["agent_id"])),
+            return_exceptions=True
+        )
+        if not isinstance(inserted, Exception) and inserted.data:
+            assignment["row_id"] = inserted.data[0]["id"]
+
+        errors = [r for r in (inserted, updated) if isinstance(r, Exception)]
+        if errors:
+            await self._undo_assignment(assignment)
+            raise errors[0]
+        return assignment
+
+    async def _undo_assignment(self, assignment: Dict[str, Any]):
+        """Take back the writes of one _record_assignment, leaving other requests' rows alone"""
+        undo = []
+        if assignment["row_id"] is not None:
+            undo.append(execute_async(
+                self.db.table("phone_numbers").delete().eq("id", assignment["row_id"])
+            ))
+        if assignment["previous_agent"] is not None:
+            # Only if the agent still has the number this request gave it
+            undo.append(execute_async(
+                self.db.table("agents").update(assignment["previous_agent"])
+                .eq("agent_id", assignment["agent_id"])
+                .eq("phone_number_sid", assignment["phone_number_sid"])
+            ))
+        results = await asyncio.gather(*undo, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Failed to undo assignment of {assignment['phone_number_sid']}: {result}")
+
+    async def _rollback_purchase(self, phone_number_sid: str, agent_id: str):
+        """Compensate a purchase whose assignment could not be recorded"""
+        try:
+            await asyncio.to_thread(self.client.incoming_phone_numbers(phone_number_sid).delete)
+        except Exception as e:
+            # Leave it for the inventory sync / an operator: it shows up as unassigned
+            logger.error(f"Failed to release {phone_number_sid} for agent {agent_id} after rollback: {e}")
+
     async def release_phone_number(
         self,
         agent_id: str,
@@ -333,6 +474,9 @@ class PhoneService:
                 "phone_number_status": "inactive"
             }).eq("agent_id", agent_id).execute()
 
+            self.routing.remove_agent(agent_id)
+            await self._mirror(twilio_inventory_sync.remove([phone_number_sid]))
+
             logger.info(f"Released phone number {phone_number_sid} for agent {agent_id}")
 
             return True
@@ -347,28 +491,37 @@ class PhoneService:
 
     async def get_agent_by_phone_number(self, phone_number: str) -> Optional[Dict[str, Any]]:
         """
-        Get agent details by their phone number (for routing incoming calls)
+        Get the agent routed to a phone number (for routing incoming calls)
+
+        Served from the in-memory routing table, so this is usually a dict lookup.
 
         Args:
             phone_number: Phone number in E.164 format (e.g., +12125551234)
 
         Returns:
-            Agent details or None if not found
+            The agent's routing columns (agent_id, user_id, phone_number,
+            phone_number_status, status) or None if not found
         """
         try:
-            result = self.db.table("agents").select(
-                "*, users(email, company_name, plan)"
-            ).eq("phone_number", phone_number).eq("status", "active").execute()
-
-            if result.data:
-                return result.data[0]
-
-            return None
-
+            return await self.routing.resolve(phone_number)
         except Exception as e:
             logger.error(f"Error getting agent by phone number: {e}")
             return None
 
+    async def _refresh_route(self, agent_id: str):
+        """Update the local routing table after an assignment; other workers follow the version stamp"""
+        try:
+            await self.routing.reload_agent(agent_id)
+        except Exception as e:
+            logger.error(f"Failed to refresh routing for agent {agent_id}: {e}")
+
+    async def _mirror(self, update):
+        """Apply an inventory mirror update; the next sync sweep corrects any failure"""
+        try:
+            await update
+        except Exception as e:
+            logger.error(f"Failed to update Twilio inventory mirror: {e}")
+
     async def update_webhook_urls(
         self,
         phone_number_sid: str,
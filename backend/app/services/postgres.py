@@ -0,0 +1,279 @@
+"""
+Direct Postgres access for bulk work
+
+PostgREST returns every row as JSON over HTTP, which is fine for pages of
+results but expensive for wide scans: stats that only need a few numbers
+used to download every matching row, and a large export would too. When
+DATABASE_DIRECT_QUERIES is on (and DATABASE_URL is set) SupabaseService and
+BatchWriter use this pool instead for
+- aggregate queries (fetch/fetchrow), so only the totals cross the wire
+- COPY ... TO STDOUT streaming exports (copy_csv)
+- multi-row inserts (insert_rows, one INSERT ... VALUES statement)
+
+psycopg2 is blocking, so every call runs in a worker thread on its own
+pooled connection. COPY exports last as long as the client takes to
+download them, so they run on their own small executor (export_concurrency
+threads) instead of the default one that execute_async shares. Connections use the service role, which bypasses RLS:
+queries must filter by user themselves.
+"""
+from typing import Optional, List, Dict, Any, AsyncIterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from app.config import settings
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# COPY output is handed to the event loop in chunks of about this size
+COPY_CHUNK_BYTES = 64 * 1024
+COPY_MAX_CHUNKS = 16
+
+
+class _CopyCancelled(Exception):
+    pass
+
+
+class _CopySink:
+    """
+    File-like target for copy_expert() that hands chunks to the event loop
+
+    Chunks go onto an asyncio.Queue through call_soon_threadsafe. The COPY
+    thread holds one of COPY_MAX_CHUNKS credits per queued chunk and the
+    consumer returns it when it takes the chunk, so the thread blocks while
+    the consumer is behind.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.chunks: asyncio.Queue = asyncio.Queue()
+        self.credits = threading.Semaphore(COPY_MAX_CHUNKS)
+        self.cancelled = False
+        self._buffer: List[bytes] = []
+        self._size = 0
+
+    def write(self, data):
+        if self.cancelled:
+            raise _CopyCancelled()
+        if isinstance(data, str):
+            data = data.encode()
+        self._buffer.append(data)
+        self._size += len(data)
+        if self._size >= COPY_CHUNK_BYTES:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self.put(b"".join(self._buffer))
+            self._buffer, self._size = [], 0
+
+    def put(self, chunk: bytes):
+        # Blocks while the consumer is behind; gives up once it went away
+        while not self.credits.acquire(timeout=0.5):
+            if self.cancelled:
+                raise _CopyCancelled()
+        if self.cancelled:
+            raise _CopyCancelled()
+        self.loop.call_soon_threadsafe(self.chunks.put_nowait, chunk)
+
+    async def get(self):
+        chunk = await self.chunks.get()
+        self.credits.release()
+        return chunk
+
+    def cancel(self):
+        self.cancelled = True
+        # Wake a COPY thread waiting for a credit
+        self.credits.release()
+
+
+class PostgresPool:
+    def __init__(
+        self,
+        dsn: str,
+        min_size: int = 1,
+        max_size: int = 10,
+        statement_timeout_ms: int = 30000,
+        export_concurrency: int = 4,
+    ):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.statement_timeout_ms = statement_timeout_ms
+        self.export_concurrency = export_concurrency
+        self._pool = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._export_slots: Optional[asyncio.Semaphore] = None
+        self._export_executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.dsn)
+
+    # Connections
+    def _get_pool(self):
+        if self._pool is None:
+            from psycopg2.pool import ThreadedConnectionPool
+
+            self._pool = ThreadedConnectionPool(
+                self.min_size,
+                self.max_size,
+                self.dsn,
+                options=f"-c statement_timeout={self.statement_timeout_ms}",
+                application_name="vami-backend",
+            )
+        return self._pool
+
+    async def _run(self, fn, *args, executor: Optional[ThreadPoolExecutor] = None):
+        """Run fn(connection, *args) in a thread on a pooled connection, committing on success"""
+        if self._slots is None:
+            # The pool raises instead of waiting when it is exhausted, so queue here
+            self._slots = asyncio.Semaphore(self.max_size)
+        async with self._slots:
+            if executor is None:
+                return await asyncio.to_thread(self._with_connection, fn, *args)
+            return await asyncio.get_running_loop().run_in_executor(
+                executor, self._with_connection, fn, *args
+            )
+
+    def _with_connection(self, fn, *args):
+        pool = self._get_pool()
+        conn = pool.getconn()
+        broken = False
+        try:
+            result = fn(conn, *args)
+            conn.commit()
+            return result
+        except BaseException:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            pool.putconn(conn, close=broken or conn.closed != 0)
+
+    def close(self):
+        if self._export_executor is not None:
+            self._export_executor.shutdown(wait=False, cancel_futures=True)
+            self._export_executor = None
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
+
+    # Queries
+    @staticmethod
+    def _fetch(conn, sql: str, params) -> List[Dict[str, Any]]:
+        from psycopg2.extras import RealDictCursor
+
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(sql, params)
+            return [dict(row) for row in cursor.fetchall()]
+
+    async def fetch(self, sql: str, params: Optional[Sequence] = None) -> List[Dict[str, Any]]:
+        """Run a query (%s placeholders) and return its rows as dicts"""
+        return await self._run(self._fetch, sql, params)
+
+    async def fetchrow(self, sql: str, params: Optional[Sequence] = None) -> Optional[Dict[str, Any]]:
+        rows = await self.fetch(sql, params)
+        return rows[0] if rows else None
+
+    @staticmethod
+    def _insert(conn, table: str, rows: List[Dict[str, Any]], on_conflict: Optional[str]) -> int:
+        from psycopg2.extensions import AsIs
+        from psycopg2.extras import Json, execute_values
+
+        # Union of keys; a row without a column gets the column default, as with PostgREST
+        columns = list(dict.fromkeys(key for row in rows for key in row))
+        default = AsIs("DEFAULT")
+
+        def adapt(value):
+            return Json(value) if isinstance(value, dict) else value
+
+        values = [tuple(adapt(row[c]) if c in row else default for c in columns) for row in rows]
+        target = table if "." in table else f"public.{table}"
+        sql = f"INSERT INTO {target} ({', '.join(columns)}) VALUES %s"
+        if on_conflict:
+            sql += f" ON CONFLICT ({on_conflict}) DO NOTHING"
+        with conn.cursor() as cursor:
+            execute_values(cursor, sql, values, page_size=len(values))
+            return cursor.rowcount
+
+    async def insert_rows(
+        self, table: str, rows: List[Dict[str, Any]], on_conflict: Optional[str] = None
+    ) -> int:
+        """
+        Insert rows into `table` (in public unless schema-qualified) with one
+        multi-row INSERT; with `on_conflict` (column list), rows that conflict
+        are skipped. Returns the number inserted.
+        """
+        if not rows:
+            return 0
+        return await self._run(self._insert, table, rows, on_conflict)
+
+    # Exports
+    @staticmethod
+    def _copy(conn, sql: str, params, sink: _CopySink):
+        with conn.cursor() as cursor:
+            query = cursor.mogrify(sql, params).decode()
+            cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", sink)
+        sink.flush()
+
+    async def copy_csv(self, sql: str, params: Optional[Sequence] = None) -> AsyncIterator[bytes]:
+        """
+        Stream a query's result as CSV (with a header row) via COPY
+
+        Memory stays bounded however many rows match: the COPY thread blocks
+        while the consumer is behind, and is aborted if the consumer stops
+        iterating (e.g. the client disconnected). At most export_concurrency
+        exports run at once; others wait for a slot.
+        """
+        if self._export_slots is None:
+            self._export_slots = asyncio.Semaphore(self.export_concurrency)
+        if self._export_executor is None:
+            self._export_executor = ThreadPoolExecutor(
+                max_workers=self.export_concurrency, thread_name_prefix="postgres-copy"
+            )
+
+        async with self._export_slots:
+            sink = _CopySink(asyncio.get_running_loop())
+            done = object()
+
+            async def produce():
+                try:
+                    await self._run(self._copy, sql, params, sink, executor=self._export_executor)
+                finally:
+                    # Chunks are queued with call_soon_threadsafe, so this lands after them
+                    sink.chunks.put_nowait(done)
+
+            task = asyncio.create_task(produce())
+            try:
+                while True:
+                    chunk = await sink.get()
+                    if chunk is done:
+                        break
+                    yield chunk
+                await task
+            finally:
+                if not task.done():
+                    sink.cancel()
+                    try:
+                        await task
+                    except _CopyCancelled:
+                        pass
+                    except Exception as e:
+                        logger.warning(f"Cancelled COPY export ended with: {e}")
+
+
+def create_pool() -> PostgresPool:
+    return PostgresPool(
+        settings.DATABASE_URL if settings.DATABASE_DIRECT_QUERIES else "",
+        min_size=settings.DATABASE_POOL_MIN_SIZE,
+        max_size=settings.DATABASE_POOL_MAX_SIZE,
+        statement_timeout_ms=settings.DATABASE_STATEMENT_TIMEOUT_MS,
+        export_concurrency=settings.DATABASE_EXPORT_CONCURRENCY,
+    )
+
+
+# Singleton instance
+postgres = create_pool()
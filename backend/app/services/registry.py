@@ -0,0 +1,98 @@
+"""
+Lazy service registry
+
+Importing app.main imports every router and, through them, every service
+singleton. Services whose construction needs a heavy SDK (Supabase, Stripe,
+Twilio, Google) are registered here instead of being built at import time:
+register() returns a proxy that constructs the service, and imports its
+SDK, on first attribute access. Cold starts then only pay for the clients a
+request actually uses.
+
+Construction is thread-safe (services are also reached from worker threads)
+and timed; stats() shows which services were built and what each cost.
+"""
+from typing import Optional, Dict, Any, Callable
+from app.config import settings
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LazyService:
+    """Stands in for a registered service; forwards everything to the real instance"""
+
+    __slots__ = ("_registry", "_name")
+
+    def __init__(self, registry: "ServiceRegistry", name: str):
+        object.__setattr__(self, "_registry", registry)
+        object.__setattr__(self, "_name", name)
+
+    def __getattr__(self, attr: str):
+        return getattr(self._registry.get(self._name), attr)
+
+    def __setattr__(self, attr: str, value: Any):
+        setattr(self._registry.get(self._name), attr, value)
+
+    def __repr__(self) -> str:
+        state = "initialized" if self._registry.is_initialized(self._name) else "not initialized"
+        return f"<LazyService {self._name} ({state})>"
+
+
+class ServiceRegistry:
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._init_ms: Dict[str, float] = {}
+        self._lock = threading.RLock()
+
+    def register(self, name: str, factory: Callable[[], Any]) -> LazyService:
+        """Register a factory; the returned proxy builds the service on first use"""
+        self._factories[name] = factory
+        return LazyService(self, name)
+
+    def get(self, name: str) -> Any:
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            instance = self._instances.get(name)
+            if instance is None:
+                start = time.perf_counter()
+                instance = self._factories[name]()
+                self._init_ms[name] = (time.perf_counter() - start) * 1000
+                self._instances[name] = instance
+                logger.info(f"Initialized {name} in {self._init_ms[name]:.0f} ms")
+        return instance
+
+    def override(self, name: str, instance: Any):
+        """Use `instance` for a registered service (fakes in tests and load tests)"""
+        with self._lock:
+            self._instances[name] = instance
+            self._init_ms.pop(name, None)
+
+    def is_initialized(self, name: str) -> bool:
+        return name in self._instances
+
+    def instance(self, name: str) -> Optional[Any]:
+        """The service if it was built already, without building it (e.g. for shutdown)"""
+        return self._instances.get(name)
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        """Service name -> construction time in ms (None if not built yet)"""
+        return {name: self._init_ms.get(name) for name in self._factories}
+
+
+# Singleton instance
+registry = ServiceRegistry()
+
+
+def _create_twilio_client():
+    from twilio.rest import Client
+
+    return Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+
+
+# One Twilio REST client shared by PhoneService and the inventory sync
+twilio_client = registry.register("twilio", _create_twilio_client)
@@ -0,0 +1,118 @@
+"""
+Retry helpers shared by the outbound dispatchers and API clients
+"""
+import random
+import time
+from typing import Mapping, Optional
+
+# HTTP status codes worth retrying: timeouts, throttling and transient upstream errors
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+def backoff_delay(
+    attempt: int,
+    base: float = 0.5,
+    cap: float = 30.0,
+    jitter: bool = True,
+    min_ratio: float = 0.0,
+) -> float:
+    """
+    Exponential backoff delay in seconds for a zero-based retry attempt
+
+    Uses "full jitter" by default so that many clients retrying at once
+    spread out instead of hammering the upstream in lockstep. `min_ratio`
+    sets a floor as a fraction of the un-jittered delay (0.5 = "equal jitter").
+    """
+    delay = min(cap, base * (2 ** attempt))
+    if jitter:
+        return random.uniform(delay * min_ratio, delay)
+    return delay
+
+
+def retry_after_seconds(headers: Mapping[str, str], default: float, cap: float = 60.0) -> float:
+    """Parse a Retry-After header (seconds form), falling back to the given default"""
+    value: Optional[str] = headers.get("Retry-After") or headers.get("retry-after")
+    if value:
+        try:
+            return min(cap, max(0.0, float(value)))
+        except ValueError:
+            pass
+    return default
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker
+
+    After `failure_threshold` failures in a row the circuit opens and calls
+    fail fast for `reset_timeout` seconds. Then a single probe call is let
+    through (half-open): success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_started: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go ahead now"""
+        state = self.state
+        if state == "half_open":
+            # One probe at a time; a probe that never reported back (e.g. was
+            # cancelled) stops blocking others after another reset_timeout
+            now = time.monotonic()
+            if self._probe_started is None or now - self._probe_started >= self.reset_timeout:
+                self._probe_started = now
+                return
+        if state != "closed":
+            raise CircuitOpenError(f"{self.name} circuit is open")
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probe_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_started = None
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class RetryBudget:
+    """
+    Caps retries at a fraction of recent requests
+
+    Every request deposits `ratio` tokens (up to `max_tokens`) and every retry
+    spends one, so during an outage retries add at most ~`ratio` extra load
+    instead of multiplying it by the retry count.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_tokens: float = 10.0, max_tokens: float = 100.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = min_tokens
+
+    def record_request(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
@@ -1,11 +1,230 @@
-from twilio.rest import Client
+"""
+SMS service
+
+Messages are queued and sent by background workers over a pooled async
+HTTP client talking to the Twilio Messages REST API. Each sender number
+has its own token bucket so we stay within Twilio's per-number
+throughput, and 429/5xx responses are retried with backoff.
+"""
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Any, Callable, Awaitable
 from app.config import settings
+from app.services.retry import RETRYABLE_STATUS_CODES, backoff_delay, retry_after_seconds
+import asyncio
+import logging
+import time
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursting up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Wait until a token is available and take it"""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Push the bucket into debt so no tokens are issued for `seconds` (used on 429)"""
+        self._refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+@dataclass
+class SMSJob:
+    """A queued outbound SMS"""
+    to_phone: str
+    body: str
+    from_number: str
+    future: Optional[asyncio.Future] = None
+    attempts: int = field(default=0)
+
+
+class SMSDispatcher:
+    """
+    Background sender for queued SMS
+
+    Worker tasks pull jobs from a bounded queue, wait on the sender number's
+    token bucket, then POST to Twilio through one shared keep-alive client.
+    """
+
+    def __init__(
+        self,
+        account_sid: str,
+        auth_token: str,
+        base_url: str = "https://api.twilio.com",
+        rate_per_second: float = 1.0,
+        burst: int = 1,
+        concurrency: int = 4,
+        max_queue_size: int = 10000,
+        max_retries: int = 5,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.base_url = base_url
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.concurrency = concurrency
+        self.max_queue_size = max_queue_size
+        self.max_retries = max_retries
+        self.transport = transport
+
+        self.messages_path = f"/2010-04-01/Accounts/{account_sid}/Messages.json"
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._workers: List[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def _ensure_started(self):
+        """Create the queue, HTTP client and workers on the running event loop"""
+        if self.running:
+            return
+
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            auth=(self.account_sid, self.auth_token),
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=self.concurrency,
+                max_keepalive_connections=self.concurrency,
+            ),
+            transport=self.transport,
+        )
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"sms-dispatcher-{i}")
+            for i in range(self.concurrency)
+        ]
+
+    async def start(self):
+        """Start worker tasks (also done lazily on first enqueue)"""
+        self._ensure_started()
+
+    async def stop(self, timeout: float = 10.0):
+        """Drain the queue (up to `timeout` seconds) and release the HTTP pool"""
+        if not self.running:
+            return
+
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"SMS queue not drained on shutdown, {self._queue.qsize()} messages dropped")
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+        await self._client.aclose()
+        self._client = None
+
+    def _bucket(self, from_number: str) -> TokenBucket:
+        bucket = self._buckets.get(from_number)
+        if bucket is None:
+            bucket = TokenBucket(self.rate_per_second, self.burst)
+            self._buckets[from_number] = bucket
+        return bucket
+
+    def enqueue(self, job: SMSJob) -> bool:
+        """Queue a job without waiting. Returns False if the queue is full."""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(job)
+            return True
+        except asyncio.QueueFull:
+            logger.error(f"SMS queue full, dropping message to {job.to_phone}")
+            if job.future and not job.future.done():
+                job.future.set_result(None)
+            return False
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            sid = None
+            try:
+                sid = await self._deliver(job)
+            except Exception as e:
+                logger.error(f"Unexpected error sending SMS: {e}")
+            finally:
+                if job.future and not job.future.done():
+                    job.future.set_result(sid)
+                self._queue.task_done()
+
+    async def _deliver(self, job: SMSJob) -> Optional[str]:
+        """Send one SMS, honouring the sender's rate and retrying throttled/failed sends"""
+        bucket = self._bucket(job.from_number)
+        data = {"To": job.to_phone, "From": job.from_number, "Body": job.body}
+
+        while True:
+            await bucket.acquire()
+
+            retry_delay = backoff_delay(job.attempts)
+            try:
+                response = await self._client.post(self.messages_path, data=data)
+                if response.status_code in (200, 201):
+                    return response.json().get("sid")
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    logger.error(f"Failed to send SMS ({response.status_code}): {response.text}")
+                    return None
+                if response.status_code == 429:
+                    retry_delay = retry_after_seconds(response.headers, retry_delay)
+                    bucket.pause(retry_delay)
+                error = f"HTTP {response.status_code}"
+            except httpx.TransportError as e:
+                error = str(e)
+
+            job.attempts += 1
+            if job.attempts > self.max_retries:
+                logger.error(f"Giving up on SMS to {job.to_phone} after {job.attempts} attempts: {error}")
+                return None
+
+            await asyncio.sleep(retry_delay)
 
 
 class SMSService:
-    def __init__(self):
-        self.client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
         self.from_number = settings.TWILIO_PHONE_NUMBER
+        self.dispatcher = SMSDispatcher(
+            account_sid=settings.TWILIO_ACCOUNT_SID,
+            auth_token=settings.TWILIO_AUTH_TOKEN,
+            base_url=settings.TWILIO_API_BASE_URL,
+            rate_per_second=settings.SMS_RATE_PER_SECOND,
+            burst=settings.SMS_BURST,
+            concurrency=settings.SMS_WORKER_CONCURRENCY,
+            max_queue_size=settings.SMS_QUEUE_MAX_SIZE,
+            max_retries=settings.SMS_MAX_RETRIES,
+            transport=transport,
+        )
+
+    async def start(self):
+        await self.dispatcher.start()
+
+    async def stop(self):
+        await self.dispatcher.stop()
 
     async def send_appointment_confirmation(
         self,
@@ -22,7 +241,7 @@ class SMSService:
             f"Reply CANCEL to cancel."
         )
 
-        return await self._send_sms(to_phone, message_body)
+        return self._send_sms(to_phone, message_body)
 
     async def send_appointment_reminder(
         self,
@@ -32,25 +251,83 @@ class SMSService:
         business_name: str
     ):
         """Send appointment reminder SMS"""
-        message_body = (
+        return self._send_sms(to_phone, self._reminder_body(patient_name, appointment_time, business_name))
+
+    async def send_batch(self, messages: List[Dict[str, str]]) -> List[Optional[str]]:
+        """
+        Queue many messages and wait for all of them to be delivered
+
+        Args:
+            messages: Dicts with to_phone, body and optionally from_number
+
+        Returns:
+            Twilio message SIDs in input order (None for failed sends)
+        """
+        loop = asyncio.get_running_loop()
+        futures = []
+        for message in messages:
+            future = loop.create_future()
+            self.dispatcher.enqueue(SMSJob(
+                to_phone=message["to_phone"],
+                body=message["body"],
+                from_number=message.get("from_number") or self.from_number,
+                future=future,
+            ))
+            futures.append(future)
+
+        return list(await asyncio.gather(*futures))
+
+    async def drain_due_reminders(
+        self,
+        fetch_due: Callable[[int], Awaitable[List[Dict[str, Any]]]],
+        on_sent: Optional[Callable[[List[Dict[str, Any]], List[Optional[str]]], Awaitable[None]]] = None,
+        batch_size: int = 200,
+    ) -> int:
+        """
+        Scheduled-reminder mode: send due reminders batch by batch until none are left
+
+        Args:
+            fetch_due: Returns up to `batch_size` due reminders, each with
+                to_phone, patient_name, appointment_time, business_name
+                (and optionally from_number); an empty list ends the drain
+            on_sent: Called with each batch and its SIDs, e.g. to mark rows as sent
+            batch_size: Reminders fetched per round
+
+        Returns:
+            Number of reminders successfully sent
+        """
+        sent = 0
+        while True:
+            reminders = await fetch_due(batch_size)
+            if not reminders:
+                return sent
+
+            sids = await self.send_batch([
+                {
+                    "to_phone": r["to_phone"],
+                    "body": self._reminder_body(r["patient_name"], r["appointment_time"], r["business_name"]),
+                    "from_number": r.get("from_number"),
+                }
+                for r in reminders
+            ])
+            sent += sum(1 for sid in sids if sid)
+
+            if on_sent:
+                await on_sent(reminders, sids)
+
+    def _reminder_body(self, patient_name: str, appointment_time: str, business_name: str) -> str:
+        return (
             f"Reminder: {patient_name}, you have an appointment with {business_name} "
             f"at {appointment_time} today. Reply CONFIRM to confirm."
         )
 
-        return await self._send_sms(to_phone, message_body)
-
-    async def _send_sms(self, to_phone: str, message_body: str):
-        """Internal method to send SMS"""
-        try:
-            message = self.client.messages.create(
-                body=message_body,
-                from_=self.from_number,
-                to=to_phone
-            )
-            return message.sid
-        except Exception as e:
-            print(f"Failed to send SMS: {str(e)}")
-            return None
+    def _send_sms(self, to_phone: str, message_body: str, from_number: Optional[str] = None) -> bool:
+        """Internal method to queue an SMS for background delivery"""
+        return self.dispatcher.enqueue(SMSJob(
+            to_phone=to_phone,
+            body=message_body,
+            from_number=from_number or self.from_number,
+        ))
 
 
 # Singleton instance
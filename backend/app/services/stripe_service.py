@@ -1,10 +1,8 @@
-import stripe
 from typing import Optional
 from datetime import datetime
 from app.config import settings
 from app.models.user import SubscriptionPlan
-
-stripe.api_key = settings.STRIPE_SECRET_KEY
+from app.services.registry import registry
 
 
 class StripeService:
@@ -16,9 +14,16 @@ class StripeService:
         SubscriptionPlan.PREMIUM: settings.STRIPE_PRICE_PREMIUM,
     }
 
+    def __init__(self):
+        # The SDK takes a few hundred ms to import; pay for it on first use
+        import stripe
+
+        stripe.api_key = settings.STRIPE_SECRET_KEY
+        self.stripe = stripe
+
     async def create_customer(self, email: str, name: Optional[str] = None) -> str:
         """Create Stripe customer"""
-        customer = stripe.Customer.create(
+        customer = self.stripe.Customer.create(
             email=email,
             name=name,
             metadata={"platform": "vami"}
@@ -61,26 +66,26 @@ class StripeService:
                 "trial_period_days": trial_days
             }
 
-        session = stripe.checkout.Session.create(**session_params)
+        session = self.stripe.checkout.Session.create(**session_params)
         return session.url
 
     async def get_subscription(self, subscription_id: str):
         """Get subscription details"""
-        return stripe.Subscription.retrieve(subscription_id)
+        return self.stripe.Subscription.retrieve(subscription_id)
 
     async def cancel_subscription(self, subscription_id: str, at_period_end: bool = True):
         """Cancel subscription"""
         if at_period_end:
-            return stripe.Subscription.modify(
+            return self.stripe.Subscription.modify(
                 subscription_id,
                 cancel_at_period_end=True
             )
         else:
-            return stripe.Subscription.cancel(subscription_id)
+            return self.stripe.Subscription.cancel(subscription_id)
 
     async def reactivate_subscription(self, subscription_id: str):
         """Reactivate a subscription scheduled for cancellation"""
-        return stripe.Subscription.modify(
+        return self.stripe.Subscription.modify(
             subscription_id,
             cancel_at_period_end=False
         )
@@ -91,10 +96,10 @@ class StripeService:
         if not price_id:
             raise ValueError(f"No price ID configured for plan: {new_plan}")
 
-        subscription = stripe.Subscription.retrieve(subscription_id)
+        subscription = self.stripe.Subscription.retrieve(subscription_id)
 
         # Update subscription with new price
-        return stripe.Subscription.modify(
+        return self.stripe.Subscription.modify(
             subscription_id,
             items=[{
                 "id": subscription["items"]["data"][0].id,
@@ -105,7 +110,7 @@ class StripeService:
 
     async def create_customer_portal_session(self, customer_id: str, return_url: str) -> str:
         """Create customer portal session for managing billing"""
-        session = stripe.billing_portal.Session.create(
+        session = self.stripe.billing_portal.Session.create(
             customer=customer_id,
             return_url=return_url,
         )
@@ -113,7 +118,7 @@ class StripeService:
 
     async def get_invoices(self, customer_id: str, limit: int = 10):
         """Get customer invoices"""
-        return stripe.Invoice.list(
+        return self.stripe.Invoice.list(
             customer=customer_id,
             limit=limit
         )
@@ -121,15 +126,15 @@ class StripeService:
     def verify_webhook_signature(self, payload: bytes, signature: str) -> dict:
         """Verify Stripe webhook signature"""
         try:
-            event = stripe.Webhook.construct_event(
+            event = self.stripe.Webhook.construct_event(
                 payload, signature, settings.STRIPE_WEBHOOK_SECRET
             )
             return event
         except ValueError:
             raise ValueError("Invalid payload")
-        except stripe.error.SignatureVerificationError:
+        except self.stripe.error.SignatureVerificationError:
             raise ValueError("Invalid signature")
 
 
 # Singleton instance
-stripe_service = StripeService()
+stripe_service = registry.register("stripe", StripeService)
@@ -1,17 +1,86 @@
 from typing import Optional, Dict, Any, List
-from datetime import datetime, date
-from app.database import get_supabase
+from datetime import datetime, date, timedelta
+from app.database import get_supabase, get_read_client, execute_async
 from app.models.user import User, UserFeatures, SubscriptionPlan, PLAN_FEATURES
 from app.models.agent import Agent
 from app.models.conversation import Conversation
 from app.models.subscription import UsageRecord
+from app.services.transcript_store import transcript_store
+from app.services.api_keys import api_key_store
+from app.services.postgres import postgres
 from decimal import Decimal
+import csv
+import io
 import secrets
 
+# Everything except the (offloaded) raw payload
+CONVERSATION_LIST_COLUMNS = (
+    "id, conversation_id, agent_id, end_user_id, duration_secs, total_cost, "
+    "call_successful, summary, title, sentiment, intent, created_at"
+)
+
+CALL_EXPORT_COLUMNS = [
+    "id", "agent_id", "phone_number", "direction", "status", "duration_secs",
+    "sentiment", "call_successful", "summary", "created_at", "started_at", "ended_at",
+]
+
+
+def analytics_stats_from_rows(conversations: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """get_analytics_stats() computed from the conversation rows"""
+    total_calls = len(conversations)
+    successful_calls = sum(1 for c in conversations if c.get('call_successful') == 'success')
+    total_duration_secs = sum(c.get('duration_secs', 0) or 0 for c in conversations)
+    total_minutes = total_duration_secs / 60.0 if total_duration_secs > 0 else 0
+    avg_duration_secs = total_duration_secs / total_calls if total_calls > 0 else 0
+
+    # Count sentiment breakdown
+    sentiment_breakdown = {}
+    for c in conversations:
+        sentiment = c.get('sentiment')
+        if sentiment:
+            sentiment_breakdown[sentiment] = sentiment_breakdown.get(sentiment, 0) + 1
+
+    return {
+        'total_calls': total_calls,
+        'successful_calls': successful_calls,
+        'failed_calls': total_calls - successful_calls,
+        'total_minutes': total_minutes,
+        'avg_duration_secs': avg_duration_secs,
+        'appointments_booked': 0,  # Would need to parse conversation data
+        'sentiment_breakdown': sentiment_breakdown
+    }
+
+
+def call_stats_from_rows(calls: List[Dict[str, Any]], ratings: List[float]) -> Dict[str, Any]:
+    """get_call_stats() computed from the call rows and feedback ratings"""
+    total_calls = len(calls)
+    successful_calls = len([c for c in calls if c.get("call_successful")])
+    durations = [c.get("duration_secs", 0) for c in calls if c.get("duration_secs")]
+
+    calls_by_status = {}
+    calls_by_sentiment = {}
+    for call in calls:
+        calls_by_status[call["status"]] = calls_by_status.get(call["status"], 0) + 1
+        if call.get("sentiment"):
+            calls_by_sentiment[call["sentiment"]] = calls_by_sentiment.get(call["sentiment"], 0) + 1
+
+    return {
+        "total_calls": total_calls,
+        "successful_calls": successful_calls,
+        "failed_calls": calls_by_status.get("failed", 0),
+        "average_duration": sum(durations) / len(durations) if durations else 0,
+        "total_duration": sum(durations),
+        "calls_by_status": calls_by_status,
+        "calls_by_sentiment": calls_by_sentiment,
+        "success_rate": (successful_calls / total_calls * 100) if total_calls > 0 else 0,
+        "average_rating": sum(ratings) / len(ratings) if ratings else None,
+    }
+
 
 class SupabaseService:
     def __init__(self):
         self.db = get_supabase()
+        self._agent_owners: Dict[str, str] = {}
 
     # User Operations
     async def create_user_profile(
@@ -44,6 +113,7 @@ class SupabaseService:
         """Update user profile"""
         updates["updated_at"] = datetime.utcnow().isoformat()
         result = self.db.table("users").update(updates).eq("id", user_id).execute()
+        api_key_store.invalidate_user(user_id)
         return User(**result.data[0])
 
     async def update_user_subscription(
@@ -69,6 +139,7 @@ class SupabaseService:
         }
 
         result = self.db.table("users").update(updates).eq("id", user_id).execute()
+        api_key_store.invalidate_user(user_id)
         return User(**result.data[0])
 
     # Agent Operations
@@ -103,11 +174,24 @@ class SupabaseService:
             return Agent(**result.data[0])
         return None
 
+    async def get_agent_owner(self, agent_id: str) -> Optional[str]:
+        """User id owning an agent; cached, since agents never change owner"""
+        if agent_id not in self._agent_owners:
+            result = self.db.table("agents").select("user_id").eq("agent_id", agent_id).execute()
+            if not result.data:
+                return None
+            self._agent_owners[agent_id] = result.data[0]["user_id"]
+        return self._agent_owners[agent_id]
+
     # Conversation Operations
     async def create_conversation(self, conversation_data: Dict[str, Any]) -> Conversation:
-        """Store conversation from webhook"""
+        """Store conversation from webhook (a redelivered conversation keeps the stored row)"""
         conversation_data["created_at"] = datetime.utcnow().isoformat()
-        result = self.db.table("conversations").insert(conversation_data).execute()
+        result = self.db.table("conversations").upsert(
+            conversation_data, on_conflict="conversation_id", ignore_duplicates=True
+        ).execute()
+        if not result.data:
+            return await self.get_conversation_by_id(conversation_data["conversation_id"])
         return Conversation(**result.data[0])
 
     async def get_conversations(
@@ -115,8 +199,8 @@ class SupabaseService:
     ) -> List[Conversation]:
         """Get conversations for an agent"""
         result = (
-            self.db.table("conversations")
-            .select("*")
+            get_read_client().table("conversations")
+            .select(CONVERSATION_LIST_COLUMNS)
             .eq("agent_id", agent_id)
             .order("created_at", desc=True)
             .limit(limit)
@@ -126,12 +210,26 @@ class SupabaseService:
         return [Conversation(**conv) for conv in result.data]
 
     async def get_conversation_by_id(self, conversation_id: str) -> Optional[Conversation]:
-        """Get conversation by ID"""
-        result = self.db.table("conversations").select("*").eq("conversation_id", conversation_id).execute()
+        """Get conversation by ID (without the raw payload, see get_conversation_payload)"""
+        result = self.db.table("conversations").select(
+            CONVERSATION_LIST_COLUMNS + ", payload_key, turns_key"
+        ).eq("conversation_id", conversation_id).execute()
         if result.data:
             return Conversation(**result.data[0])
         return None
 
+    async def get_conversation_payload(self, conversation: Conversation) -> Optional[Dict[str, Any]]:
+        """Raw webhook payload: offloaded to blob storage, or inline for rows not yet migrated"""
+        if conversation.payload_key:
+            return await transcript_store.get_payload(conversation.payload_key)
+        if conversation.webhook_payload is not None:
+            return conversation.webhook_payload
+        # get_conversation_by_id leaves the inline column out
+        result = self.db.table("conversations").select("webhook_payload").eq(
+            "conversation_id", conversation.conversation_id
+        ).execute()
+        return result.data[0].get("webhook_payload") if result.data else None
+
     # Usage Tracking
     async def record_usage(
         self,
@@ -151,12 +249,23 @@ class SupabaseService:
             "created_at": datetime.utcnow().isoformat(),
         }
 
-        self.db.table("usage_records").insert(usage_data).execute()
+        # One usage record per conversation, even if the webhook is redelivered
+        self.db.table("usage_records").upsert(
+            usage_data, on_conflict="conversation_id", ignore_duplicates=True
+        ).execute()
 
     async def get_usage_for_period(
         self, user_id: str, period_start: date, period_end: date
     ) -> float:
         """Get total usage for billing period"""
+        if postgres.enabled:
+            row = await postgres.fetchrow(
+                "SELECT COALESCE(SUM(minutes_used), 0) AS total FROM public.usage_records "
+                "WHERE user_id = %s AND billing_period_start >= %s AND billing_period_end <= %s",
+                (user_id, period_start, period_end),
+            )
+            return float(row["total"])
+
         result = (
             self.db.table("usage_records")
             .select("minutes_used")
@@ -251,46 +360,191 @@ class SupabaseService:
 
     async def get_analytics_stats(self, agent_id: str, days: int = 7) -> Dict[str, Any]:
         """Get analytics statistics for an agent"""
-        from datetime import timedelta
-
         # Calculate date range
         end_date = datetime.utcnow()
         start_date = end_date - timedelta(days=days)
 
+        if postgres.enabled:
+            return await self._get_analytics_stats_direct(agent_id, start_date, end_date)
+
         # Get all conversations in the period
         result = (
-            self.db.table("conversations")
-            .select("*")
+            get_read_client().table("conversations")
+            .select("call_successful, duration_secs, sentiment")
             .eq("agent_id", agent_id)
             .gte("created_at", start_date.isoformat())
             .lte("created_at", end_date.isoformat())
             .execute()
         )
 
-        conversations = result.data
-        total_calls = len(conversations)
-        successful_calls = sum(1 for c in conversations if c.get('call_successful') == 'success')
-        total_duration_secs = sum(c.get('duration_secs', 0) or 0 for c in conversations)
-        total_minutes = total_duration_secs / 60.0 if total_duration_secs > 0 else 0
-        avg_duration_secs = total_duration_secs / total_calls if total_calls > 0 else 0
-
-        # Count sentiment breakdown
-        sentiment_breakdown = {}
-        for c in conversations:
-            sentiment = c.get('sentiment')
-            if sentiment:
-                sentiment_breakdown[sentiment] = sentiment_breakdown.get(sentiment, 0) + 1
+        return analytics_stats_from_rows(result.data)
+
+    async def _get_analytics_stats_direct(
+        self, agent_id: str, start_date: datetime, end_date: datetime
+    ) -> Dict[str, Any]:
+        """get_analytics_stats() aggregated in Postgres: one row per sentiment instead of every conversation"""
+        rows = await postgres.fetch(
+            """
+            SELECT sentiment,
+                   COUNT(*) AS calls,
+                   COUNT(*) FILTER (WHERE call_successful = 'success') AS successful,
+                   COALESCE(SUM(duration_secs), 0) AS duration_secs
+            FROM public.conversations
+            WHERE agent_id = %s AND created_at >= %s AND created_at <= %s
+            GROUP BY sentiment
+            """,
+            (agent_id, start_date, end_date),
+        )
+        total_calls = sum(r["calls"] for r in rows)
+        successful_calls = sum(r["successful"] for r in rows)
+        total_duration_secs = sum(r["duration_secs"] for r in rows)
 
         return {
             'total_calls': total_calls,
             'successful_calls': successful_calls,
             'failed_calls': total_calls - successful_calls,
-            'total_minutes': total_minutes,
-            'avg_duration_secs': avg_duration_secs,
-            'appointments_booked': 0,  # Would need to parse conversation data
-            'sentiment_breakdown': sentiment_breakdown
+            'total_minutes': total_duration_secs / 60.0,
+            'avg_duration_secs': total_duration_secs / total_calls if total_calls > 0 else 0,
+            'appointments_booked': 0,
+            'sentiment_breakdown': {r["sentiment"]: r["calls"] for r in rows if r["sentiment"]},
+        }
+
+    # Calls
+    async def get_call_stats(
+        self,
+        user_id: str,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        agent_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Call statistics for a user (fields of CallStatsResponse)"""
+        if postgres.enabled:
+            return await self._get_call_stats_direct(user_id, date_from, date_to, agent_id)
+
+        db = get_read_client(user_id)
+        query = db.table("calls").select(
+            "status, sentiment, call_successful, duration_secs"
+        ).eq("user_id", user_id)
+        if date_from:
+            query = query.gte("created_at", date_from.isoformat())
+        if date_to:
+            query = query.lte("created_at", (date_to + timedelta(days=1)).isoformat())
+        if agent_id:
+            query = query.eq("agent_id", agent_id)
+        calls = query.execute().data
+
+        feedback = db.table("call_feedback").select("rating").eq("user_id", user_id).execute()
+        ratings = [f["rating"] for f in feedback.data if f.get("rating")]
+
+        return call_stats_from_rows(calls, ratings)
+
+    async def _get_call_stats_direct(
+        self, user_id: str, date_from: Optional[date], date_to: Optional[date], agent_id: Optional[str]
+    ) -> Dict[str, Any]:
+        conditions, params = self._call_filters(user_id, date_from, date_to, agent_id)
+        rows = await postgres.fetch(
+            f"""
+            SELECT status, sentiment,
+                   COUNT(*) AS calls,
+                   COUNT(*) FILTER (WHERE call_successful) AS successful,
+                   COUNT(duration_secs) FILTER (WHERE duration_secs > 0) AS timed_calls,
+                   COALESCE(SUM(duration_secs) FILTER (WHERE duration_secs > 0), 0) AS duration_secs
+            FROM public.calls
+            WHERE {conditions}
+            GROUP BY status, sentiment
+            """,
+            params,
+        )
+        rating = await postgres.fetchrow(
+            "SELECT AVG(rating) AS average FROM public.call_feedback WHERE user_id = %s AND rating IS NOT NULL",
+            (user_id,),
+        )
+
+        total_calls = sum(r["calls"] for r in rows)
+        successful_calls = sum(r["successful"] for r in rows)
+        timed_calls = sum(r["timed_calls"] for r in rows)
+        total_duration = sum(r["duration_secs"] for r in rows)
+
+        calls_by_status = {}
+        calls_by_sentiment = {}
+        for r in rows:
+            calls_by_status[r["status"]] = calls_by_status.get(r["status"], 0) + r["calls"]
+            if r["sentiment"]:
+                calls_by_sentiment[r["sentiment"]] = calls_by_sentiment.get(r["sentiment"], 0) + r["calls"]
+
+        return {
+            "total_calls": total_calls,
+            "successful_calls": successful_calls,
+            "failed_calls": calls_by_status.get("failed", 0),
+            "average_duration": total_duration / timed_calls if timed_calls else 0,
+            "total_duration": total_duration,
+            "calls_by_status": calls_by_status,
+            "calls_by_sentiment": calls_by_sentiment,
+            "success_rate": (successful_calls / total_calls * 100) if total_calls > 0 else 0,
+            "average_rating": float(rating["average"]) if rating and rating["average"] is not None else None,
         }
 
+    @staticmethod
+    def _call_filters(
+        user_id: str, date_from: Optional[date], date_to: Optional[date], agent_id: Optional[str]
+    ):
+        """WHERE clause and parameters for a user's calls, as filtered by the /calls endpoints"""
+        conditions, params = ["user_id = %s"], [user_id]
+        if date_from:
+            conditions.append("created_at >= %s")
+            params.append(date_from)
+        if date_to:
+            conditions.append("created_at <= %s")
+            params.append(date_to + timedelta(days=1))
+        if agent_id:
+            conditions.append("agent_id = %s")
+            params.append(agent_id)
+        return " AND ".join(conditions), params
+
+    async def export_calls_csv(
+        self,
+        user_id: str,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        agent_id: Optional[str] = None,
+        page_size: int = 1000,
+    ):
+        """Stream a user's calls as CSV chunks: COPY over a direct connection, else PostgREST pages"""
+        if postgres.enabled:
+            conditions, params = self._call_filters(user_id, date_from, date_to, agent_id)
+            async for chunk in postgres.copy_csv(
+                f"SELECT {', '.join(CALL_EXPORT_COLUMNS)} FROM public.calls "
+                f"WHERE {conditions} ORDER BY created_at, id",
+                params,
+            ):
+                yield chunk
+            return
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CALL_EXPORT_COLUMNS)
+        db = get_read_client(user_id)
+        offset = 0
+        while True:
+            query = db.table("calls").select(", ".join(CALL_EXPORT_COLUMNS)).eq("user_id", user_id)
+            if date_from:
+                query = query.gte("created_at", date_from.isoformat())
+            if date_to:
+                query = query.lte("created_at", (date_to + timedelta(days=1)).isoformat())
+            if agent_id:
+                query = query.eq("agent_id", agent_id)
+            result = await execute_async(
+                query.order("created_at").order("id").range(offset, offset + page_size - 1)
+            )
+            for row in result.data:
+                writer.writerow([row.get(column) for column in CALL_EXPORT_COLUMNS])
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+            if len(result.data) < page_size:
+                return
+            offset += page_size
+
 
 # Singleton instance
 supabase_service = SupabaseService()
@@ -0,0 +1,127 @@
+"""
+Transcript parsing into conversation turns
+
+Turns are plain dicts (they are stored as JSON and served as-is):
+    {"speaker": "agent" | "customer", "text": str,
+     "start_secs": float | None, "end_secs": float | None, "duration_secs": float | None}
+
+Two inputs are supported:
+- the ElevenLabs post-call payload's `transcript` list
+  ({"role", "message", "time_in_call_secs"} items)
+- plain-text transcripts, one "Speaker: text" line per turn with an optional
+  "[mm:ss]" / "[hh:mm:ss]" prefix; lines without a speaker continue the
+  previous turn
+
+Parsing runs once when a conversation is ingested (see
+process_elevenlabs_conversation); the result is stored next to the transcript
+and the call detail endpoint serves it without reparsing.
+"""
+from typing import Optional, List, Dict, Any, Union
+import re
+
+SPEAKERS = {
+    "agent": "agent",
+    "ai": "agent",
+    "assistant": "agent",
+    "bot": "agent",
+    "user": "customer",
+    "customer": "customer",
+    "caller": "customer",
+    "human": "customer",
+}
+
+_LINE = re.compile(
+    r"^\s*(?:[\[(]?(?:(\d{1,2}):)?(\d{1,2}):(\d{2})(?:\.\d+)?[\])]?\s*[-–]?\s*)?"
+    r"([A-Za-z][\w ]{0,30}?)\s*:\s?(.*)$"
+)
+
+
+def normalize_speaker(role: Optional[str]) -> str:
+    role = (role or "").strip().lower()
+    return SPEAKERS.get(role, role or "unknown")
+
+
+def _fill_timing(turns: List[Dict[str, Any]], total_secs: Optional[float]):
+    """Each turn ends where the next one starts; the last one at the end of the call"""
+    for i, turn in enumerate(turns):
+        start = turn["start_secs"]
+        if start is None:
+            continue
+        end = turns[i + 1]["start_secs"] if i + 1 < len(turns) else total_secs
+        if end is not None and end >= start:
+            turn["end_secs"] = float(end)
+            turn["duration_secs"] = round(end - start, 3)
+
+
+def parse_elevenlabs_transcript(
+    items: List[Dict[str, Any]], total_secs: Optional[float] = None
+) -> List[Dict[str, Any]]:
+    turns = []
+    for item in items:
+        text = item.get("message")
+        if not text:
+            # Tool calls and other non-speech events
+            continue
+        start = item.get("time_in_call_secs")
+        turns.append({
+            "speaker": normalize_speaker(item.get("role")),
+            "text": text.strip(),
+            "start_secs": float(start) if start is not None else None,
+            "end_secs": None,
+            "duration_secs": None,
+        })
+    _fill_timing(turns, total_secs)
+    return turns
+
+
+def parse_text_transcript(text: str, total_secs: Optional[float] = None) -> List[Dict[str, Any]]:
+    turns = []
+    match = _LINE.match
+    for line in text.splitlines():
+        m = match(line)
+        speaker = m and SPEAKERS.get(m.group(4).strip().lower())
+        if not speaker:
+            # Continuation of the previous turn (or a line we can't attribute)
+            line = line.strip()
+            if line and turns:
+                turns[-1]["text"] += " " + line
+            continue
+
+        hours, minutes, seconds = m.group(1), m.group(2), m.group(3)
+        start = None
+        if seconds is not None:
+            start = float(int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds))
+        turns.append({
+            "speaker": speaker,
+            "text": m.group(5).strip(),
+            "start_secs": start,
+            "end_secs": None,
+            "duration_secs": None,
+        })
+    _fill_timing(turns, total_secs)
+    return turns
+
+
+def parse_transcript(
+    transcript: Union[str, List[Dict[str, Any]], None], total_secs: Optional[float] = None
+) -> List[Dict[str, Any]]:
+    """Parse either transcript shape; empty input gives no turns"""
+    if not transcript:
+        return []
+    if isinstance(transcript, str):
+        return parse_text_transcript(transcript, total_secs)
+    return parse_elevenlabs_transcript(transcript, total_secs)
+
+
+def render_transcript(turns: List[Dict[str, Any]]) -> str:
+    """Turns back to the plain-text form (readable, and parseable by parse_text_transcript)"""
+    lines = []
+    for turn in turns:
+        start = turn["start_secs"]
+        prefix = ""
+        if start is not None:
+            minutes, seconds = divmod(int(start), 60)
+            hours, minutes = divmod(minutes, 60)
+            prefix = f"[{hours:02d}:{minutes:02d}:{seconds:02d}] "
+        lines.append(f"{prefix}{turn['speaker'].capitalize()}: {turn['text']}")
+    return "\n".join(lines)
@@ -0,0 +1,141 @@
+"""
+Transcript and raw payload blob storage
+
+Full ElevenLabs webhook payloads and call transcripts can be hundreds of KB
+each. Keeping them inline made conversations/calls rows large, and every
+list, stats and analytics scan paid for them. They are stored gzip-compressed
+in the Supabase Storage bucket TRANSCRIPT_BUCKET instead, keyed by
+conversation ID, and the row keeps only the object key. Detail endpoints
+fetch blobs lazily; recently viewed ones are kept in an in-process LRU.
+"""
+from typing import Optional, List, Dict, Any
+from collections import OrderedDict
+from app.config import settings
+from app.database import get_supabase
+import asyncio
+import gzip
+import json
+import logging
+
+try:
+    from orjson import dumps as _json_dumps, loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+    def _json_dumps(value) -> bytes:
+        return json.dumps(value, separators=(",", ":")).encode()
+
+logger = logging.getLogger(__name__)
+
+# Compressed once per call on the webhook path, so favour speed over ratio
+GZIP_LEVEL = 5
+
+
+def payload_key(conversation_id: str) -> str:
+    return f"conversations/{conversation_id}/payload.json.gz"
+
+
+def transcript_key(conversation_id: str) -> str:
+    return f"conversations/{conversation_id}/transcript.txt.gz"
+
+
+def turns_key(conversation_id: str) -> str:
+    return f"conversations/{conversation_id}/turns.json.gz"
+
+
+class TranscriptStore:
+    def __init__(self, bucket: str = "transcripts", cache_size: int = 256):
+        self.bucket = bucket
+        self.cache_size = cache_size
+        self.db = get_supabase()
+        self._cache: OrderedDict = OrderedDict()
+
+    # Cache
+    def _cache_get(self, key: str):
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        return None
+
+    def _cache_put(self, key: str, value):
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    # Raw blobs
+    async def _put(self, key: str, data: bytes):
+        compressed = await asyncio.to_thread(gzip.compress, data, GZIP_LEVEL)
+        await asyncio.to_thread(
+            self.db.storage.from_(self.bucket).upload,
+            key,
+            compressed,
+            {"content-type": "application/gzip", "upsert": "true"},
+        )
+
+    async def _get(self, key: str) -> bytes:
+        compressed = await asyncio.to_thread(self.db.storage.from_(self.bucket).download, key)
+        return await asyncio.to_thread(gzip.decompress, compressed)
+
+    async def _get_json(self, key: Optional[str]):
+        if not key:
+            return None
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+        try:
+            value = json_loads(await self._get(key))
+        except Exception as e:
+            logger.error(f"Failed to load {key}: {e}")
+            return None
+        self._cache_put(key, value)
+        return value
+
+    # Payloads
+    async def put_payload(self, conversation_id: str, payload: Dict[str, Any]) -> str:
+        """Store a webhook payload; returns its key"""
+        key = payload_key(conversation_id)
+        await self._put(key, _json_dumps(payload))
+        return key
+
+    async def get_payload(self, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        return await self._get_json(key)
+
+    # Parsed conversation turns (see transcript_parser)
+    async def put_turns(self, conversation_id: str, turns: List[Dict[str, Any]]) -> str:
+        """Store parsed turns; returns their key"""
+        key = turns_key(conversation_id)
+        await self._put(key, _json_dumps(turns))
+        return key
+
+    async def get_turns(self, key: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+        return await self._get_json(key)
+
+    # Transcripts
+    async def put_transcript(self, conversation_id: str, transcript: str) -> str:
+        """Store a call transcript; returns its key"""
+        key = transcript_key(conversation_id)
+        await self._put(key, transcript.encode())
+        self._cache_put(key, transcript)
+        return key
+
+    async def get_transcript(self, key: Optional[str]) -> Optional[str]:
+        if not key:
+            return None
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+        try:
+            transcript = (await self._get(key)).decode()
+        except Exception as e:
+            logger.error(f"Failed to load transcript {key}: {e}")
+            return None
+        self._cache_put(key, transcript)
+        return transcript
+
+
+# Singleton instance
+transcript_store = TranscriptStore(
+    bucket=settings.TRANSCRIPT_BUCKET,
+    cache_size=settings.TRANSCRIPT_CACHE_SIZE,
+)
@@ -0,0 +1,120 @@
+"""
+Customer webhook outbox
+
+Events for customers' registered webhook_endpoints (call.completed,
+appointment.booked, usage.recorded) are published here and delivered by
+app/workers/webhook_delivery.py. Publishing only writes outbox rows, one per
+subscribed endpoint, through a BatchWriter, so a burst of events costs a few
+multi-row inserts and no HTTP calls on the request path. Users without
+subscribed endpoints cost a cache lookup.
+
+Outbox row ids are derived from the event id and endpoint, so publishing
+the same event again (e.g. from a redelivered provider webhook) is a no-op.
+
+Each user's active endpoints are cached per process for
+WEBHOOK_ENDPOINT_CACHE_SECONDS. The settings routes invalidate the cache only
+in the worker that served them, so other workers can keep publishing to a
+deleted or disabled endpoint, or miss a new or re-enabled one, for up to that
+long.
+"""
+from typing import Optional, List, Dict, Any, Callable
+from datetime import datetime
+from app.config import settings
+from app.database import get_supabase, execute_async
+from app.services.batch_writer import BatchWriter
+import asyncio
+import logging
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = ("call.completed", "appointment.booked", "usage.recorded")
+
+
+def outbox_id(event_id: str, endpoint_id: str) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{event_id}/{endpoint_id}"))
+
+
+def subscribes(endpoint: Dict[str, Any], event_type: str) -> bool:
+    events = endpoint.get("events") or []
+    return event_type in events or "*" in events
+
+
+class WebhookOutbox:
+    def __init__(self, endpoint_cache_seconds: float = 30):
+        self.endpoint_cache_seconds = endpoint_cache_seconds
+        self.db = get_supabase()
+        self.writer = BatchWriter(
+            "webhook_outbox",
+            on_conflict="id",
+            max_rows=settings.BATCH_WRITE_MAX_ROWS,
+            max_delay_ms=settings.BATCH_WRITE_MAX_DELAY_MS,
+        )
+        # user_id -> (active endpoints, fetched at)
+        self._endpoints: Dict[str, tuple] = {}
+        # Set by the in-process delivery worker so new events go out without waiting for a poll
+        self.on_publish: Optional[Callable[[], None]] = None
+
+    async def stop(self):
+        await self.writer.stop()
+
+    async def _active_endpoints(self, user_id: str) -> List[Dict[str, Any]]:
+        cached = self._endpoints.get(user_id)
+        if cached and time.monotonic() - cached[1] < self.endpoint_cache_seconds:
+            return cached[0]
+        result = await execute_async(
+            self.db.table("webhook_endpoints").select("id, events")
+            .eq("user_id", user_id).eq("is_active", True)
+        )
+        endpoints = result.data or []
+        self._endpoints[user_id] = (endpoints, time.monotonic())
+        return endpoints
+
+    def invalidate_user(self, user_id: str):
+        """Forget cached endpoints after they were created, changed or deleted"""
+        self._endpoints.pop(user_id, None)
+
+    async def publish(self, user_id: str, event_type: str, event_id: str, data: Dict[str, Any]) -> int:
+        """
+        Queue an event for every endpoint of the user that subscribes to it
+
+        Returns once the outbox rows are stored (or raises). `event_id` must be
+        stable for the event, e.g. "call.completed:<conversation_id>".
+        Returns the number of endpoints the event was queued for.
+        """
+        endpoints = [e for e in await self._active_endpoints(user_id) if subscribes(e, event_type)]
+        if not endpoints:
+            return 0
+
+        payload = {
+            "id": event_id,
+            "type": event_type,
+            "created_at": datetime.utcnow().isoformat() + "Z",
+            "data": data,
+        }
+        await asyncio.gather(*(
+            self.writer.write({
+                "id": outbox_id(event_id, endpoint["id"]),
+                "endpoint_id": endpoint["id"],
+                "user_id": user_id,
+                "event_type": event_type,
+                "payload": payload,
+            })
+            for endpoint in endpoints
+        ))
+
+        if self.on_publish:
+            self.on_publish()
+        return len(endpoints)
+
+    async def publish_safely(self, user_id: str, event_type: str, event_id: str, data: Dict[str, Any]):
+        """publish() for callers whose own work already succeeded: failures are logged, not raised"""
+        try:
+            await self.publish(user_id, event_type, event_id, data)
+        except Exception as e:
+            logger.error(f"Failed to queue {event_type} webhook {event_id} for user {user_id}: {e}")
+
+
+# Singleton instance
+webhook_outbox = WebhookOutbox(endpoint_cache_seconds=settings.WEBHOOK_ENDPOINT_CACHE_SECONDS)
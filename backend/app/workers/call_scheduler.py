@@ -0,0 +1,324 @@
+"""
+Scheduled outbound call executor
+
+Claims pending calls that come due within a short lookahead window through
+the claim_due_calls() database function, which holds a lease per call and
+respects each tenant's UserFeatures.concurrent_calls cap. Claimed calls wait
+in an in-memory heap ordered by due time and are dialled when they come due.
+Their leases are renewed on every poll while they wait, and retaken with a
+conditional update just before dialling: a call whose lease another worker
+has taken over is dropped instead of dialled twice. A placed call is marked
+ringing; the provider's status webhook moves it on from there.
+Failed dial attempts are retried with jittered exponential backoff, pushed
+into the callee's local calling hours.
+
+Disabled by default (CALL_SCHEDULER_ENABLED): it places real calls through
+ElevenLabs, so enable it once ELEVENLABS_API_KEY and
+ELEVENLABS_AGENT_PHONE_NUMBER_ID are configured.
+
+Runs inside the API process (see app.main startup) or standalone:
+    python -m app.workers.call_scheduler
+"""
+from typing import Optional, List, Dict, Any, Set, Tuple
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from app.config import settings
+from app.database import get_supabase, execute_async
+from app.schemas.calls import CallStatus
+from app.services.elevenlabs_service import elevenlabs_service
+from app.services.retry import backoff_delay
+from app.services.call_state import call_state, call_status_callback_url
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import socket
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+def call_timezone(call: Dict[str, Any]) -> ZoneInfo:
+    """The callee's timezone from call metadata, defaulting to UTC"""
+    tz_name = (call.get("metadata") or {}).get("timezone") or "UTC"
+    try:
+        return ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo("UTC")
+
+
+def to_utc(value: datetime, tz: ZoneInfo) -> datetime:
+    """Interpret naive datetimes as local time in `tz` and convert to UTC"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=tz)
+    return value.astimezone(timezone.utc)
+
+
+def due_time(call: Dict[str, Any]) -> datetime:
+    return to_utc(datetime.fromisoformat(call["scheduled_at"]), call_timezone(call))
+
+
+class CallScheduler:
+    def __init__(
+        self,
+        poll_interval_seconds: float = 5,
+        lookahead_seconds: int = 60,
+        batch_size: int = 100,
+        lease_seconds: int = 180,
+        max_concurrency: int = 50,
+        max_attempts: int = 3,
+        retry_base_seconds: float = 60,
+        calling_hours: Tuple[int, int] = (8, 21),
+    ):
+        self.poll_interval_seconds = poll_interval_seconds
+        self.lookahead_seconds = lookahead_seconds
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.calling_hours = calling_hours
+
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.db = get_supabase()
+
+        # (due_at, seq, call) - seq keeps ordering stable for equal due times
+        self._heap: List[Tuple[datetime, int, Dict[str, Any]]] = []
+        self._seq = itertools.count()
+        self._queued_ids: Set[str] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._in_flight: Set[asyncio.Task] = set()
+        self._tasks: List[asyncio.Task] = []
+
+    # Lifecycle
+    def start(self):
+        """Run the poll and dispatch loops as background tasks"""
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._tasks = [
+            asyncio.create_task(self._poll_loop(), name="call-scheduler-poll"),
+            asyncio.create_task(self._dispatch_loop(), name="call-scheduler-dispatch"),
+        ]
+        logger.info(f"Call scheduler {self.worker_id} started")
+
+    async def stop(self):
+        """Stop polling, let in-flight dials finish and hand queued calls back"""
+        if not self._tasks:
+            return
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+        await self._release([call["id"] for _, _, call in self._heap])
+        self._heap.clear()
+        self._queued_ids.clear()
+
+    # Claiming
+    async def _poll_loop(self):
+        while True:
+            try:
+                await self.poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Call scheduler poll failed: {e}")
+            await asyncio.sleep(self.poll_interval_seconds)
+
+    async def poll_once(self) -> int:
+        """Renew the leases of queued calls and claim due calls into the local heap. Returns the number claimed."""
+        await self._renew_queued()
+
+        result = await execute_async(self.db.rpc("claim_due_calls", {
+            "p_worker_id": self.worker_id,
+            "p_lookahead_seconds": self.lookahead_seconds,
+            "p_batch_size": self.batch_size,
+            "p_lease_seconds": self.lease_seconds,
+        }))
+
+        claimed = 0
+        for call in result.data or []:
+            if call["id"] in self._queued_ids:
+                continue
+            heapq.heappush(self._heap, (due_time(call), next(self._seq), call))
+            self._queued_ids.add(call["id"])
+            claimed += 1
+
+        if claimed:
+            self._wakeup.set()
+        return claimed
+
+    def _lease_values(self) -> Dict[str, Any]:
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.lease_seconds)
+        return {"lease_expires_at": expires_at.isoformat()}
+
+    async def _renew_queued(self):
+        """Extend the leases of calls waiting in the heap; drop the ones this worker no longer holds"""
+        if not self._queued_ids:
+            return
+        result = await execute_async(
+            self.db.table("calls").update(self._lease_values())
+            .in_("id", list(self._queued_ids))
+            .eq("lease_owner", self.worker_id)
+            .eq("status", CallStatus.PENDING.value)
+        )
+        held = {row["id"] for row in result.data or []}
+        lost = self._queued_ids - held
+        if lost:
+            logger.warning(f"Lost the lease on {len(lost)} queued calls, dropping them")
+            self._heap = [entry for entry in self._heap if entry[2]["id"] not in lost]
+            heapq.heapify(self._heap)
+            self._queued_ids -= lost
+
+    async def _retake(self, call: Dict[str, Any]) -> bool:
+        """Extend the lease right before dialling; False if another worker took the call over"""
+        result = await execute_async(
+            self.db.table("calls").update(self._lease_values())
+            .eq("id", call["id"])
+            .eq("lease_owner", self.worker_id)
+            .eq("status", CallStatus.PENDING.value)
+        )
+        return bool(result.data)
+
+    async def _release(self, call_ids: List[str]):
+        if not call_ids:
+            return
+        await execute_async(
+            self.db.table("calls").update({
+                "lease_owner": None,
+                "lease_expires_at": None,
+            }).in_("id", call_ids).eq("lease_owner", self.worker_id)
+        )
+
+    # Dispatching
+    async def _dispatch_loop(self):
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            wait = (self._heap[0][0] - datetime.now(timezone.utc)).total_seconds()
+            if wait > 0:
+                # Sleep until the earliest call is due, or until a new claim arrives
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, _, call = heapq.heappop(self._heap)
+            self._queued_ids.discard(call["id"])
+
+            await self._slots.acquire()
+            task = asyncio.create_task(self._execute(call))
+            self._in_flight.add(task)
+            task.add_done_callback(self._on_done)
+
+    def _on_done(self, task: asyncio.Task):
+        self._in_flight.discard(task)
+        self._slots.release()
+
+    async def _execute(self, call: Dict[str, Any]):
+        try:
+            await self._dial(call)
+        except Exception as e:
+            logger.error(f"Scheduled call {call['id']} could not be updated: {e}")
+
+    async def _dial(self, call: Dict[str, Any]):
+        if not await self._retake(call):
+            logger.warning(f"Scheduled call {call['id']} was taken over by another worker, not dialling it")
+            return
+
+        attempts = (call.get("attempts") or 0) + 1
+        try:
+            external_call_id = await elevenlabs_service.initiate_call(
+                phone_number=call["phone_number"],
+                agent_id=call["agent_id"],
+                callback_url=call_status_callback_url(),
+            )
+        except Exception as e:
+            await self._retry_or_fail(call, attempts, str(e))
+            return
+
+        # Placed, not answered: the status webhook moves it to in_progress
+        await call_state.transition(
+            CallStatus.RINGING,
+            call_id=call["id"],
+            where={"lease_owner": self.worker_id},
+            values={
+                "external_call_id": external_call_id,
+                "attempts": attempts,
+                "lease_owner": None,
+                "lease_expires_at": None,
+            },
+        )
+
+    async def _retry_or_fail(self, call: Dict[str, Any], attempts: int, error: str):
+        update = {
+            "attempts": attempts,
+            "error_message": error,
+            "lease_owner": None,
+            "lease_expires_at": None,
+        }
+
+        if attempts >= self.max_attempts:
+            logger.warning(f"Scheduled call {call['id']} failed after {attempts} attempts: {error}")
+            await call_state.transition(
+                CallStatus.FAILED, call_id=call["id"], where={"lease_owner": self.worker_id}, values=update
+            )
+            return
+
+        update["scheduled_at"] = self.next_attempt_at(call, attempts).isoformat()
+        await execute_async(
+            self.db.table("calls").update(update).eq("id", call["id"]).eq("lease_owner", self.worker_id)
+        )
+
+    def next_attempt_at(self, call: Dict[str, Any], attempts: int) -> datetime:
+        """Jittered backoff from now, moved into the callee's local calling hours"""
+        delay = backoff_delay(attempts - 1, base=self.retry_base_seconds, cap=3600, min_ratio=0.5)
+        tz = call_timezone(call)
+        local = (datetime.now(timezone.utc) + timedelta(seconds=delay)).astimezone(tz)
+
+        start_hour, end_hour = self.calling_hours
+        if local.hour < start_hour:
+            local = local.replace(hour=start_hour, minute=0, second=0, microsecond=0)
+        elif local.hour >= end_hour:
+            local = (local + timedelta(days=1)).replace(hour=start_hour, minute=0, second=0, microsecond=0)
+
+        return local.astimezone(timezone.utc)
+
+
+# Singleton instance
+call_scheduler = CallScheduler(
+    poll_interval_seconds=settings.CALL_SCHEDULER_POLL_INTERVAL_SECONDS,
+    lookahead_seconds=settings.CALL_SCHEDULER_LOOKAHEAD_SECONDS,
+    batch_size=settings.CALL_SCHEDULER_BATCH_SIZE,
+    lease_seconds=settings.CALL_SCHEDULER_LEASE_SECONDS,
+    max_concurrency=settings.CALL_SCHEDULER_MAX_CONCURRENCY,
+    max_attempts=settings.CALL_SCHEDULER_MAX_ATTEMPTS,
+    retry_base_seconds=settings.CALL_SCHEDULER_RETRY_BASE_SECONDS,
+    calling_hours=(settings.CALL_WINDOW_START_HOUR, settings.CALL_WINDOW_END_HOUR),
+)
+
+
+async def main():
+    call_scheduler.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await call_scheduler.stop()
+        await elevenlabs_service.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
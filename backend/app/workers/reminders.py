@@ -0,0 +1,225 @@
+"""
+Appointment reminder worker
+
+Polls for appointments starting within the lookahead window, claims them
+atomically through the claim_due_reminders() database function (so several
+workers can run side by side without double-sending), sends SMS and email
+reminders concurrently, and marks delivered reminders in batched updates.
+
+Email and SMS delivery are recorded separately (reminder_email_sent_at,
+reminder_sent), so an appointment re-claimed after a failed SMS doesn't get
+its email again. A claimed batch is only marked sent once every SMS in it
+is delivered, at SMS_RATE_PER_SECOND from one sender number, so the batch
+size is capped to what can go out in half the lease; otherwise the lease
+would expire mid-batch and another worker would send the rest again.
+
+Runs inside the API process (see app.main startup) or standalone:
+    python -m app.workers.reminders
+"""
+from typing import Optional, List, Dict, Any
+from datetime import datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from app.config import settings
+from app.database import get_supabase, execute_async
+from app.services.email_service import email_service
+from app.services.sms_service import sms_service
+import asyncio
+import logging
+import os
+import socket
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Keep `id IN (...)` filters comfortably inside URL length limits
+UPDATE_CHUNK_SIZE = 200
+
+# Share of the lease a batch's SMS may take at the sender's rate; the rest
+# is headroom for retries and throttling
+LEASE_HEADROOM = 0.5
+
+
+class ReminderWorker:
+    def __init__(
+        self,
+        lookahead_minutes: int = 120,
+        poll_interval_seconds: float = 30,
+        batch_size: int = 150,
+        lease_seconds: int = 300,
+        sms_rate_per_second: float = 1.0,
+    ):
+        self.lookahead_minutes = lookahead_minutes
+        self.poll_interval_seconds = poll_interval_seconds
+        self.lease_seconds = lease_seconds
+
+        max_batch = max(1, int(lease_seconds * sms_rate_per_second * LEASE_HEADROOM))
+        if batch_size > max_batch:
+            logger.warning(
+                f"REMINDER_BATCH_SIZE {batch_size} can't be sent within the {lease_seconds}s lease "
+                f"at {sms_rate_per_second} SMS/s, using {max_batch}"
+            )
+        self.batch_size = min(batch_size, max_batch)
+
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.db = get_supabase()
+        self._business_names: Dict[str, str] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    # Lifecycle
+    def start(self):
+        """Run the poll loop as a background task on the current event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run_forever(), name="reminder-worker")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_forever(self):
+        logger.info(f"Reminder worker {self.worker_id} started")
+        while True:
+            try:
+                sent = await self.run_once()
+                if sent:
+                    logger.info(f"Sent {sent} appointment reminders")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Reminder worker poll failed: {e}")
+            await asyncio.sleep(self.poll_interval_seconds)
+
+    async def run_once(self) -> int:
+        """Drain every currently due reminder. Returns the number delivered."""
+        return await sms_service.drain_due_reminders(
+            fetch_due=self._fetch_due,
+            on_sent=self._on_sms_sent,
+            batch_size=self.batch_size,
+        )
+
+    # Claiming
+    async def _claim(self, batch_size: int) -> List[Dict[str, Any]]:
+        result = await execute_async(self.db.rpc("claim_due_reminders", {
+            "p_worker_id": self.worker_id,
+            "p_lookahead_seconds": self.lookahead_minutes * 60,
+            "p_batch_size": batch_size,
+            "p_lease_seconds": self.lease_seconds,
+        }))
+        return result.data or []
+
+    async def _fetch_due(self, batch_size: int) -> List[Dict[str, Any]]:
+        """
+        Claim the next batch and queue its emails
+
+        Returns the reminders that still need an SMS. Email-only appointments
+        are marked sent here, so keep claiming until there is SMS work or
+        nothing is due.
+        """
+        while True:
+            appointments = await self._claim(batch_size)
+            if not appointments:
+                return []
+
+            await self._load_business_names({a["user_id"] for a in appointments})
+
+            reminders = []
+            emailed_ids = []
+            email_only_ids = []
+            for appointment in appointments:
+                reminder = self._to_reminder(appointment)
+
+                if appointment.get("attendee_email") and not appointment.get("reminder_email_sent_at"):
+                    queued = await email_service.send_appointment_reminder(
+                        to_email=appointment["attendee_email"],
+                        patient_name=reminder["patient_name"],
+                        appointment_date=reminder["appointment_date"],
+                        appointment_time=reminder["appointment_time"],
+                        business_name=reminder["business_name"],
+                    )
+                    if queued:
+                        emailed_ids.append(appointment["id"])
+
+                if appointment.get("attendee_phone"):
+                    reminders.append(reminder)
+                else:
+                    email_only_ids.append(appointment["id"])
+
+            await self._mark_emailed(emailed_ids)
+            await self._mark_sent(email_only_ids)
+
+            if reminders:
+                return reminders
+
+    async def _on_sms_sent(self, reminders: List[Dict[str, Any]], sids: List[Optional[str]]):
+        """Mark delivered reminders in one update; failed ones retry once their lease expires"""
+        sent_ids = [reminder["id"] for reminder, sid in zip(reminders, sids) if sid]
+        failed = len(reminders) - len(sent_ids)
+        if failed:
+            logger.warning(f"{failed} reminder SMS failed, will retry after lease expiry")
+        await self._mark_sent(sent_ids)
+
+    async def _mark_sent(self, appointment_ids: List[str]):
+        sent_at = datetime.utcnow().isoformat()
+        await self._update(appointment_ids, {"reminder_sent": True, "reminder_sent_at": sent_at})
+
+    async def _mark_emailed(self, appointment_ids: List[str]):
+        await self._update(appointment_ids, {"reminder_email_sent_at": datetime.utcnow().isoformat()})
+
+    async def _update(self, appointment_ids: List[str], values: Dict[str, Any]):
+        for i in range(0, len(appointment_ids), UPDATE_CHUNK_SIZE):
+            await execute_async(
+                self.db.table("appointments").update(values)
+                .in_("id", appointment_ids[i:i + UPDATE_CHUNK_SIZE]).eq("reminder_claimed_by", self.worker_id)
+            )
+
+    # Helpers
+    async def _load_business_names(self, user_ids: set):
+        missing = [user_id for user_id in user_ids if user_id not in self._business_names]
+        if not missing:
+            return
+
+        result = await execute_async(
+            self.db.table("users").select("id, company_name").in_("id", missing)
+        )
+        for row in result.data:
+            self._business_names[row["id"]] = row.get("company_name") or "Healthcare Practice"
+
+    def _to_reminder(self, appointment: Dict[str, Any]) -> Dict[str, Any]:
+        start = datetime.fromisoformat(appointment["start_time"])
+        try:
+            start = start.astimezone(ZoneInfo(appointment.get("timezone") or "UTC"))
+        except (ZoneInfoNotFoundError, ValueError):
+            pass
+
+        return {
+            "id": appointment["id"],
+            "to_phone": appointment.get("attendee_phone"),
+            "patient_name": appointment.get("attendee_name") or "there",
+            "appointment_date": start.strftime("%B %d, %Y"),
+            "appointment_time": start.strftime("%I:%M %p").lstrip("0"),
+            "business_name": self._business_names.get(appointment["user_id"], "Healthcare Practice"),
+        }
+
+
+# Singleton instance
+reminder_worker = ReminderWorker(
+    lookahead_minutes=settings.REMINDER_LOOKAHEAD_MINUTES,
+    poll_interval_seconds=settings.REMINDER_POLL_INTERVAL_SECONDS,
+    batch_size=settings.REMINDER_BATCH_SIZE,
+    lease_seconds=settings.REMINDER_LEASE_SECONDS,
+    sms_rate_per_second=settings.SMS_RATE_PER_SECOND,
+)
+
+
+async def main():
+    try:
+        await reminder_worker.run_forever()
+    finally:
+        await sms_service.stop()
+        await email_service.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+"""
+Transcript storage backfill
+
+One-off job that moves inline conversations.webhook_payload and
+calls.transcript values into blob storage (see
+app/services/transcript_store.py), sets the row's key and clears the inline
+column. Call transcripts are also parsed into turns (see
+app/services/transcript_parser.py), including ones offloaded before turns
+existed. Rows are processed in batches and each row is committed on its own,
+so the job can be interrupted and rerun safely.
+
+    python -m app.workers.transcript_backfill [--batch-size 100]
+"""
+from app.database import get_supabase, execute_async
+from app.services.transcript_store import transcript_store
+from app.services.transcript_parser import parse_text_transcript
+import argparse
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def backfill_conversations(batch_size: int) -> int:
+    db = get_supabase()
+    moved = 0
+    while True:
+        result = await execute_async(
+            db.table("conversations").select("id, conversation_id, webhook_payload")
+            .not_.is_("webhook_payload", "null")
+            .limit(batch_size)
+        )
+        if not result.data:
+            return moved
+        for row in result.data:
+            key = await transcript_store.put_payload(row["conversation_id"], row["webhook_payload"])
+            await execute_async(
+                db.table("conversations").update({"payload_key": key, "webhook_payload": None})
+                .eq("id", row["id"])
+            )
+            moved += 1
+        logger.info(f"Moved {moved} conversation payloads")
+
+
+async def backfill_calls(batch_size: int) -> int:
+    db = get_supabase()
+    moved = 0
+    while True:
+        result = await execute_async(
+            db.table("calls").select("id, external_call_id, transcript, duration_secs")
+            .not_.is_("transcript", "null")
+            .limit(batch_size)
+        )
+        if not result.data:
+            return moved
+        for row in result.data:
+            # Calls that never reached ElevenLabs have no conversation ID
+            key_id = row["external_call_id"] or row["id"]
+            turns = parse_text_transcript(row["transcript"], row["duration_secs"])
+            update = {
+                "transcript_key": await transcript_store.put_transcript(key_id, row["transcript"]),
+                "turns_key": await transcript_store.put_turns(key_id, turns),
+                "transcript": None,
+            }
+            await execute_async(db.table("calls").update(update).eq("id", row["id"]))
+            moved += 1
+        logger.info(f"Moved {moved} call transcripts")
+
+
+async def backfill_call_turns(batch_size: int) -> int:
+    """Parse transcripts that were offloaded before turns were stored"""
+    db = get_supabase()
+    parsed = 0
+    while True:
+        result = await execute_async(
+            db.table("calls").select("id, external_call_id, transcript_key, duration_secs")
+            .not_.is_("transcript_key", "null")
+            .is_("turns_key", "null")
+            .limit(batch_size)
+        )
+        if not result.data:
+            return parsed
+        for row in result.data:
+            transcript = await transcript_store.get_transcript(row["transcript_key"]) or ""
+            turns = parse_text_transcript(transcript, row["duration_secs"])
+            key = await transcript_store.put_turns(row["external_call_id"] or row["id"], turns)
+            await execute_async(db.table("calls").update({"turns_key": key}).eq("id", row["id"]))
+            parsed += 1
+        logger.info(f"Parsed {parsed} call transcripts")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Move inline payloads and transcripts to blob storage")
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    conversations = await backfill_conversations(args.batch_size)
+    calls = await backfill_calls(args.batch_size)
+    turns = await backfill_call_turns(args.batch_size)
+    logger.info(
+        f"Backfill done: {conversations} conversation payloads, {calls} call transcripts, "
+        f"{turns} transcripts parsed"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
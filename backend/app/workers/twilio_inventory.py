@@ -0,0 +1,211 @@
+"""
+Twilio number inventory sync
+
+Mirrors the account's incoming phone numbers into the twilio_numbers table so
+/phone-numbers/owned is served from the database. Each sweep pages through
+Twilio one page at a time, upserts only numbers whose date_updated changed
+since the last sweep, and deletes mirror rows for numbers no longer in the
+account (only numbers the mirror held when the sweep started: one bought
+mid-sweep isn't on the pages already read).
+
+Every API worker runs this loop, but only the holder of the
+"twilio_inventory" lease (acquire_worker_lease(), see
+migrations/008_twilio_inventory.sql) sweeps; the others skip, so Twilio is
+listed once per interval rather than once per worker. The lease outlives
+two intervals, so another worker takes over if the holder goes away.
+
+Runs inside the API process (see app.main startup) or standalone:
+    python -m app.workers.twilio_inventory
+"""
+from typing import Optional, List, Dict, Any
+from datetime import datetime
+from app.config import settings
+from app.database import get_supabase, execute_async
+from app.services.registry import twilio_client
+import asyncio
+import logging
+import os
+import socket
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Keep `IN (...)` filters comfortably inside URL length limits
+DELETE_CHUNK_SIZE = 200
+
+LEASE_NAME = "twilio_inventory"
+
+
+def to_mirror_row(number) -> Dict[str, Any]:
+    """Twilio IncomingPhoneNumber -> twilio_numbers row"""
+    capabilities = number.capabilities or {}
+    return {
+        "phone_number_sid": number.sid,
+        "phone_number": number.phone_number,
+        "friendly_name": number.friendly_name,
+        "capabilities": {
+            "voice": bool(capabilities.get("voice")),
+            "sms": bool(capabilities.get("sms") or capabilities.get("SMS")),
+            "mms": bool(capabilities.get("mms") or capabilities.get("MMS")),
+        },
+        "voice_url": number.voice_url,
+        "twilio_created_at": number.date_created.isoformat() if number.date_created else None,
+        "twilio_updated_at": number.date_updated.isoformat() if number.date_updated else None,
+    }
+
+
+class TwilioInventorySync:
+    def __init__(self, interval_seconds: float = 300, page_size: int = 1000):
+        self.interval_seconds = interval_seconds
+        self.page_size = page_size
+
+        self.client = twilio_client
+        self.db = get_supabase()
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        # phone_number_sid -> twilio_updated_at of what the mirror currently holds
+        self._known: Optional[Dict[str, Optional[str]]] = None
+        self._leading = False
+        self._task: Optional[asyncio.Task] = None
+
+    # Lifecycle
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run_forever(), name="twilio-inventory-sync")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_forever(self):
+        while True:
+            try:
+                if await self._acquire_lease():
+                    await self.sync_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Twilio inventory sync failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    async def _acquire_lease(self) -> bool:
+        result = await execute_async(self.db.rpc("acquire_worker_lease", {
+            "p_name": LEASE_NAME,
+            "p_owner": self.worker_id,
+            "p_lease_seconds": int(self.interval_seconds * 2),
+        }))
+        leading = bool(result.data)
+        if leading and not self._leading:
+            # The previous leader's sweeps changed the mirror behind our back
+            logger.info(f"Twilio inventory sync {self.worker_id} is now sweeping")
+            self._known = None
+        self._leading = leading
+        return leading
+
+    # Sync
+    async def _load_known(self) -> Dict[str, Optional[str]]:
+        known = {}
+        offset = 0
+        while True:
+            result = await execute_async(
+                self.db.table("twilio_numbers").select("phone_number_sid, twilio_updated_at")
+                .order("phone_number_sid")
+                .range(offset, offset + self.page_size - 1)
+            )
+            for row in result.data:
+                known[row["phone_number_sid"]] = row.get("twilio_updated_at")
+            if len(result.data) < self.page_size:
+                return known
+            offset += self.page_size
+
+    async def sync_once(self) -> Dict[str, int]:
+        """Run one full sweep. Returns counts of upserted, unchanged and removed numbers."""
+        if self._known is None:
+            self._known = await self._load_known()
+        # Numbers upserted by provisioning during the sweep aren't in `seen`
+        known_at_start = set(self._known)
+
+        started = datetime.utcnow()
+        seen = set()
+        upserted = unchanged = 0
+
+        page = await asyncio.to_thread(self.client.incoming_phone_numbers.page, page_size=self.page_size)
+        while page is not None:
+            changed = []
+            for number in page:
+                row = to_mirror_row(number)
+                seen.add(row["phone_number_sid"])
+                if self._is_current(row):
+                    unchanged += 1
+                else:
+                    changed.append(row)
+
+            if changed:
+                synced_at = datetime.utcnow().isoformat()
+                for row in changed:
+                    row["synced_at"] = synced_at
+                await execute_async(
+                    self.db.table("twilio_numbers").upsert(changed, on_conflict="phone_number_sid")
+                )
+                for row in changed:
+                    self._known[row["phone_number_sid"]] = row["twilio_updated_at"]
+                upserted += len(changed)
+
+            page = await asyncio.to_thread(page.next_page)
+
+        removed = [sid for sid in known_at_start if sid not in seen]
+        await self.remove(removed)
+
+        elapsed = (datetime.utcnow() - started).total_seconds()
+        logger.info(
+            f"Twilio inventory synced in {elapsed:.1f}s: "
+            f"{upserted} upserted, {unchanged} unchanged, {len(removed)} removed"
+        )
+        return {"upserted": upserted, "unchanged": unchanged, "removed": len(removed)}
+
+    def _is_current(self, row: Dict[str, Any]) -> bool:
+        if row["phone_number_sid"] not in self._known:
+            return False
+        known = self._known[row["phone_number_sid"]]
+        if not known or not row["twilio_updated_at"]:
+            return False
+        return datetime.fromisoformat(known) == datetime.fromisoformat(row["twilio_updated_at"])
+
+    # Point updates from provisioning
+    async def upsert(self, number):
+        """Mirror a number we just bought, without waiting for the next sweep"""
+        row = to_mirror_row(number)
+        row["synced_at"] = datetime.utcnow().isoformat()
+        await execute_async(
+            self.db.table("twilio_numbers").upsert(row, on_conflict="phone_number_sid")
+        )
+        if self._known is not None:
+            self._known[row["phone_number_sid"]] = row["twilio_updated_at"]
+
+    async def remove(self, phone_number_sids: List[str]):
+        for i in range(0, len(phone_number_sids), DELETE_CHUNK_SIZE):
+            await execute_async(
+                self.db.table("twilio_numbers").delete()
+                .in_("phone_number_sid", phone_number_sids[i:i + DELETE_CHUNK_SIZE])
+            )
+        if self._known is not None:
+            for sid in phone_number_sids:
+                self._known.pop(sid, None)
+
+
+# Singleton instance
+twilio_inventory_sync = TwilioInventorySync(
+    interval_seconds=settings.TWILIO_INVENTORY_SYNC_INTERVAL_SECONDS,
+    page_size=settings.TWILIO_INVENTORY_PAGE_SIZE,
+)
+
+
+async def main():
+    await twilio_inventory_sync.run_forever()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,360 @@
+"""
+Customer webhook delivery
+
+Delivers webhook_outbox rows (see app/services/webhook_outbox.py) to
+customers' endpoints. Due rows are claimed in batches with a lease through
+the claim_webhook_deliveries() database function, grouped per endpoint and,
+for endpoints with batch_size > 1, sent several events per POST.
+
+- one pooled HTTP client for all endpoints; each endpoint also has its own
+  concurrency limit so a slow endpoint can't take every connection. Only
+  what can be sent right away is claimed: at most max_concurrency POSTs in
+  all, and per endpoint the POSTs it has free, so claimed rows don't wait
+  out their lease behind a slow endpoint (and get sent twice)
+- bodies are signed with HMAC-SHA256 over "<timestamp>.<body>", using
+  pre-keyed HMAC objects cached per endpoint secret
+  (X-Vami-Signature: t=<timestamp>,v1=<hex digest>)
+- failed deliveries are retried with jittered exponential backoff until
+  max_attempts, then marked failed
+- an endpoint is disabled after disable_after consecutive failed deliveries
+  (record_webhook_result()); its pending events stay in the outbox and go
+  out once it is re-enabled (POST /settings/webhooks/{id}/enable, which also
+  resets the failure streak)
+
+Runs inside the API process (see app.main startup) or standalone:
+    python -m app.workers.webhook_delivery
+"""
+from typing import Optional, List, Dict, Any, Set
+from collections import defaultdict
+from functools import partial
+from datetime import datetime, timedelta, timezone
+from app.config import settings
+from app.database import get_supabase, execute_async
+from app.services.retry import backoff_delay
+from app.services.batch_writer import BatchWriter
+from app.services.webhook_outbox import webhook_outbox
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import socket
+import time
+import uuid
+import httpx
+
+try:
+    from orjson import dumps as json_dumps
+except ImportError:
+    import json
+
+    def json_dumps(value) -> bytes:
+        return json.dumps(value, separators=(",", ":")).encode()
+
+logger = logging.getLogger(__name__)
+
+# Keep stored response bodies small
+MAX_LOGGED_RESPONSE = 1000
+
+
+class WebhookDeliveryWorker:
+    def __init__(
+        self,
+        poll_interval_seconds: float = 1,
+        batch_size: int = 200,
+        lease_seconds: int = 60,
+        max_concurrency: int = 100,
+        endpoint_concurrency: int = 4,
+        max_attempts: int = 8,
+        retry_base_seconds: float = 10,
+        retry_cap_seconds: float = 3600,
+        disable_after: int = 20,
+        timeout_seconds: float = 10,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.poll_interval_seconds = poll_interval_seconds
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.max_concurrency = max_concurrency
+        self.endpoint_concurrency = endpoint_concurrency
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_cap_seconds = retry_cap_seconds
+        self.disable_after = disable_after
+        self.timeout_seconds = timeout_seconds
+        self.transport = transport
+
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.db = get_supabase()
+        self.log_writer = BatchWriter(
+            "webhook_delivery_log",
+            on_conflict="id",
+            max_rows=settings.BATCH_WRITE_MAX_ROWS,
+            max_delay_ms=settings.BATCH_WRITE_MAX_DELAY_MS,
+        )
+
+        # endpoint id -> (secret, pre-keyed HMAC)
+        self._macs: Dict[str, tuple] = {}
+        self._endpoint_slots: Dict[str, asyncio.Semaphore] = {}
+        # endpoint id -> POSTs in flight; endpoints whose last claim hit their cap
+        self._endpoint_in_flight: Dict[str, int] = defaultdict(int)
+        self._backlogged: Set[str] = set()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight: Set[asyncio.Task] = set()
+
+    # Lifecycle
+    def start(self):
+        if self._task is not None:
+            return
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout_seconds, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+            ),
+            follow_redirects=False,
+            transport=self.transport,
+        )
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._wakeup = asyncio.Event()
+        webhook_outbox.on_publish = self._wakeup.set
+        self._task = asyncio.create_task(self._poll_loop(), name="webhook-delivery")
+        logger.info(f"Webhook delivery worker {self.worker_id} started")
+
+    async def stop(self):
+        """Stop claiming, let in-flight deliveries finish and release the pool"""
+        if self._task is None:
+            return
+        webhook_outbox.on_publish = None
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+        await self.log_writer.stop()
+        await self._client.aclose()
+        self._client = None
+
+    # Claiming
+    async def _poll_loop(self):
+        while True:
+            # Cleared before claiming so a wakeup during the claim isn't lost
+            self._wakeup.clear()
+            claimed = 0
+            try:
+                claimed = await self.poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Webhook delivery poll failed: {e}")
+
+            if claimed >= self.batch_size:
+                # Backlog: keep claiming
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def poll_once(self) -> int:
+        """Claim due deliveries and start sending them. Returns the number claimed."""
+        # One row per free connection at most, so every claimed POST starts now
+        free = self.max_concurrency - len(self._in_flight)
+        if free <= 0:
+            return 0
+
+        # Measured from before the claim, so it never outlasts the database's lease
+        lease_deadline = time.monotonic() + self.lease_seconds
+        result = await execute_async(self.db.rpc("claim_webhook_deliveries", {
+            "p_worker_id": self.worker_id,
+            "p_batch_size": min(self.batch_size, free),
+            "p_lease_seconds": self.lease_seconds,
+            "p_endpoint_concurrency": self.endpoint_concurrency,
+            "p_in_flight": dict(self._endpoint_in_flight),
+        }))
+        rows = result.data or []
+
+        by_endpoint: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for row in rows:
+            by_endpoint[row["endpoint_id"]].append(row)
+
+        for endpoint_id, endpoint_rows in by_endpoint.items():
+            size = max(1, endpoint_rows[0].get("batch_size") or 1)
+            cap = (self.endpoint_concurrency - self._endpoint_in_flight[endpoint_id]) * size
+            if len(endpoint_rows) >= cap:
+                # More may be due: claim again once one of these finishes
+                self._backlogged.add(endpoint_id)
+            for i in range(0, len(endpoint_rows), size):
+                self._endpoint_in_flight[endpoint_id] += 1
+                task = asyncio.create_task(self._deliver(endpoint_rows[i:i + size], lease_deadline))
+                self._in_flight.add(task)
+                task.add_done_callback(partial(self._on_done, endpoint_id))
+        return len(rows)
+
+    def _on_done(self, endpoint_id: str, task: asyncio.Task):
+        saturated = len(self._in_flight) >= self.max_concurrency
+        self._in_flight.discard(task)
+        self._endpoint_in_flight[endpoint_id] -= 1
+        if self._endpoint_in_flight[endpoint_id] <= 0:
+            del self._endpoint_in_flight[endpoint_id]
+        if (saturated or endpoint_id in self._backlogged) and self._wakeup is not None:
+            self._backlogged.discard(endpoint_id)
+            self._wakeup.set()
+        if not task.cancelled() and task.exception():
+            logger.error(f"Webhook delivery task failed: {task.exception()}")
+
+    # Signing
+    def sign(self, endpoint_id: str, secret: str, timestamp: str, body: bytes) -> str:
+        cached = self._macs.get(endpoint_id)
+        if cached is None or cached[0] != secret:
+            cached = (secret, hmac.new(secret.encode(), digestmod=hashlib.sha256))
+            self._macs[endpoint_id] = cached
+        mac = cached[1].copy()
+        mac.update(timestamp.encode() + b"." + body)
+        return mac.hexdigest()
+
+    # Delivery
+    async def _deliver(self, rows: List[Dict[str, Any]], lease_deadline: float):
+        endpoint_id = rows[0]["endpoint_id"]
+        slots = self._endpoint_slots.get(endpoint_id)
+        if slots is None:
+            slots = self._endpoint_slots[endpoint_id] = asyncio.Semaphore(self.endpoint_concurrency)
+
+        # Endpoint first, so waiting on a slow endpoint never holds a connection
+        async with slots, self._slots:
+            if time.monotonic() + self.timeout_seconds >= lease_deadline:
+                # Can't finish within the lease: leave the rows to whoever claims them next
+                logger.warning(f"Lease on {len(rows)} deliveries to {endpoint_id} ran out before sending")
+                return
+
+            if len(rows) == 1:
+                body = json_dumps(rows[0]["payload"])
+                event_type = rows[0]["event_type"]
+            else:
+                body = json_dumps({"events": [row["payload"] for row in rows]})
+                event_type = "batch"
+
+            timestamp = str(int(time.time()))
+            headers = {
+                "Content-Type": "application/json",
+                "User-Agent": "Vami-Webhooks/1.0",
+                "X-Vami-Event": event_type,
+                "X-Vami-Delivery": rows[0]["id"],
+                "X-Vami-Signature": f"t={timestamp},v1={self.sign(endpoint_id, rows[0]['secret'] or '', timestamp, body)}",
+            }
+
+            status_code = None
+            response_body = None
+            try:
+                response = await self._client.post(rows[0]["url"], content=body, headers=headers)
+                status_code = response.status_code
+                response_body = response.text[:MAX_LOGGED_RESPONSE]
+                error = None if 200 <= status_code < 300 else f"HTTP {status_code}"
+            except httpx.HTTPError as e:
+                error = f"{type(e).__name__}: {e}"
+
+        if error is None:
+            await self._mark_delivered(rows)
+        else:
+            await self._retry_or_fail(rows, error)
+        await self._record_result(endpoint_id, success=error is None)
+        await self._log(rows, event_type, status_code, response_body or error, success=error is None)
+
+    async def _mark_delivered(self, rows: List[Dict[str, Any]]):
+        await execute_async(
+            self.db.table("webhook_outbox").update({
+                "status": "delivered",
+                "delivered_at": datetime.utcnow().isoformat(),
+                "attempts": rows[0]["attempts"] + 1,
+                "last_error": None,
+                "lease_owner": None,
+                "lease_expires_at": None,
+            }).in_("id", [row["id"] for row in rows]).eq("lease_owner", self.worker_id)
+        )
+
+    async def _retry_or_fail(self, rows: List[Dict[str, Any]], error: str):
+        # Rows of one POST usually share an attempt count; group in case they don't
+        by_attempts: Dict[int, List[str]] = defaultdict(list)
+        for row in rows:
+            by_attempts[row["attempts"] + 1].append(row["id"])
+
+        for attempts, ids in by_attempts.items():
+            update = {
+                "attempts": attempts,
+                "last_error": error[:MAX_LOGGED_RESPONSE],
+                "lease_owner": None,
+                "lease_expires_at": None,
+            }
+            if attempts >= self.max_attempts:
+                update["status"] = "failed"
+            else:
+                delay = backoff_delay(
+                    attempts - 1, base=self.retry_base_seconds, cap=self.retry_cap_seconds, min_ratio=0.5
+                )
+                update["next_attempt_at"] = (datetime.now(timezone.utc) + timedelta(seconds=delay)).isoformat()
+            await execute_async(
+                self.db.table("webhook_outbox").update(update).in_("id", ids).eq("lease_owner", self.worker_id)
+            )
+
+    async def _record_result(self, endpoint_id: str, success: bool):
+        result = await execute_async(self.db.rpc("record_webhook_result", {
+            "p_endpoint_id": endpoint_id,
+            "p_success": success,
+            "p_disable_after": self.disable_after,
+        }))
+        if not success and result.data is False:
+            logger.warning(f"Webhook endpoint {endpoint_id} disabled after {self.disable_after} consecutive failures")
+            self._macs.pop(endpoint_id, None)
+            self._endpoint_slots.pop(endpoint_id, None)
+
+    async def _log(
+        self,
+        rows: List[Dict[str, Any]],
+        event_type: str,
+        status_code: Optional[int],
+        response_body: Optional[str],
+        success: bool,
+    ):
+        try:
+            await self.log_writer.write({
+                "id": str(uuid.uuid4()),
+                "webhook_endpoint_id": rows[0]["endpoint_id"],
+                "event_type": event_type,
+                "payload": {"event_ids": [row["payload"].get("id") for row in rows]},
+                "response_status": status_code,
+                "response_body": response_body,
+                "success": success,
+            })
+        except Exception as e:
+            logger.error(f"Failed to log webhook delivery to {rows[0]['endpoint_id']}: {e}")
+
+
+# Singleton instance
+webhook_delivery = WebhookDeliveryWorker(
+    poll_interval_seconds=settings.WEBHOOK_DELIVERY_POLL_INTERVAL_SECONDS,
+    batch_size=settings.WEBHOOK_DELIVERY_BATCH_SIZE,
+    lease_seconds=settings.WEBHOOK_DELIVERY_LEASE_SECONDS,
+    max_concurrency=settings.WEBHOOK_DELIVERY_MAX_CONCURRENCY,
+    endpoint_concurrency=settings.WEBHOOK_ENDPOINT_CONCURRENCY,
+    max_attempts=settings.WEBHOOK_DELIVERY_MAX_ATTEMPTS,
+    retry_base_seconds=settings.WEBHOOK_DELIVERY_RETRY_BASE_SECONDS,
+    disable_after=settings.WEBHOOK_ENDPOINT_DISABLE_AFTER,
+    timeout_seconds=settings.WEBHOOK_DELIVERY_TIMEOUT_SECONDS,
+)
+
+
+async def main():
+    webhook_delivery.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await webhook_delivery.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1 @@
+# Local fakes of third-party APIs for development and testing
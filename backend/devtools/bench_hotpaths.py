@@ -0,0 +1,255 @@
+"""
+Microbenchmarks: CPU hot paths in routes and services
+
+Times the pure-Python loops that run per request, on synthetic data at
+several sizes:
+- slot generation (agent_actions.build_slots, calendar.build_availability_slots)
+- stats reducers (calendar.appointment_stats, supabase_service's
+  call_stats_from_rows and analytics_stats_from_rows)
+- ElevenLabs webhook signature verification
+- per-row CallResponse / AppointmentResponse construction
+
+Each case is calibrated to run for at least --min-time per round and
+reported as the best and median time per call over --rounds rounds. Data
+comes from a fixed seed, so runs are comparable.
+
+--save stores the results as the baseline (default .benchmarks/hotpaths.json);
+--compare checks a run against it and exits with status 1 if any case got
+slower than --threshold percent (best-of-rounds times are compared, as they
+are the least noisy). Baselines are machine-specific: save one on the
+machine that compares against it.
+
+Run from backend/ with the usual environment loaded:
+    python -m devtools.bench_hotpaths [-k slots] [--save | --compare] [--threshold 20]
+"""
+from app.api.routes.agent_actions import build_slots
+from app.api.routes.calendar import appointment_response_from_row, appointment_stats, build_availability_slots
+from app.api.routes.calls import call_response_from_row
+from app.config import settings
+from app.services.elevenlabs_service import elevenlabs_service
+from app.services.supabase_service import analytics_stats_from_rows, call_stats_from_rows
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Tuple
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+
+SEED = 1
+BASE = datetime(2030, 1, 7, 0, 0)
+
+# name -> (sizes, setup(size, rng) returning the callable to time)
+BENCHMARKS: Dict[str, Tuple[Tuple[int, ...], Callable]] = {}
+
+
+def benchmark(name: str, sizes: Tuple[int, ...]):
+    def register(setup):
+        BENCHMARKS[name] = (sizes, setup)
+        return setup
+    return register
+
+
+# Synthetic rows
+def appointment_rows(n: int, rng: random.Random, days: int = 7) -> List[dict]:
+    rows = []
+    for i in range(n):
+        start = BASE + timedelta(days=rng.randrange(days), hours=rng.randint(8, 17), minutes=rng.choice((0, 15, 30, 45)))
+        rows.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "user_id": "00000000-0000-0000-0000-000000000001",
+            "title": f"Appointment - Caller {i}",
+            "description": None,
+            "start_time": start.isoformat(),
+            "end_time": (start + timedelta(minutes=rng.choice((15, 30, 60)))).isoformat(),
+            "timezone": "UTC",
+            "status": rng.choice(("scheduled", "scheduled", "completed", "cancelled", "no_show")),
+            "attendee_name": f"Caller {i}",
+            "attendee_phone": f"+1555{rng.randint(1000000, 9999999)}",
+            "send_reminders": True,
+            "metadata": {"booked_via": "voice_ai"},
+            "created_at": (start - timedelta(days=3)).isoformat(),
+            "updated_at": (start - timedelta(days=3)).isoformat(),
+            "calendar_integrations": {"provider": "google"} if i % 2 else {},
+        })
+    return rows
+
+
+def call_rows(n: int, rng: random.Random) -> List[dict]:
+    return [{
+        "id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "user_id": "00000000-0000-0000-0000-000000000001",
+        "agent_id": f"agent_{i % 5}",
+        "agents": {"name": f"Agent {i % 5}"},
+        "phone_number": f"+1555{rng.randint(1000000, 9999999)}",
+        "status": rng.choice(("completed", "completed", "completed", "failed", "no_answer")),
+        "direction": "outbound",
+        "duration_secs": rng.choice((None, rng.randint(10, 900))),
+        "summary": "Caller asked to move their appointment to Thursday afternoon.",
+        "sentiment": rng.choice(("positive", "neutral", "negative", None)),
+        "call_successful": rng.random() < 0.7,
+        "metadata": {"campaign": "reminders"},
+        "created_at": (BASE - timedelta(minutes=i)).isoformat(),
+        "started_at": (BASE - timedelta(minutes=i)).isoformat(),
+        "ended_at": (BASE - timedelta(minutes=i) + timedelta(seconds=90)).isoformat(),
+    } for i in range(n)]
+
+
+# Cases
+@benchmark("slots.agent_actions", sizes=(10, 100, 1000))
+def bench_agent_slots(size: int, rng: random.Random):
+    booked = appointment_rows(size, rng, days=1)
+    day_start, day_end = BASE.replace(hour=9), BASE.replace(hour=17)
+    return lambda: build_slots(BASE.date().isoformat(), day_start, day_end, 15, booked)
+
+
+@benchmark("slots.calendar", sizes=(10, 100, 1000))
+def bench_calendar_slots(size: int, rng: random.Random):
+    booked = appointment_rows(size, rng)
+    return lambda: build_availability_slots(BASE, BASE + timedelta(days=7), 30, booked)
+
+
+@benchmark("stats.calls", sizes=(100, 1000, 10000))
+def bench_call_stats(size: int, rng: random.Random):
+    calls = call_rows(size, rng)
+    ratings = [rng.randint(1, 5) for _ in range(size // 10)]
+    return lambda: call_stats_from_rows(calls, ratings)
+
+
+@benchmark("stats.appointments", sizes=(100, 1000, 10000))
+def bench_appointment_stats(size: int, rng: random.Random):
+    appointments = appointment_rows(size, rng)
+    return lambda: appointment_stats(appointments)
+
+
+@benchmark("stats.analytics", sizes=(100, 1000, 10000))
+def bench_analytics_stats(size: int, rng: random.Random):
+    conversations = [{
+        "call_successful": rng.choice(("success", "failure", "unknown")),
+        "duration_secs": rng.choice((None, rng.randint(10, 900))),
+        "sentiment": rng.choice(("positive", "neutral", "negative", None)),
+    } for _ in range(size)]
+    return lambda: analytics_stats_from_rows(conversations)
+
+
+@benchmark("webhook.verify_signature", sizes=(1, 64, 1024))
+def bench_verify_signature(size: int, rng: random.Random):
+    """size: payload KB"""
+    payload = json.dumps({"conversation_id": "conv_bench", "padding": "x" * (size * 1024)}).encode()
+    timestamp = str(int(time.time()))
+    signature = hmac.new(
+        settings.ELEVENLABS_WEBHOOK_SECRET.encode(), timestamp.encode() + b"." + payload, hashlib.sha256
+    ).hexdigest()
+    return lambda: elevenlabs_service.verify_webhook_signature(payload, signature, timestamp)
+
+
+@benchmark("responses.calls", sizes=(20, 100, 1000))
+def bench_call_responses(size: int, rng: random.Random):
+    rows = call_rows(size, rng)
+    return lambda: [call_response_from_row(row) for row in rows]
+
+
+@benchmark("responses.appointments", sizes=(20, 100, 1000))
+def bench_appointment_responses(size: int, rng: random.Random):
+    rows = appointment_rows(size, rng)
+    return lambda: [appointment_response_from_row(row) for row in rows]
+
+
+# Runner
+def time_case(fn: Callable, rounds: int, min_time: float) -> Dict[str, float]:
+    """Best and median microseconds per call, with loops per round calibrated to min_time"""
+    fn()  # warm up
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        if time.perf_counter() - start >= min_time:
+            break
+        loops *= 2
+
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        samples.append((time.perf_counter() - start) / loops * 1e6)
+    return {"min_us": round(min(samples), 2), "median_us": round(statistics.median(samples), 2), "loops": loops}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def format_us(us: float) -> str:
+    if us >= 1000:
+        return f"{us / 1000:9.2f} ms"
+    return f"{us:9.1f} us"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", dest="filter", default="", help="only cases whose name contains this")
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.05, help="seconds per round")
+    parser.add_argument("--baseline", default=".benchmarks/hotpaths.json")
+    parser.add_argument("--save", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--compare", action="store_true", help="fail if a case regressed against the baseline")
+    parser.add_argument("--threshold", type=float, default=20.0, help="allowed slowdown in percent")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            sys.exit(f"No baseline at {args.baseline}; run with --save first")
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"baseline: {args.baseline} (commit {baseline.get('commit') or '?'}, {baseline.get('at')})")
+
+    results, regressions = {}, []
+    for name, (sizes, setup) in BENCHMARKS.items():
+        if args.filter not in name:
+            continue
+        for size in sizes:
+            case = f"{name}[{size}]"
+            result = results[case] = time_case(setup(size, random.Random(SEED)), args.rounds, args.min_time)
+            line = f"  {case:<34} best {format_us(result['min_us'])}   median {format_us(result['median_us'])}"
+
+            previous = baseline.get("results", {}).get(case)
+            if previous:
+                change = (result["min_us"] - previous["min_us"]) / previous["min_us"] * 100
+                line += f"   {change:+6.1f}%"
+                if change > args.threshold:
+                    line += "  REGRESSED"
+                    regressions.append(case)
+            print(line)
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "at": datetime.now().isoformat(timespec="seconds"),
+                "commit": git_commit(),
+                "python": sys.version.split()[0],
+                "results": results,
+            }, f, indent=2)
+        print(f"saved baseline to {args.baseline}")
+
+    if regressions:
+        print(f"{len(regressions)} case(s) slower than the baseline by more than {args.threshold:g}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""
+Benchmark: PostgREST vs direct Postgres for stats, exports and batch inserts
+
+Loads a calls-shaped table with --rows rows (1M by default) into a "bench"
+schema of a local Postgres and compares, for each workload, the PostgREST
+path the API used before with the direct path in app/services/postgres.py:
+- stats: download the matching rows as JSON and aggregate in Python, vs
+  GROUP BY in SQL
+- export: page through the rows as JSON and write CSV, vs COPY TO STDOUT
+- insert: one bulk JSON insert of --batch rows, vs one INSERT ... VALUES
+
+With --postgrest-url (a PostgREST server on the same database with the
+"bench" schema exposed) the PostgREST side goes over HTTP. Without it, the
+same JSON is produced by Postgres (json_agg / json_populate_recordset, as
+PostgREST does) and parsed here, which leaves out the HTTP hop and so flatters
+the PostgREST side.
+
+Run from backend/ with the usual environment loaded:
+    python -m devtools.bench_postgres --dsn postgresql://postgres@localhost/postgres \\
+        [--postgrest-url http://localhost:3000] [--rows 1000000] [--batch 200] [--iterations 3]
+"""
+from app.services.postgres import PostgresPool
+import argparse
+import asyncio
+import csv
+import io
+import statistics
+import time
+import uuid
+import httpx
+import psycopg2
+
+try:
+    from orjson import dumps as json_dumps, loads as json_loads
+except ImportError:
+    import json
+
+    def json_dumps(value) -> bytes:
+        return json.dumps(value).encode()
+
+    json_loads = json.loads
+
+USER_ID = "00000000-0000-0000-0000-000000000001"
+COLUMNS = ["id", "user_id", "agent_id", "phone_number", "status", "sentiment",
+           "call_successful", "duration_secs", "summary", "created_at"]
+PAGE_SIZE = 10000
+
+SETUP = """
+CREATE SCHEMA IF NOT EXISTS bench;
+DROP TABLE IF EXISTS bench.calls;
+CREATE TABLE bench.calls (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    user_id UUID NOT NULL,
+    agent_id VARCHAR(100) NOT NULL,
+    phone_number VARCHAR(50) NOT NULL,
+    status VARCHAR(50) DEFAULT 'pending',
+    sentiment VARCHAR(50),
+    call_successful BOOLEAN,
+    duration_secs INTEGER,
+    summary TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+INSERT INTO bench.calls (user_id, agent_id, phone_number, status, sentiment, call_successful,
+                         duration_secs, summary, created_at)
+SELECT %(user_id)s::uuid,
+       'agent_' || (i %% 5),
+       '+1555' || lpad((i %% 10000000)::text, 7, '0'),
+       (ARRAY['completed', 'completed', 'completed', 'failed', 'no_answer'])[1 + i %% 5],
+       (ARRAY['positive', 'neutral', 'negative', NULL])[1 + i %% 4],
+       i %% 3 <> 0,
+       30 + i %% 600,
+       'Caller asked to move their appointment to Thursday afternoon; rebooked and confirmed by SMS.',
+       NOW() - make_interval(secs => i)
+FROM generate_series(1, %(rows)s) AS i;
+CREATE INDEX ON bench.calls(user_id, created_at);
+ANALYZE bench.calls;
+"""
+
+STATS_SQL = """
+SELECT status, sentiment, COUNT(*) AS calls,
+       COUNT(*) FILTER (WHERE call_successful) AS successful,
+       COALESCE(SUM(duration_secs), 0) AS duration_secs
+FROM bench.calls WHERE user_id = %s GROUP BY status, sentiment
+"""
+
+
+def aggregate(rows):
+    """What the PostgREST stats path does with the downloaded rows"""
+    by_status, by_sentiment, successful, duration = {}, {}, 0, 0
+    for row in rows:
+        by_status[row["status"]] = by_status.get(row["status"], 0) + 1
+        if row["sentiment"]:
+            by_sentiment[row["sentiment"]] = by_sentiment.get(row["sentiment"], 0) + 1
+        successful += bool(row["call_successful"])
+        duration += row["duration_secs"] or 0
+    return len(rows), successful, duration, by_status, by_sentiment
+
+
+def to_csv(rows, writer):
+    for row in rows:
+        writer.writerow([row.get(column) for column in COLUMNS])
+
+
+def make_batch(size: int):
+    return [{
+        "id": str(uuid.uuid4()),
+        "user_id": USER_ID,
+        "agent_id": "agent_bench",
+        "phone_number": "+15550000000",
+        "status": "completed",
+        "duration_secs": 120,
+    } for _ in range(size)]
+
+
+class JsonPath:
+    """PostgREST's work done in Postgres (no HTTP), for runs without a PostgREST server"""
+
+    def __init__(self, dsn: str):
+        self.conn = psycopg2.connect(dsn)
+        self.conn.autocommit = True
+
+    def _json(self, sql: str, params) -> list:
+        with self.conn.cursor() as cursor:
+            cursor.execute(f"SELECT coalesce(json_agg(t), '[]')::text FROM ({sql}) t", params)
+            return json_loads(cursor.fetchone()[0])
+
+    async def stats(self):
+        rows = await asyncio.to_thread(
+            self._json, "SELECT status, sentiment, call_successful, duration_secs FROM bench.calls WHERE user_id = %s",
+            (USER_ID,),
+        )
+        return aggregate(rows)
+
+    async def export(self) -> int:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        offset, size = 0, 0
+        while True:
+            rows = await asyncio.to_thread(
+                self._json,
+                f"SELECT {', '.join(COLUMNS)} FROM bench.calls WHERE user_id = %s "
+                f"ORDER BY created_at, id LIMIT {PAGE_SIZE} OFFSET {offset}",
+                (USER_ID,),
+            )
+            to_csv(rows, writer)
+            size += len(buffer.getvalue())
+            buffer.seek(0)
+            buffer.truncate()
+            if len(rows) < PAGE_SIZE:
+                return size
+            offset += PAGE_SIZE
+
+    def _insert(self, body: bytes):
+        with self.conn.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO bench.calls SELECT * FROM json_populate_recordset(NULL::bench.calls, %s) "
+                "ON CONFLICT (id) DO NOTHING",
+                (body.decode(),),
+            )
+
+    async def insert(self, rows):
+        await asyncio.to_thread(self._insert, json_dumps(rows))
+
+    async def close(self):
+        self.conn.close()
+
+
+class PostgrestPath:
+    """The API's previous path: PostgREST over HTTP"""
+
+    def __init__(self, url: str):
+        self.client = httpx.AsyncClient(
+            base_url=url,
+            headers={"Accept-Profile": "bench", "Content-Profile": "bench"},
+            timeout=300,
+        )
+
+    async def _get(self, params) -> list:
+        response = await self.client.get("/calls", params=params)
+        response.raise_for_status()
+        return json_loads(response.content)
+
+    async def stats(self):
+        rows = await self._get({
+            "select": "status,sentiment,call_successful,duration_secs",
+            "user_id": f"eq.{USER_ID}",
+        })
+        return aggregate(rows)
+
+    async def export(self) -> int:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        offset, size = 0, 0
+        while True:
+            rows = await self._get({
+                "select": ",".join(COLUMNS),
+                "user_id": f"eq.{USER_ID}",
+                "order": "created_at,id",
+                "limit": PAGE_SIZE,
+                "offset": offset,
+            })
+            to_csv(rows, writer)
+            size += len(buffer.getvalue())
+            buffer.seek(0)
+            buffer.truncate()
+            if len(rows) < PAGE_SIZE:
+                return size
+            offset += PAGE_SIZE
+
+    async def insert(self, rows):
+        response = await self.client.post(
+            "/calls",
+            content=json_dumps(rows),
+            headers={"Content-Type": "application/json", "Prefer": "resolution=ignore-duplicates,return=minimal"},
+            params={"on_conflict": "id"},
+        )
+        response.raise_for_status()
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class DirectPath:
+    """app/services/postgres.py"""
+
+    def __init__(self, dsn: str):
+        self.pool = PostgresPool(dsn, max_size=4, statement_timeout_ms=300000)
+
+    async def stats(self):
+        return await self.pool.fetch(STATS_SQL, (USER_ID,))
+
+    async def export(self) -> int:
+        size = 0
+        async for chunk in self.pool.copy_csv(
+            f"SELECT {', '.join(COLUMNS)} FROM bench.calls WHERE user_id = %s ORDER BY created_at, id",
+            (USER_ID,),
+        ):
+            size += len(chunk)
+        return size
+
+    async def insert(self, rows):
+        await self.pool.insert_rows("bench.calls", rows, on_conflict="id")
+
+    async def close(self):
+        self.pool.close()
+
+
+async def measure(fn, iterations: int) -> list:
+    await fn()  # warm up
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return sorted(samples)
+
+
+async def run(args):
+    if not args.skip_load:
+        print(f"Loading {args.rows:,} rows into bench.calls ...")
+        conn = psycopg2.connect(args.dsn)
+        with conn, conn.cursor() as cursor:
+            cursor.execute(SETUP, {"user_id": USER_ID, "rows": args.rows})
+        conn.close()
+
+    baseline = PostgrestPath(args.postgrest_url) if args.postgrest_url else JsonPath(args.dsn)
+    direct = DirectPath(args.dsn)
+
+    label = "PostgREST (HTTP)" if args.postgrest_url else "PostgREST-equivalent JSON"
+    cases = (
+        ("stats", baseline.stats, direct.stats),
+        ("export", baseline.export, direct.export),
+        (f"insert {args.batch}", lambda: baseline.insert(make_batch(args.batch)),
+         lambda: direct.insert(make_batch(args.batch))),
+    )
+    print(f"{args.rows:,} rows, {args.iterations} iterations; baseline: {label}")
+    try:
+        for name, slow, fast in cases:
+            before = await measure(slow, args.iterations)
+            after = await measure(fast, args.iterations)
+            print(
+                f"  {name:<12} baseline median {statistics.median(before):9.1f} ms   "
+                f"direct median {statistics.median(after):9.1f} ms   "
+                f"x{statistics.median(before) / statistics.median(after):.1f}"
+            )
+    finally:
+        await baseline.close()
+        await direct.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", required=True, help="local Postgres to load the bench schema into")
+    parser.add_argument("--postgrest-url", default="")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--batch", type=int, default=200)
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--skip-load", action="store_true", help="reuse bench.calls from a previous run")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Benchmark: cold start of the API process
+
+Reports two numbers for a fresh interpreter:
+- import time of app.main, from `python -X importtime`, with the modules
+  that cost the most (cumulative, and self time for leaf-heavy packages)
+- time to first response: from spawning `uvicorn app.main:app` until
+  GET /health answers
+
+With --history FILE each run is appended as a JSON line (with the git
+commit) and compared against the previous entry, so regressions show up
+when a heavy import sneaks back into module scope.
+
+Run from backend/ with the usual environment loaded:
+    python -m devtools.bench_startup [--runs 5] [--top 15] [--port 8765] [--history startup_history.jsonl]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+import httpx
+
+
+def import_profile(module: str):
+    """Total import time (ms) of `module` and per-module (self, cumulative) times"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            modules[name.strip()] = (int(self_us) / 1000, int(cumulative_us) / 1000)
+        except ValueError:
+            continue  # header line
+    return modules[module][1], modules
+
+
+def first_response(port: int, timeout: float = 60) -> float:
+    """Seconds from spawning uvicorn to the first successful GET /health"""
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    try:
+        with httpx.Client(timeout=1) as client:
+            while time.perf_counter() - start < timeout:
+                if process.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited:\n{process.stderr.read().decode()[-2000:]}")
+                try:
+                    if client.get(f"http://127.0.0.1:{port}/health").status_code == 200:
+                        return time.perf_counter() - start
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.01)
+        raise RuntimeError(f"no response within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--skip-server", action="store_true", help="only measure imports")
+    parser.add_argument("--history", help="append results to this JSON lines file")
+    args = parser.parse_args()
+
+    imports = []
+    modules = {}
+    for _ in range(args.runs):
+        total, modules = import_profile(args.module)
+        imports.append(total)
+    import_ms = statistics.median(imports)
+    print(f"import {args.module}: median {import_ms:.0f} ms over {args.runs} runs")
+
+    print(f"  top {args.top} by cumulative time (last run):")
+    for name, (self_ms, cumulative_ms) in sorted(modules.items(), key=lambda m: -m[1][1])[:args.top]:
+        print(f"    {cumulative_ms:8.1f} ms  (self {self_ms:6.1f})  {name}")
+
+    first_response_ms = None
+    if not args.skip_server:
+        samples = [first_response(args.port) * 1000 for _ in range(args.runs)]
+        first_response_ms = statistics.median(samples)
+        print(f"time to first response: median {first_response_ms:.0f} ms over {args.runs} runs")
+
+    if args.history:
+        entry = {
+            "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": sys.version.split()[0],
+            "import_ms": round(import_ms, 1),
+            "first_response_ms": round(first_response_ms, 1) if first_response_ms is not None else None,
+        }
+        previous = None
+        if os.path.exists(args.history):
+            with open(args.history) as f:
+                lines = [line for line in f if line.strip()]
+            previous = json.loads(lines[-1]) if lines else None
+        with open(args.history, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+        if previous:
+            for key in ("import_ms", "first_response_ms"):
+                if previous.get(key) and entry[key]:
+                    change = (entry[key] - previous[key]) / previous[key] * 100
+                    print(f"  {key}: {previous[key]} -> {entry[key]} ({change:+.0f}% vs {previous.get('commit') or 'previous'})")
+
+
+if __name__ == "__main__":
+    main()
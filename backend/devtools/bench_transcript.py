@@ -0,0 +1,94 @@
+"""
+Microbenchmark: transcript parsing on 1-hour calls
+
+Measures what the webhook pays once per conversation (parsing the ElevenLabs
+transcript into turns, rendering and compressing the text and turns) against
+what a call detail request pays afterwards (decompressing and decoding the
+stored turns), plus parsing a plain-text transcript for calls that predate
+ingestion-time parsing.
+
+Run from backend/ with the usual environment loaded:
+    python -m devtools.bench_transcript [--minutes 60] [--turn-secs 5] [--iterations 50]
+"""
+from app.services.transcript_parser import (
+    parse_elevenlabs_transcript, parse_text_transcript, render_transcript,
+)
+from app.services.transcript_store import GZIP_LEVEL, _json_dumps, json_loads
+import argparse
+import gzip
+import random
+import statistics
+import time
+
+SENTENCES = [
+    "Hi, this is Sam from the clinic, how can I help you today?",
+    "I'd like to move my appointment to Thursday afternoon if that works.",
+    "Let me check what we have available, one moment please.",
+    "We have 2:30 or 4:15 on Thursday, which one would you prefer?",
+    "The earlier one is better, and can you send me a text reminder?",
+    "Of course. You're booked for 2:30 and we'll text you the day before.",
+]
+
+
+def make_transcript(minutes: int, turn_secs: float) -> list:
+    """ElevenLabs-style transcript with a turn every ~turn_secs"""
+    rng = random.Random(42)
+    items, t, role = [], 0.0, "agent"
+    while t < minutes * 60:
+        items.append({
+            "role": role,
+            "message": " ".join(rng.choices(SENTENCES, k=rng.randint(1, 3))),
+            "time_in_call_secs": round(t, 1),
+        })
+        role = "user" if role == "agent" else "agent"
+        t += rng.uniform(turn_secs * 0.5, turn_secs * 1.5)
+    return items
+
+
+def measure(fn, iterations: int) -> list:
+    fn()  # warm up
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return sorted(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=int, default=60)
+    parser.add_argument("--turn-secs", type=float, default=5)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    items = make_transcript(args.minutes, args.turn_secs)
+    total_secs = args.minutes * 60
+    turns = parse_elevenlabs_transcript(items, total_secs)
+    text = render_transcript(turns)
+    stored_turns = gzip.compress(_json_dumps(turns), GZIP_LEVEL)
+
+    def ingest():
+        parsed = parse_elevenlabs_transcript(items, total_secs)
+        gzip.compress(_json_dumps(parsed), GZIP_LEVEL)
+        gzip.compress(render_transcript(parsed).encode(), GZIP_LEVEL)
+
+    cases = (
+        ("parse payload", lambda: parse_elevenlabs_transcript(items, total_secs)),
+        ("parse text", lambda: parse_text_transcript(text, total_secs)),
+        ("ingest total", ingest),
+        ("detail read", lambda: json_loads(gzip.decompress(stored_turns))),
+    )
+
+    print(
+        f"{args.minutes} min call: {len(turns)} turns, transcript {len(text) / 1024:.0f} KB, "
+        f"stored turns {len(stored_turns) / 1024:.0f} KB gzipped, {args.iterations} iterations"
+    )
+    for name, fn in cases:
+        samples = measure(fn, args.iterations)
+        p95 = samples[int(len(samples) * 0.95) - 1]
+        print(f"  {name:<14} median {statistics.median(samples):7.3f} ms   p95 {p95:7.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
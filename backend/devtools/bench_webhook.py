@@ -0,0 +1,87 @@
+"""
+Microbenchmark: ElevenLabs webhook signature verification and parsing
+
+Compares the previous path (decode the body, build an f-string, re-encode it,
+key a fresh HMAC, then json.loads the decoded body again) with the current
+ElevenLabsService path (copy a pre-keyed HMAC, feed the raw bytes, parse
+straight from bytes).
+
+Run from backend/ with the usual environment loaded:
+    python -m devtools.bench_webhook [--size-kb 1024] [--iterations 200]
+"""
+from app.config import settings
+from app.services.elevenlabs_service import elevenlabs_service
+import argparse
+import hashlib
+import hmac
+import json
+import statistics
+import time
+
+
+def make_payload(size_kb: int) -> bytes:
+    """A post-call webhook body padded out with transcript turns to ~size_kb"""
+    turn = {"role": "user", "message": "I'd like to move my appointment to Thursday afternoon. " * 4, "time_in_call_secs": 12}
+    turn_size = len(json.dumps(turn)) + 2
+    body = {
+        "conversation_id": "conv_bench",
+        "agent_id": "agent_bench",
+        "duration_secs": 312,
+        "call_successful": "success",
+        "transcript": [turn] * max(1, (size_kb * 1024) // turn_size),
+    }
+    return json.dumps(body).encode()
+
+
+def sign(payload: bytes, timestamp: str) -> str:
+    return hmac.new(
+        settings.ELEVENLABS_WEBHOOK_SECRET.encode(), timestamp.encode() + b"." + payload, hashlib.sha256
+    ).hexdigest()
+
+
+def previous_path(payload: bytes, signature: str, timestamp: str):
+    signed_payload = f"{timestamp}.{payload.decode('utf-8')}"
+    expected = hmac.new(
+        settings.ELEVENLABS_WEBHOOK_SECRET.encode(), signed_payload.encode(), hashlib.sha256
+    ).hexdigest()
+    assert hmac.compare_digest(expected, signature)
+    return json.loads(payload.decode("utf-8"))
+
+
+def current_path(payload: bytes, signature: str, timestamp: str):
+    assert elevenlabs_service.verify_webhook_signature(payload, signature, timestamp)
+    return elevenlabs_service.parse_webhook_payload(payload)
+
+
+def measure(fn, iterations: int, *args) -> list:
+    fn(*args)  # warm up
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-kb", type=int, default=1024)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    payload = make_payload(args.size_kb)
+    timestamp = str(int(time.time()))
+    signature = sign(payload, timestamp)
+
+    print(f"payload: {len(payload) / 1024:.0f} KB, {args.iterations} iterations")
+    results = {}
+    for name, fn in (("previous", previous_path), ("current", current_path)):
+        samples = sorted(measure(fn, args.iterations, payload, signature, timestamp))
+        results[name] = statistics.median(samples)
+        p95 = samples[int(len(samples) * 0.95) - 1]
+        print(f"  {name:<9} median {results[name]:7.3f} ms   p95 {p95:7.3f} ms")
+    print(f"  speedup   {results['previous'] / results['current']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,556 @@
+"""
+In-process fakes of the third-party services, for load tests
+
+- FakeSupabase: in-memory tables behind the subset of the supabase-py query
+  builder the app uses (select/insert/upsert/update/delete, eq/in_/gte/...,
+  order/limit/range, count="exact"), plus rpc(), storage and auth.get_user.
+  Like the real client it is synchronous: execute() sleeps for the injected
+  latency, so a query run directly on the event loop blocks it as it would
+  in production.
+- FakeTwilioClient: the twilio.rest.Client calls PhoneService and the
+  inventory sync make
+- FakeStripe: the stripe module calls StripeService makes
+- http_transport(): one httpx transport answering the ElevenLabs and
+  SendGrid REST APIs and Twilio call control (SMS goes through
+  devtools.fake_twilio, which also enforces Twilio's per-sender rate)
+
+Latency is drawn from a seeded RNG so runs are repeatable.
+Embedded resources in selects ("*, agents(name)") come back as None.
+"""
+from typing import Optional, List, Dict, Any, Callable
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import asyncio
+import copy
+import itertools
+import json
+import random
+import threading
+import time
+import uuid
+import httpx
+
+
+@dataclass
+class Latency:
+    """Injected latency: mean_ms +/- jitter_ms (uniform), from a seeded RNG"""
+
+    mean_ms: float = 0.0
+    jitter_ms: float = 0.0
+    seed: int = 0
+    _rng: random.Random = field(init=False, repr=False)
+    _lock: threading.Lock = field(init=False, repr=False, default_factory=threading.Lock)
+
+    def __post_init__(self):
+        self._rng = random.Random(self.seed)
+
+    def sample(self) -> float:
+        if self.mean_ms <= 0 and self.jitter_ms <= 0:
+            return 0.0
+        with self._lock:
+            jitter = self._rng.uniform(-self.jitter_ms, self.jitter_ms)
+        return max(0.0, self.mean_ms + jitter) / 1000
+
+    def sleep(self):
+        delay = self.sample()
+        if delay:
+            time.sleep(delay)
+
+    async def asleep(self):
+        delay = self.sample()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+# Supabase
+class FakeResponse:
+    def __init__(self, data, count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+class _Not:
+    def __init__(self, query: "FakeQuery"):
+        self._query = query
+
+    def __getattr__(self, name):
+        method = getattr(self._query, name)
+
+        def negated(*args, **kwargs):
+            self._query._negate = True
+            return method(*args, **kwargs)
+        return negated
+
+
+def _parse_columns(columns: str):
+    """Top-level column list of a select; embedded resources are returned separately"""
+    plain, embedded, depth, current = [], [], 0, ""
+    for char in columns + ",":
+        if char == "," and depth == 0:
+            item = current.strip()
+            if item:
+                (embedded if "(" in item else plain).append(item.split("(")[0].split(":")[-1].strip())
+            current = ""
+            continue
+        depth += char == "("
+        depth -= char == ")"
+        current += char
+    return plain, embedded
+
+
+class FakeQuery:
+    def __init__(self, db: "FakeSupabase", table: str):
+        self.db = db
+        self.table = table
+        self.operation = "select"
+        self.columns = "*"
+        self.count = None
+        self.payload = None
+        self.on_conflict = "id"
+        self.ignore_duplicates = False
+        self.filters: List[Callable[[Dict[str, Any]], bool]] = []
+        self.ordering: List[tuple] = []
+        self.limit_value: Optional[int] = None
+        self.offset_value = 0
+        self._negate = False
+
+    # Operations
+    def select(self, columns: str = "*", count: Optional[str] = None, **kwargs):
+        self.columns, self.count = columns, count
+        return self
+
+    def insert(self, rows, **kwargs):
+        self.operation, self.payload = "insert", rows
+        return self
+
+    def upsert(self, rows, on_conflict: str = "", ignore_duplicates: bool = False, **kwargs):
+        self.operation, self.payload = "upsert", rows
+        self.on_conflict = on_conflict or "id"
+        self.ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, values: Dict[str, Any], **kwargs):
+        self.operation, self.payload = "update", values
+        return self
+
+    def delete(self, **kwargs):
+        self.operation = "delete"
+        return self
+
+    # Filters
+    def _filter(self, predicate: Callable[[Dict[str, Any]], bool]):
+        if self._negate:
+            self.filters.append(lambda row, p=predicate: not p(row))
+            self._negate = False
+        else:
+            self.filters.append(predicate)
+        return self
+
+    @property
+    def not_(self):
+        return _Not(self)
+
+    def eq(self, column, value):
+        return self._filter(lambda row: _same(row.get(column), value))
+
+    def neq(self, column, value):
+        return self._filter(lambda row: not _same(row.get(column), value))
+
+    def gt(self, column, value):
+        return self._filter(lambda row: row.get(column) is not None and _key(row[column]) > _key(value))
+
+    def gte(self, column, value):
+        return self._filter(lambda row: row.get(column) is not None and _key(row[column]) >= _key(value))
+
+    def lt(self, column, value):
+        return self._filter(lambda row: row.get(column) is not None and _key(row[column]) < _key(value))
+
+    def lte(self, column, value):
+        return self._filter(lambda row: row.get(column) is not None and _key(row[column]) <= _key(value))
+
+    def in_(self, column, values):
+        allowed = list(values)
+        return self._filter(lambda row: any(_same(row.get(column), v) for v in allowed))
+
+    def is_(self, column, value):
+        expected = None if value in (None, "null") else value
+        return self._filter(lambda row: row.get(column) is expected or row.get(column) == expected)
+
+    def match(self, conditions: Dict[str, Any]):
+        for column, value in conditions.items():
+            self.eq(column, value)
+        return self
+
+    def or_(self, *args, **kwargs):
+        # Only used for free-text search; the fake doesn't narrow
+        return self
+
+    # Shaping
+    def order(self, column, desc: bool = False, **kwargs):
+        self.ordering.append((column, desc))
+        return self
+
+    def limit(self, n: int, **kwargs):
+        self.limit_value = n
+        return self
+
+    def offset(self, n: int, **kwargs):
+        self.offset_value = n
+        return self
+
+    def range(self, start: int, end: int, **kwargs):
+        self.offset_value, self.limit_value = start, end - start + 1
+        return self
+
+    def execute(self) -> FakeResponse:
+        self.db.latency.sleep()
+        with self.db.lock:
+            self.db.queries[f"{self.operation} {self.table}"] += 1
+            return getattr(self, f"_execute_{self.operation}")()
+
+    def _matching(self) -> List[Dict[str, Any]]:
+        return [row for row in self.db.tables.setdefault(self.table, []) if all(f(row) for f in self.filters)]
+
+    def _execute_select(self) -> FakeResponse:
+        rows = self._matching()
+        total = len(rows)
+        for column, desc in reversed(self.ordering):
+            rows.sort(key=lambda row: (row.get(column) is None, _key(row.get(column))), reverse=desc)
+        end = None if self.limit_value is None else self.offset_value + self.limit_value
+        rows = rows[self.offset_value:end]
+
+        plain, embedded = _parse_columns(self.columns)
+        if "*" in plain:
+            result = [dict(row) for row in rows]
+        else:
+            result = [{column: row.get(column) for column in plain} for row in rows]
+        for row in result:
+            for name in embedded:
+                row[name] = None
+        return FakeResponse(copy.deepcopy(result), total if self.count else None)
+
+    def _execute_insert(self) -> FakeResponse:
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        stored = [self.db.insert_row(self.table, row) for row in rows]
+        return FakeResponse(copy.deepcopy(stored))
+
+    def _execute_upsert(self) -> FakeResponse:
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        keys = [c.strip() for c in self.on_conflict.split(",")]
+        table = self.db.tables.setdefault(self.table, [])
+        written = []
+        for row in rows:
+            existing = next((r for r in table if all(_same(r.get(k), row.get(k)) for k in keys)), None)
+            if existing is None:
+                written.append(self.db.insert_row(self.table, row))
+            elif not self.ignore_duplicates:
+                existing.update(row)
+                written.append(existing)
+        return FakeResponse(copy.deepcopy(written))
+
+    def _execute_update(self) -> FakeResponse:
+        rows = self._matching()
+        for row in rows:
+            row.update(copy.deepcopy(self.payload))
+        return FakeResponse(copy.deepcopy(rows))
+
+    def _execute_delete(self) -> FakeResponse:
+        rows = self._matching()
+        table = self.db.tables[self.table]
+        self.db.tables[self.table] = [row for row in table if row not in rows]
+        return FakeResponse(copy.deepcopy(rows))
+
+
+def _key(value):
+    """Comparable form: ISO timestamps with and without an offset compare as text"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _same(a, b) -> bool:
+    if isinstance(a, bool) or isinstance(b, bool):
+        return a == b
+    return a == b or (a is not None and b is not None and str(a) == str(b))
+
+
+class _RpcCall:
+    def __init__(self, db: "FakeSupabase", name: str, params: Dict[str, Any]):
+        self.db, self.name, self.params = db, name, params
+
+    def execute(self) -> FakeResponse:
+        self.db.latency.sleep()
+        with self.db.lock:
+            self.db.queries[f"rpc {self.name}"] += 1
+            handler = self.db.rpc_handlers.get(self.name)
+            return FakeResponse(handler(self.db, self.params) if handler else [])
+
+
+class _Bucket:
+    def __init__(self, db: "FakeSupabase", name: str):
+        self.db, self.name = db, name
+
+    def upload(self, path: str, data: bytes, *args, **kwargs):
+        self.db.latency.sleep()
+        self.db.objects[(self.name, path)] = bytes(data)
+        return {"Key": f"{self.name}/{path}"}
+
+    def download(self, path: str) -> bytes:
+        self.db.latency.sleep()
+        try:
+            return self.db.objects[(self.name, path)]
+        except KeyError:
+            raise FileNotFoundError(f"{self.name}/{path}")
+
+    def remove(self, paths: List[str]):
+        for path in paths:
+            self.db.objects.pop((self.name, path), None)
+        return []
+
+    def get_public_url(self, path: str) -> str:
+        return f"https://storage.fake/{self.name}/{path}"
+
+
+class _Auth:
+    def __init__(self, db: "FakeSupabase"):
+        self.db = db
+
+    def get_user(self, token: str):
+        self.db.latency.sleep()
+        user_id = self.db.tokens.get(token)
+        return SimpleNamespace(user=SimpleNamespace(id=user_id) if user_id else None)
+
+
+def _claim_event(db: "FakeSupabase", params: Dict[str, Any]) -> str:
+    """migrations/009_webhook_idempotency.sql, without lease expiry (the caller holds db.lock)"""
+    rows = db.tables.setdefault("processed_events", [])
+    for row in rows:
+        if row["source"] == params["p_source"] and row["event_id"] == params["p_event_id"]:
+            return "in_progress" if row.get("completed_at") is None else "completed"
+    rows.append({
+        "source": params["p_source"], "event_id": params["p_event_id"],
+        "claimed_at": _now(), "completed_at": None,
+    })
+    return "claimed"
+
+
+def _book_appointment(db: "FakeSupabase", params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """migrations/016_atomic_appointment_booking.sql (the caller holds db.lock)"""
+    start, end = datetime.fromisoformat(params["p_start_time"]), datetime.fromisoformat(params["p_end_time"])
+    for row in db.tables.get("appointments", []):
+        if (
+            _same(row.get("user_id"), params["p_user_id"])
+            and row.get("status") != "cancelled"
+            and datetime.fromisoformat(row["start_time"]) < end
+            and datetime.fromisoformat(row["end_time"]) > start
+        ):
+            return []
+    return [copy.deepcopy(db.insert_row("appointments", {
+        "user_id": params["p_user_id"],
+        "title": params["p_title"],
+        "description": params.get("p_description"),
+        "start_time": params["p_start_time"],
+        "end_time": params["p_end_time"],
+        "timezone": params.get("p_timezone", "UTC"),
+        "status": "scheduled",
+        "attendee_name": params.get("p_attendee_name"),
+        "attendee_phone": params.get("p_attendee_phone"),
+        "attendee_email": params.get("p_attendee_email"),
+        "send_reminders": True,
+        "metadata": params.get("p_metadata"),
+    }))]
+
+
+class FakeSupabase:
+    def __init__(self, latency: Optional[Latency] = None):
+        self.latency = latency or Latency()
+        self.lock = threading.RLock()
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.objects: Dict[tuple, bytes] = {}
+        self.tokens: Dict[str, str] = {}
+        self.queries: Dict[str, int] = _Counter()
+        self._ids = itertools.count(1)
+        self.rpc_handlers: Dict[str, Callable] = {
+            "claim_event": _claim_event,
+            "record_webhook_result": lambda db, params: True,
+            "book_appointment": _book_appointment,
+        }
+        self.auth = _Auth(self)
+        self.storage = SimpleNamespace(from_=lambda bucket: _Bucket(self, bucket))
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def from_(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params: Optional[Dict[str, Any]] = None) -> _RpcCall:
+        return _RpcCall(self, name, params or {})
+
+    def insert_row(self, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Store a row with the defaults the real schema fills in"""
+        stored = copy.deepcopy(row)
+        if "id" not in stored:
+            stored["id"] = str(uuid.uuid4()) if table != "conversations" else next(self._ids)
+        stored.setdefault("created_at", _now())
+        self.tables.setdefault(table, []).append(stored)
+        return stored
+
+    def seed(self, table: str, rows: List[Dict[str, Any]]):
+        with self.lock:
+            for row in rows:
+                self.insert_row(table, row)
+
+
+class _Counter(dict):
+    def __missing__(self, key):
+        return 0
+
+
+# Twilio
+class _TwilioNumber(SimpleNamespace):
+    pass
+
+
+class _IncomingNumbers:
+    def __init__(self, client: "FakeTwilioClient"):
+        self.client = client
+
+    def __call__(self, sid: str):
+        client = self.client
+
+        class _Number:
+            def update(self, **kwargs):
+                client.latency.sleep()
+                number = client.numbers[sid]
+                for key, value in kwargs.items():
+                    setattr(number, key, value)
+                return number
+
+            def delete(self):
+                client.latency.sleep()
+                return client.numbers.pop(sid, None) is not None
+
+            def fetch(self):
+                client.latency.sleep()
+                return client.numbers[sid]
+        return _Number()
+
+    def create(self, phone_number: str, **kwargs):
+        self.client.latency.sleep()
+        sid = f"PN{uuid.uuid4().hex}"
+        number = _TwilioNumber(
+            sid=sid, phone_number=phone_number, friendly_name=phone_number,
+            date_updated=datetime.now(timezone.utc), capabilities={"voice": True, "SMS": True, "MMS": False},
+            **kwargs,
+        )
+        self.client.numbers[sid] = number
+        return number
+
+    def list(self, **kwargs):
+        self.client.latency.sleep()
+        return list(self.client.numbers.values())
+
+    def page(self, page_size: int = 50, **kwargs):
+        self.client.latency.sleep()
+        return _Page(list(self.client.numbers.values()), page_size, self.client)
+
+
+class _Page(list):
+    def __init__(self, items, page_size: int, client: "FakeTwilioClient", start: int = 0):
+        super().__init__(items[start:start + page_size])
+        self._items, self._page_size, self._client, self._next = items, page_size, client, start + page_size
+
+    def next_page(self):
+        if self._next >= len(self._items):
+            return None
+        self._client.latency.sleep()
+        return _Page(self._items, self._page_size, self._client, self._next)
+
+
+class FakeTwilioClient:
+    def __init__(self, latency: Optional[Latency] = None, seed: int = 0):
+        self.latency = latency or Latency()
+        self.numbers: Dict[str, _TwilioNumber] = {}
+        self.incoming_phone_numbers = _IncomingNumbers(self)
+        self._rng = random.Random(seed)
+
+    def available_phone_numbers(self, country: str = "US"):
+        client = self
+
+        def list_numbers(area_code: Optional[str] = None, limit: int = 20, **kwargs):
+            client.latency.sleep()
+            prefix = area_code or "555"
+            return [
+                _TwilioNumber(
+                    phone_number=f"+1{prefix}{client._rng.randint(1000000, 9999999)}",
+                    friendly_name=f"({prefix}) fake", locality="Springfield", region="CA",
+                    postal_code="90000", capabilities={"voice": True, "SMS": True, "MMS": False},
+                )
+                for _ in range(limit)
+            ]
+        return SimpleNamespace(local=SimpleNamespace(list=list_numbers))
+
+
+# Stripe
+class FakeStripe:
+    """Module-shaped stand-in for `stripe` (see StripeService.stripe)"""
+
+    class error:
+        class SignatureVerificationError(Exception):
+            pass
+
+    def __init__(self, latency: Optional[Latency] = None):
+        self.latency = latency or Latency()
+        self.api_key = "sk_fake"
+        call = self._call
+        self.Customer = SimpleNamespace(create=call(lambda **kw: SimpleNamespace(id=f"cus_{uuid.uuid4().hex[:14]}")))
+        self.checkout = SimpleNamespace(Session=SimpleNamespace(
+            create=call(lambda **kw: SimpleNamespace(url=f"https://checkout.fake/{uuid.uuid4().hex}"))
+        ))
+        self.billing_portal = SimpleNamespace(Session=SimpleNamespace(
+            create=call(lambda **kw: SimpleNamespace(url=f"https://billing.fake/{uuid.uuid4().hex}"))
+        ))
+        self.Subscription = SimpleNamespace(
+            retrieve=call(lambda sid, **kw: {"id": sid, "status": "active", "items": {"data": [SimpleNamespace(id="si_fake")]}}),
+            modify=call(lambda sid, **kw: {"id": sid, "status": "active", **kw}),
+            cancel=call(lambda sid, **kw: {"id": sid, "status": "canceled"}),
+        )
+        self.Invoice = SimpleNamespace(list=call(lambda **kw: {"data": []}))
+        self.Webhook = SimpleNamespace(construct_event=lambda payload, signature, secret: json.loads(payload))
+
+    def _call(self, fn):
+        def wrapper(*args, **kwargs):
+            self.latency.sleep()
+            return fn(*args, **kwargs)
+        return wrapper
+
+
+# HTTP APIs (ElevenLabs, SendGrid, Twilio call control)
+def http_transport(latency: Optional[Latency] = None, counters: Optional[Dict[str, int]] = None) -> httpx.MockTransport:
+    latency = latency or Latency()
+    counters = counters if counters is not None else _Counter()
+
+    async def handle(request: httpx.Request) -> httpx.Response:
+        await latency.asleep()
+        host, path = request.url.host, request.url.path
+        counters[f"{request.method} {host}{path.split('/Accounts/')[0]}"] += 1
+
+        if "elevenlabs" in host:
+            if path == "/v1/convai/twilio/outbound-call":
+                return httpx.Response(200, json={"success": True, "conversation_id": f"conv_{uuid.uuid4().hex[:16]}"})
+            if path.startswith("/v1/convai/conversations/"):
+                return httpx.Response(200, json={"conversation_id": path.rsplit("/", 1)[-1], "metadata": {}})
+            return httpx.Response(200, json={})
+        if "sendgrid" in host:
+            return httpx.Response(202)
+        if "twilio" in host:
+            return httpx.Response(200, json={"status": "completed"})
+        return httpx.Response(404)
+
+    return httpx.MockTransport(handle)
@@ -0,0 +1,99 @@
+"""
+Local fake of the Twilio Messages API
+
+Implements just enough of POST /2010-04-01/Accounts/{sid}/Messages.json for
+the SMS dispatcher: it enforces a per-sender messages-per-second limit and
+answers 429 (Twilio error 20429) when a sender goes over it, so throttling
+and retry behaviour can be exercised without a Twilio account.
+
+Run standalone:
+    uvicorn devtools.fake_twilio:app --port 8099
+    TWILIO_API_BASE_URL=http://localhost:8099
+
+Or in-process:
+    transport = httpx.ASGITransport(app=create_app(rate_per_second=1))
+    SMSService(transport=transport)
+"""
+from fastapi import FastAPI, Form, Request
+from fastapi.responses import JSONResponse
+from collections import defaultdict
+from typing import Dict, List, Optional
+import asyncio
+import secrets
+import time
+
+
+def create_app(
+    rate_per_second: float = 1.0,
+    latency_ms: float = 0.0,
+    fail_numbers: Optional[List[str]] = None,
+) -> FastAPI:
+    """
+    Build a fake Twilio app
+
+    Args:
+        rate_per_second: Allowed messages per second per From number
+        latency_ms: Artificial delay added to every request
+        fail_numbers: To numbers that always get a 400 (invalid number) response
+    """
+    fake = FastAPI(title="Fake Twilio")
+    fake.state.messages = []
+    fake.state.throttled = 0
+    last_sent: Dict[str, float] = defaultdict(float)
+    min_interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+    failing = set(fail_numbers or [])
+
+    @fake.post("/2010-04-01/Accounts/{account_sid}/Messages.json")
+    async def create_message(
+        account_sid: str,
+        To: str = Form(...),
+        From: str = Form(...),
+        Body: str = Form(...),
+    ):
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+
+        if To in failing:
+            return JSONResponse(
+                status_code=400,
+                content={"code": 21211, "message": f"The 'To' number {To} is not a valid phone number.", "status": 400},
+            )
+
+        now = time.monotonic()
+        wait = last_sent[From] + min_interval - now
+        if wait > 0:
+            fake.state.throttled += 1
+            return JSONResponse(
+                status_code=429,
+                content={"code": 20429, "message": "Too Many Requests", "status": 429},
+                headers={"Retry-After": f"{wait:.3f}"},
+            )
+        last_sent[From] = now
+
+        message = {
+            "sid": f"SM{secrets.token_hex(16)}",
+            "account_sid": account_sid,
+            "to": To,
+            "from": From,
+            "body": Body,
+            "status": "queued",
+        }
+        fake.state.messages.append(message)
+        return JSONResponse(status_code=201, content=message)
+
+    @fake.get("/_fake/messages")
+    async def list_messages(request: Request):
+        """Inspect everything the fake has accepted"""
+        return {"messages": fake.state.messages, "throttled": fake.state.throttled}
+
+    @fake.delete("/_fake/messages")
+    async def reset_messages():
+        fake.state.messages.clear()
+        fake.state.throttled = 0
+        last_sent.clear()
+        return {"status": "reset"}
+
+    return fake
+
+
+app = create_app()
@@ -0,0 +1,400 @@
+"""
+Load test: scripted API scenarios against in-process fakes
+
+Runs the API routers in-process over httpx.ASGITransport with every external
+service replaced by the fakes in devtools/fake_services.py (and the Twilio
+Messages fake in devtools/fake_twilio.py), so no Supabase, Twilio, ElevenLabs,
+SendGrid or Stripe account is touched. Each fake adds the configured latency.
+
+Scenarios:
+- dashboard: a dashboard polling the call list, call stats, analytics and
+  appointment stats
+- webhooks: a burst of signed ElevenLabs post-call webhooks, a tenth of them
+  redeliveries (409 while the original is still being processed)
+- agent-actions: agents checking availability and booking appointments
+- bulk-calls: bulk outbound call requests
+
+For each scenario it reports throughput, p50/p95/p99 latency, status codes
+and how long the event loop was blocked (ticks that ran late by more than
+--block-threshold-ms), which is where synchronous database calls made on the
+loop show up.
+
+Requests and data are generated from --seed, so two runs with the same
+arguments issue the same requests; compare runs (e.g. with --json) to spot
+regressions.
+
+Run from backend/ with the usual environment loaded:
+    python -m devtools.loadtest [--scenario dashboard --scenario webhooks] [--requests 500]
+        [--concurrency 50] [--db-latency-ms 5] [--http-latency-ms 50] [--json results.json]
+"""
+from devtools.fake_services import FakeSupabase, FakeStripe, FakeTwilioClient, Latency, http_transport
+from devtools import fake_twilio
+from app.config import settings
+from app.models.user import PLAN_FEATURES, SubscriptionPlan
+from app.services.registry import registry
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Any
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import random
+import statistics
+import time
+import uuid
+import httpx
+
+SCENARIOS = ("dashboard", "webhooks", "agent-actions", "bulk-calls")
+USERS = 5
+AGENTS_PER_USER = 2
+
+
+class LoopMonitor:
+    """Measures event-loop lag with a ticker that should wake every `interval` seconds"""
+
+    def __init__(self, interval: float = 0.005, threshold: float = 0.010):
+        self.interval = interval
+        self.threshold = threshold
+        self.blocked = 0.0
+        self.max_lag = 0.0
+        self.late_ticks = 0
+        self._expected = None
+        self._task = None
+
+    def _record(self, lag: float):
+        self.max_lag = max(self.max_lag, lag)
+        if lag > self.threshold:
+            self.blocked += lag
+            self.late_ticks += 1
+
+    async def _tick(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self._record(loop.time() - self._expected)
+
+    def start(self):
+        self._task = asyncio.create_task(self._tick())
+
+    async def stop(self):
+        # A tick still waiting when the run ends was held up by the tail of the run
+        if self._expected is not None:
+            self._record(asyncio.get_running_loop().time() - self._expected)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def install_fakes(db_latency: Latency, http_latency: Latency, seed: int) -> FakeSupabase:
+    """Point every service singleton at the fakes; returns the fake database"""
+    from app.services.stripe_service import StripeService
+    from app.services.elevenlabs_service import elevenlabs_service
+    from app.services.email_service import email_service
+    from app.services.sms_service import sms_service
+
+    db = FakeSupabase(db_latency)
+    registry.override("supabase", db)
+    registry.override("twilio", FakeTwilioClient(db_latency, seed=seed))
+
+    stripe_service = StripeService.__new__(StripeService)
+    stripe_service.stripe = FakeStripe(http_latency)
+    registry.override("stripe", stripe_service)
+
+    transport = http_transport(http_latency)
+    elevenlabs_service.use_mock = False
+    elevenlabs_service.api_key = "loadtest"
+    elevenlabs_service._transport = transport
+    email_service.dispatcher.transport = transport
+    sms_service.dispatcher.transport = httpx.ASGITransport(
+        app=fake_twilio.create_app(rate_per_second=1000, latency_ms=http_latency.mean_ms)
+    )
+    return db
+
+
+def create_app():
+    """The API's routers without app.main's startup hooks and rate limits"""
+    from fastapi import FastAPI
+    from app.api.routes import agent_actions, analytics, calendar, calls, webhooks
+
+    webhooks.limiter.enabled = False
+    app = FastAPI()
+    for module in (calls, analytics, calendar, webhooks, agent_actions):
+        app.include_router(module.router, prefix="/api")
+    return app
+
+
+def seed_data(db: FakeSupabase, rng: random.Random) -> Dict[str, Any]:
+    """Users, agents and some history for them to browse"""
+    now = datetime.now(timezone.utc)
+    users, agents = [], []
+    for u in range(USERS):
+        user_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        token = f"loadtest-token-{u}"
+        db.tokens[token] = user_id
+        users.append({"id": user_id, "token": token, "agents": []})
+        db.seed("users", [{
+            "id": user_id,
+            "email": f"user{u}@loadtest.example.com",
+            "plan": SubscriptionPlan.PROFESSIONAL.value,
+            "subscription_status": "active",
+            "features": PLAN_FEATURES[SubscriptionPlan.PROFESSIONAL].model_dump(),
+            "created_at": now.isoformat(),
+            "updated_at": now.isoformat(),
+        }])
+        for a in range(AGENTS_PER_USER):
+            agent = {
+                "id": len(agents) + 1,
+                "agent_id": f"agent_{u}_{a}",
+                "user_id": user_id,
+                "agent_name": f"Agent {u}.{a}",
+                "api_token": f"agent-token-{u}-{a}",
+                "status": "active",
+                "created_at": now.isoformat(),
+                "updated_at": now.isoformat(),
+            }
+            agents.append(agent)
+            users[-1]["agents"].append(agent)
+        db.seed("agents", [dict(agent) for agent in users[-1]["agents"]])
+
+        calls, conversations, appointments = [], [], []
+        for i in range(200):
+            at = now - timedelta(minutes=37 * i)
+            agent_id = users[-1]["agents"][i % AGENTS_PER_USER]["agent_id"]
+            calls.append({
+                "user_id": user_id, "agent_id": agent_id,
+                "phone_number": f"+1555{rng.randint(1000000, 9999999)}",
+                "status": rng.choice(["completed", "completed", "failed", "no_answer"]),
+                "direction": "outbound",
+                "duration_secs": rng.randint(20, 600),
+                "sentiment": rng.choice(["positive", "neutral", "negative", None]),
+                "call_successful": rng.random() < 0.7,
+                "created_at": at.isoformat(),
+            })
+            conversations.append({
+                "conversation_id": f"seed_{u}_{i}", "agent_id": agent_id,
+                "duration_secs": rng.randint(20, 600), "call_successful": "success",
+                "sentiment": rng.choice(["positive", "neutral", "negative"]),
+                "created_at": at.isoformat(),
+            })
+        for i in range(50):
+            start = (now + timedelta(days=i % 14)).replace(hour=9 + i % 8, minute=0, second=0, microsecond=0)
+            appointments.append({
+                "user_id": user_id, "title": f"Seeded {i}",
+                "start_time": start.replace(tzinfo=None).isoformat(),
+                "end_time": (start + timedelta(minutes=30)).replace(tzinfo=None).isoformat(),
+                "status": "scheduled", "timezone": "UTC",
+            })
+        db.seed("calls", calls)
+        db.seed("conversations", conversations)
+        db.seed("appointments", appointments)
+    return {"users": users, "agents": agents}
+
+
+def sign(payload: bytes, timestamp: str) -> str:
+    return hmac.new(
+        settings.ELEVENLABS_WEBHOOK_SECRET.encode(), timestamp.encode() + b"." + payload, hashlib.sha256
+    ).hexdigest()
+
+
+# Scenarios: each returns the list of requests (method, path, kwargs) to issue
+def dashboard_requests(fixtures, rng: random.Random, count: int) -> List[tuple]:
+    paths = ["/api/calls?per_page=20", "/api/calls/stats/summary", "/api/analytics/stats", "/api/calendar/stats"]
+    requests = []
+    for i in range(count):
+        user = rng.choice(fixtures["users"])
+        requests.append(("GET", paths[i % len(paths)], {"headers": {"Authorization": f"Bearer {user['token']}"}}))
+    return requests
+
+
+def webhook_requests(fixtures, rng: random.Random, count: int) -> List[tuple]:
+    requests, sent = [], []
+    for i in range(count):
+        if sent and i % 10 == 9:
+            payload = rng.choice(sent)  # redelivery
+        else:
+            agent = rng.choice(fixtures["agents"])
+            payload = json.dumps({
+                "conversation_id": f"conv_load_{i}",
+                "agent_id": agent["agent_id"],
+                "duration_secs": rng.randint(20, 600),
+                "call_successful": "success",
+                "summary": "Caller booked a follow-up appointment.",
+                "sentiment": rng.choice(["positive", "neutral", "negative"]),
+                "transcript": [
+                    {"role": "agent" if t % 2 else "user", "message": "Sounds good, see you then.", "time_in_call_secs": t * 7}
+                    for t in range(rng.randint(4, 40))
+                ],
+            }).encode()
+            sent.append(payload)
+        timestamp = str(int(time.time()))
+        requests.append(("POST", "/api/webhooks/elevenlabs", {
+            "content": payload,
+            "headers": {"xi-signature": sign(payload, timestamp), "xi-timestamp": timestamp,
+                        "Content-Type": "application/json"},
+        }))
+    return requests
+
+
+def agent_action_requests(fixtures, rng: random.Random, count: int) -> List[tuple]:
+    requests = []
+    for i in range(count):
+        agent = rng.choice(fixtures["agents"])
+        day = (date.today() + timedelta(days=rng.randint(1, 14))).isoformat()
+        headers = {"X-Agent-Token": agent["api_token"]}
+        if i % 3:
+            requests.append(("POST", f"/api/agent-actions/check-availability/{agent['agent_id']}", {
+                "headers": headers, "json": {"date": day, "duration_minutes": 30},
+            }))
+        else:
+            requests.append(("POST", f"/api/agent-actions/book-appointment/{agent['agent_id']}", {
+                "headers": headers,
+                "json": {
+                    "date": day, "start_time": f"{rng.randint(9, 16):02d}:{rng.choice(['00', '30'])}",
+                    "duration_minutes": 30, "customer_name": f"Caller {i}",
+                    "customer_phone": f"+1555{rng.randint(1000000, 9999999)}",
+                },
+            }))
+    return requests
+
+
+def bulk_call_requests(fixtures, rng: random.Random, count: int) -> List[tuple]:
+    requests = []
+    for _ in range(count):
+        user = rng.choice(fixtures["users"])
+        requests.append(("POST", "/api/calls/bulk", {
+            "headers": {"Authorization": f"Bearer {user['token']}"},
+            "json": {
+                "agent_id": rng.choice(user["agents"])["agent_id"],
+                "phone_numbers": [f"+1555{rng.randint(1000000, 9999999)}" for _ in range(10)],
+            },
+        }))
+    return requests
+
+
+BUILDERS = {
+    "dashboard": dashboard_requests,
+    "webhooks": webhook_requests,
+    "agent-actions": agent_action_requests,
+    "bulk-calls": bulk_call_requests,
+}
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    index = min(len(samples) - 1, max(0, round(pct / 100 * len(samples)) - 1))
+    return samples[index]
+
+
+async def run_scenario(client: httpx.AsyncClient, requests: List[tuple], concurrency: int, monitor: LoopMonitor) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    pending = iter(requests)
+
+    async def worker():
+        for method, path, kwargs in pending:
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                status = str(response.status_code)
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    monitor.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    await monitor.stop()
+
+    latencies.sort()
+    return {
+        "requests": len(requests),
+        "seconds": round(elapsed, 3),
+        "throughput": round(len(requests) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "mean_ms": round(statistics.fmean(latencies), 1) if latencies else 0.0,
+        "statuses": dict(sorted(statuses.items())),
+        "loop_blocked_ms": round(monitor.blocked * 1000, 1),
+        "loop_blocked_pct": round(monitor.blocked / elapsed * 100, 1),
+        "loop_max_lag_ms": round(monitor.max_lag * 1000, 1),
+    }
+
+
+async def shutdown():
+    from app.services.batch_writer import conversation_writer, usage_writer
+    from app.services.webhook_outbox import webhook_outbox
+    from app.services.elevenlabs_service import elevenlabs_service
+    from app.services.email_service import email_service
+    from app.services.sms_service import sms_service
+
+    await conversation_writer.stop()
+    await usage_writer.stop()
+    await webhook_outbox.stop()
+    await email_service.stop()
+    await sms_service.stop()
+    await elevenlabs_service.close()
+
+
+async def run(args) -> Dict[str, Any]:
+    db_latency = Latency(args.db_latency_ms, args.db_latency_ms * args.jitter, seed=args.seed)
+    http_latency = Latency(args.http_latency_ms, args.http_latency_ms * args.jitter, seed=args.seed + 1)
+    db = install_fakes(db_latency, http_latency, args.seed)
+    fixtures = seed_data(db, random.Random(args.seed))
+    app = create_app()
+
+    results = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest", timeout=60) as client:
+        try:
+            for name in args.scenario or SCENARIOS:
+                requests = BUILDERS[name](fixtures, random.Random(f"{args.seed}:{name}"), args.requests)
+                monitor = LoopMonitor(threshold=args.block_threshold_ms / 1000)
+                results[name] = await run_scenario(client, requests, args.concurrency, monitor)
+                print_result(name, results[name])
+        finally:
+            await shutdown()
+    return {
+        "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "settings": {k: v for k, v in vars(args).items() if k != "json"},
+        "scenarios": results,
+        "queries": dict(sorted(db.queries.items())),
+    }
+
+
+def print_result(name: str, result: Dict[str, Any]):
+    print(
+        f"{name:<14} {result['throughput']:8.1f} req/s   p50 {result['p50_ms']:7.1f} ms   "
+        f"p95 {result['p95_ms']:7.1f} ms   p99 {result['p99_ms']:7.1f} ms   "
+        f"loop blocked {result['loop_blocked_ms']:8.1f} ms ({result['loop_blocked_pct']}%), "
+        f"max lag {result['loop_max_lag_ms']} ms   {result['statuses']}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="repeatable; default: all")
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--db-latency-ms", type=float, default=5.0, help="per Supabase query")
+    parser.add_argument("--http-latency-ms", type=float, default=50.0, help="per ElevenLabs/SendGrid/Twilio/Stripe request")
+    parser.add_argument("--jitter", type=float, default=0.2, help="latency jitter as a fraction of the mean")
+    parser.add_argument("--block-threshold-ms", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
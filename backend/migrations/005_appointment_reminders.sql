@@ -0,0 +1,57 @@
+-- Migration: Appointment reminder scheduling
+-- Description: Claim columns, due-time index and an atomic claim function
+-- used by the reminder worker (app/workers/reminders.py)
+
+-- Claim / delivery tracking columns
+ALTER TABLE public.appointments
+ADD COLUMN IF NOT EXISTS reminder_claimed_by VARCHAR(100),
+ADD COLUMN IF NOT EXISTS reminder_claimed_at TIMESTAMP WITH TIME ZONE,
+ADD COLUMN IF NOT EXISTS reminder_sent_at TIMESTAMP WITH TIME ZONE,
+ADD COLUMN IF NOT EXISTS reminder_email_sent_at TIMESTAMP WITH TIME ZONE;
+
+-- Due-time scan index: only rows that still want a reminder are indexed
+CREATE INDEX IF NOT EXISTS idx_appointments_reminder_due
+    ON public.appointments(start_time, reminder_sent)
+    WHERE send_reminders = TRUE;
+
+COMMENT ON COLUMN public.appointments.reminder_claimed_by IS 'Reminder worker currently holding the send lease';
+COMMENT ON COLUMN public.appointments.reminder_claimed_at IS 'When the send lease was taken; expired leases can be re-claimed';
+COMMENT ON COLUMN public.appointments.reminder_sent_at IS 'When the reminder was delivered';
+COMMENT ON COLUMN public.appointments.reminder_email_sent_at IS 'When the reminder email was queued; a re-claim for a failed SMS does not send it again';
+
+-- ============================================================
+-- Atomically claim a batch of due reminders
+-- ============================================================
+-- Rows locked by another worker are skipped (SKIP LOCKED) and a claim is
+-- only taken over once its lease has expired, so concurrent workers never
+-- send the same reminder twice.
+
+CREATE OR REPLACE FUNCTION public.claim_due_reminders(
+    p_worker_id TEXT,
+    p_lookahead_seconds INTEGER DEFAULT 7200,
+    p_batch_size INTEGER DEFAULT 500,
+    p_lease_seconds INTEGER DEFAULT 300
+)
+RETURNS SETOF public.appointments AS $$
+BEGIN
+    RETURN QUERY
+    UPDATE public.appointments a
+    SET reminder_claimed_by = p_worker_id,
+        reminder_claimed_at = NOW()
+    WHERE a.id IN (
+        SELECT id
+        FROM public.appointments
+        WHERE send_reminders = TRUE
+          AND reminder_sent = FALSE
+          AND start_time >= NOW()
+          AND start_time <= NOW() + make_interval(secs => p_lookahead_seconds)
+          AND status IN ('scheduled', 'confirmed')
+          AND (reminder_claimed_at IS NULL
+               OR reminder_claimed_at < NOW() - make_interval(secs => p_lease_seconds))
+        ORDER BY start_time
+        LIMIT p_batch_size
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING a.*;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,84 @@
+-- Migration: Scheduled outbound call execution
+-- Description: Lease/retry columns, a due-time index and an atomic claim
+-- function used by the call scheduler (app/workers/call_scheduler.py)
+
+ALTER TABLE public.calls
+ADD COLUMN IF NOT EXISTS attempts INTEGER DEFAULT 0,
+ADD COLUMN IF NOT EXISTS lease_owner VARCHAR(100),
+ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP WITH TIME ZONE,
+ADD COLUMN IF NOT EXISTS error_message TEXT;
+
+-- Due-time scan index over pending scheduled calls only
+CREATE INDEX IF NOT EXISTS idx_calls_pending_scheduled_at
+    ON public.calls(scheduled_at)
+    WHERE status = 'pending' AND scheduled_at IS NOT NULL;
+
+-- Per-tenant active call counting
+CREATE INDEX IF NOT EXISTS idx_calls_user_status ON public.calls(user_id, status);
+
+COMMENT ON COLUMN public.calls.attempts IS 'Number of dial attempts made by the scheduler';
+COMMENT ON COLUMN public.calls.lease_owner IS 'Scheduler worker currently holding this call';
+COMMENT ON COLUMN public.calls.lease_expires_at IS 'Lease expiry; expired leases can be claimed by another worker';
+
+-- ============================================================
+-- Atomically claim due calls within each tenant's concurrency cap
+-- ============================================================
+-- Claims are serialized with a transaction-scoped advisory lock so the
+-- per-tenant active count is never computed from a stale view. A tenant's
+-- capacity is users.features->>'concurrent_calls' minus calls that are
+-- ringing, in progress, or already leased by a worker.
+
+CREATE OR REPLACE FUNCTION public.claim_due_calls(
+    p_worker_id TEXT,
+    p_lookahead_seconds INTEGER DEFAULT 60,
+    p_batch_size INTEGER DEFAULT 100,
+    p_lease_seconds INTEGER DEFAULT 180
+)
+RETURNS SETOF public.calls AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('claim_due_calls'));
+
+    RETURN QUERY
+    WITH candidates AS (
+        SELECT c.id, c.user_id, c.scheduled_at
+        FROM public.calls c
+        WHERE c.status = 'pending'
+          AND c.scheduled_at IS NOT NULL
+          AND c.scheduled_at <= NOW() + make_interval(secs => p_lookahead_seconds)
+          AND (c.lease_expires_at IS NULL OR c.lease_expires_at < NOW())
+        ORDER BY c.scheduled_at
+        LIMIT p_batch_size * 4
+        FOR UPDATE SKIP LOCKED
+    ),
+    busy AS (
+        SELECT user_id, COUNT(*) AS active
+        FROM public.calls
+        WHERE user_id IN (SELECT user_id FROM candidates)
+          AND (status IN ('ringing', 'in_progress')
+               OR (status = 'pending' AND lease_expires_at >= NOW()))
+        GROUP BY user_id
+    ),
+    ranked AS (
+        SELECT cand.id,
+               cand.scheduled_at,
+               ROW_NUMBER() OVER (PARTITION BY cand.user_id ORDER BY cand.scheduled_at) AS rn,
+               COALESCE((u.features->>'concurrent_calls')::INTEGER, 1) - COALESCE(b.active, 0) AS capacity
+        FROM candidates cand
+        JOIN public.users u ON u.id = cand.user_id
+        LEFT JOIN busy b ON b.user_id = cand.user_id
+    ),
+    chosen AS (
+        SELECT id
+        FROM ranked
+        WHERE rn <= capacity
+        ORDER BY scheduled_at
+        LIMIT p_batch_size
+    )
+    UPDATE public.calls c
+    SET lease_owner = p_worker_id,
+        lease_expires_at = NOW() + make_interval(secs => p_lease_seconds)
+    FROM chosen
+    WHERE c.id = chosen.id
+    RETURNING c.*;
+END;
+$$ LANGUAGE plpgsql;
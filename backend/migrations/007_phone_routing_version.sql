@@ -0,0 +1,47 @@
+-- Migration: Inbound call routing cache invalidation
+-- Description: Version stamp that API workers poll to know when their
+-- in-memory phone number -> agent table (app/services/phone_routing.py) is stale
+
+CREATE TABLE IF NOT EXISTS public.routing_versions (
+    name VARCHAR(100) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+INSERT INTO public.routing_versions (name, version)
+VALUES ('phone_routing', 0)
+ON CONFLICT (name) DO NOTHING;
+
+COMMENT ON TABLE public.routing_versions IS 'Monotonic version stamps for in-process caches';
+
+-- ============================================================
+-- Bump the version whenever routing data changes
+-- ============================================================
+-- Statement-level so a bulk update bumps once rather than per row.
+
+CREATE OR REPLACE FUNCTION public.bump_phone_routing_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE public.routing_versions
+    SET version = version + 1,
+        updated_at = NOW()
+    WHERE name = 'phone_routing';
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Covers every column the table caches (phone_routing.ROUTING_COLUMNS)
+DROP TRIGGER IF EXISTS agents_phone_routing_version ON public.agents;
+CREATE TRIGGER agents_phone_routing_version
+    AFTER INSERT OR DELETE OR UPDATE OF agent_id, user_id, phone_number, phone_number_status, status
+    ON public.agents
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION public.bump_phone_routing_version();
+
+-- Routes no longer embed owner details
+DROP TRIGGER IF EXISTS users_phone_routing_version ON public.users;
+
+-- Warm-up scan over routed agents
+CREATE INDEX IF NOT EXISTS idx_agents_active_phone_number
+    ON public.agents(phone_number)
+    WHERE status = 'active' AND phone_number_status = 'active';
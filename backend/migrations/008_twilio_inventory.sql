@@ -0,0 +1,76 @@
+-- Migration: Twilio number inventory mirror
+-- Description: Local copy of the Twilio account's incoming phone numbers,
+-- kept up to date by the inventory sync worker (app/workers/twilio_inventory.py)
+-- so /phone-numbers/owned can page and filter without calling Twilio
+
+CREATE TABLE IF NOT EXISTS public.twilio_numbers (
+    phone_number_sid VARCHAR(100) PRIMARY KEY,
+    phone_number VARCHAR(20) UNIQUE NOT NULL,
+    friendly_name VARCHAR(255),
+    capabilities JSONB DEFAULT '{}'::jsonb,
+    voice_url TEXT,
+    twilio_created_at TIMESTAMP WITH TIME ZONE,
+    twilio_updated_at TIMESTAMP WITH TIME ZONE,
+    synced_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+COMMENT ON TABLE public.twilio_numbers IS 'Mirror of Twilio incoming phone numbers, maintained by the inventory sync';
+COMMENT ON COLUMN public.twilio_numbers.twilio_updated_at IS 'Twilio date_updated; unchanged numbers are skipped on sync';
+
+-- Owned numbers with their current assignment, served by /phone-numbers/owned
+CREATE OR REPLACE VIEW public.twilio_inventory AS
+SELECT
+    t.phone_number_sid,
+    t.phone_number,
+    t.friendly_name,
+    t.capabilities,
+    t.synced_at,
+    p.user_id AS assigned_to_user,
+    p.agent_id AS assigned_to_agent,
+    (p.id IS NOT NULL) AS is_assigned,
+    COALESCE(p.status, 'available') AS status
+FROM public.twilio_numbers t
+LEFT JOIN public.phone_numbers p
+    ON p.phone_number = t.phone_number
+   AND p.status <> 'released';
+
+-- Admin view only: not exposed to end users through RLS
+ALTER TABLE public.twilio_numbers ENABLE ROW LEVEL SECURITY;
+
+-- ============================================================
+-- Sweep leader lease
+-- ============================================================
+-- Every API worker runs the inventory sync, but only the holder of this
+-- lease sweeps Twilio; the others skip until it expires (the holder crashed)
+-- or is released. The holder renews it on every sweep.
+
+CREATE TABLE IF NOT EXISTS public.worker_leases (
+    name VARCHAR(100) PRIMARY KEY,
+    owner VARCHAR(100) NOT NULL,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+ALTER TABLE public.worker_leases ENABLE ROW LEVEL SECURITY;
+
+-- TRUE if p_owner now holds the lease (newly taken, renewed or taken over)
+CREATE OR REPLACE FUNCTION public.acquire_worker_lease(
+    p_name TEXT,
+    p_owner TEXT,
+    p_lease_seconds INTEGER
+)
+RETURNS BOOLEAN AS $$
+DECLARE
+    acquired BOOLEAN;
+BEGIN
+    INSERT INTO public.worker_leases (name, owner, expires_at)
+    VALUES (p_name, p_owner, NOW() + make_interval(secs => p_lease_seconds))
+    ON CONFLICT (name) DO UPDATE
+        SET owner = p_owner,
+            expires_at = NOW() + make_interval(secs => p_lease_seconds)
+        WHERE worker_leases.owner = p_owner
+           OR worker_leases.expires_at < NOW()
+    RETURNING TRUE INTO acquired;
+
+    RETURN COALESCE(acquired, FALSE);
+END;
+$$ LANGUAGE plpgsql;
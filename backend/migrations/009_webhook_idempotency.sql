@@ -0,0 +1,90 @@
+-- Migration: Idempotent webhook ingestion
+-- Description: Processed-event ledger for Stripe/ElevenLabs webhook
+-- deduplication (app/services/idempotency.py) and a one-usage-record-per-
+-- conversation guarantee
+
+CREATE TABLE IF NOT EXISTS public.processed_events (
+    source VARCHAR(50) NOT NULL,       -- 'stripe', 'elevenlabs', 'twilio'
+    event_id VARCHAR(255) NOT NULL,    -- Stripe event id / ElevenLabs conversation_id / Twilio CallSid
+    claimed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    completed_at TIMESTAMP WITH TIME ZONE,
+    PRIMARY KEY (source, event_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_processed_events_claimed_at ON public.processed_events(claimed_at);
+
+COMMENT ON TABLE public.processed_events IS 'Webhook events that have been (or are being) processed';
+COMMENT ON COLUMN public.processed_events.completed_at IS 'NULL while a worker is processing the event';
+
+ALTER TABLE public.processed_events ENABLE ROW LEVEL SECURITY;
+
+-- ============================================================
+-- Claim an event for processing
+-- ============================================================
+-- Returns 'claimed' if the caller should process the event: it was never
+-- seen, or a previous claim was neither completed nor released within the
+-- lease (the worker crashed). Returns 'completed' for processed events and
+-- 'in_progress' while another worker holds a live claim; the handler answers
+-- the latter with a non-2xx so the provider retries until it is settled.
+
+-- Earlier versions returned BOOLEAN
+DROP FUNCTION IF EXISTS public.claim_event(TEXT, TEXT, INTEGER);
+
+CREATE OR REPLACE FUNCTION public.claim_event(
+    p_source TEXT,
+    p_event_id TEXT,
+    p_lease_seconds INTEGER DEFAULT 300
+)
+RETURNS TEXT AS $$
+DECLARE
+    claimed BOOLEAN;
+    done TIMESTAMP WITH TIME ZONE;
+BEGIN
+    INSERT INTO public.processed_events (source, event_id, claimed_at)
+    VALUES (p_source, p_event_id, NOW())
+    ON CONFLICT (source, event_id) DO UPDATE
+        SET claimed_at = NOW()
+        WHERE processed_events.completed_at IS NULL
+          AND processed_events.claimed_at < NOW() - make_interval(secs => p_lease_seconds)
+    RETURNING TRUE INTO claimed;
+
+    IF claimed THEN
+        RETURN 'claimed';
+    END IF;
+
+    SELECT completed_at INTO done
+    FROM public.processed_events
+    WHERE source = p_source AND event_id = p_event_id;
+
+    RETURN CASE WHEN done IS NULL THEN 'in_progress' ELSE 'completed' END;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================
+-- Retention
+-- ============================================================
+-- Providers stop redelivering after a few days (Stripe: 3), so older events
+-- can't be replayed and their rows are only dead weight. Run daily (see
+-- README "Scheduled Jobs").
+
+CREATE OR REPLACE FUNCTION public.cleanup_processed_events(p_retention_days INTEGER DEFAULT 7)
+RETURNS void AS $$
+BEGIN
+    DELETE FROM public.processed_events
+    WHERE claimed_at < NOW() - make_interval(days => p_retention_days);
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================
+-- One usage record per conversation
+-- ============================================================
+
+-- Remove duplicates left by earlier webhook retries, keeping the first record
+DELETE FROM public.usage_records u
+USING public.usage_records earlier
+WHERE u.conversation_id = earlier.conversation_id
+  AND u.id > earlier.id;
+
+-- Not partial, so it can back ON CONFLICT (conversation_id); NULLs stay distinct
+CREATE UNIQUE INDEX IF NOT EXISTS idx_usage_records_conversation_id
+    ON public.usage_records(conversation_id);
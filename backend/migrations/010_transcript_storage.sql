@@ -0,0 +1,20 @@
+-- Migration: Transcript and payload blob storage
+-- Description: Raw ElevenLabs webhook payloads and call transcripts move out of
+-- the conversations/calls rows into gzip-compressed objects in the private
+-- 'transcripts' storage bucket (app/services/transcript_store.py). Rows keep
+-- only the object key. Existing inline data is moved by
+-- app/workers/transcript_backfill.py.
+
+ALTER TABLE public.conversations
+    ADD COLUMN IF NOT EXISTS payload_key TEXT;
+
+ALTER TABLE public.calls
+    ADD COLUMN IF NOT EXISTS transcript_key TEXT;
+
+COMMENT ON COLUMN public.conversations.payload_key IS 'Storage key of the gzipped webhook payload (webhook_payload is NULL once offloaded)';
+COMMENT ON COLUMN public.calls.transcript_key IS 'Storage key of the gzipped transcript (transcript is NULL once offloaded)';
+
+-- Private bucket; only the service role reads and writes it
+INSERT INTO storage.buckets (id, name, public)
+VALUES ('transcripts', 'transcripts', false)
+ON CONFLICT (id) DO NOTHING;
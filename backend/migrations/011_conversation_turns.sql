@@ -0,0 +1,19 @@
+-- Migration: Parsed conversation turns
+-- Description: Transcripts are parsed into speaker turns once, when the
+-- post-call webhook is ingested (app/services/transcript_parser.py). The turns
+-- are stored as a gzipped JSON object next to the transcript in the
+-- 'transcripts' bucket and the rows keep its key.
+
+ALTER TABLE public.conversations
+    ADD COLUMN IF NOT EXISTS turns_key TEXT;
+
+ALTER TABLE public.calls
+    ADD COLUMN IF NOT EXISTS turns_key TEXT;
+
+COMMENT ON COLUMN public.conversations.turns_key IS 'Storage key of the parsed transcript turns';
+COMMENT ON COLUMN public.calls.turns_key IS 'Storage key of the parsed transcript turns';
+
+-- The post-call webhook links turns to the call by ElevenLabs conversation ID
+CREATE INDEX IF NOT EXISTS idx_calls_external_call_id
+    ON public.calls(external_call_id)
+    WHERE external_call_id IS NOT NULL;
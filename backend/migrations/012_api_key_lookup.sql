@@ -0,0 +1,16 @@
+-- Migration: API key authentication lookup
+-- Description: X-API-Key requests are authenticated by looking up the key's
+-- SHA-256 hash (app/services/api_keys.py). The hash must be unique and
+-- indexed; 003 created both a UNIQUE constraint and a redundant plain index.
+
+-- Same name as the index behind 003's UNIQUE constraint, so this is a no-op
+-- where that constraint exists
+CREATE UNIQUE INDEX IF NOT EXISTS api_keys_api_key_key
+    ON public.api_keys(api_key);
+
+DROP INDEX IF EXISTS public.idx_api_keys_api_key;
+
+-- Keys created before permissions were defaulted
+UPDATE public.api_keys
+SET permissions = '["read"]'::jsonb
+WHERE permissions IS NULL;
@@ -0,0 +1,143 @@
+-- Migration: Outbound webhook delivery
+-- Description: Persistent outbox for events delivered to customers'
+-- webhook_endpoints (app/services/webhook_outbox.py publishes,
+-- app/workers/webhook_delivery.py delivers), plus per-endpoint batching and
+-- automatic disabling of endpoints that keep failing
+
+ALTER TABLE public.webhook_endpoints
+    ADD COLUMN IF NOT EXISTS batch_size INTEGER NOT NULL DEFAULT 1,
+    ADD COLUMN IF NOT EXISTS consecutive_failures INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS disabled_at TIMESTAMP WITH TIME ZONE;
+
+COMMENT ON COLUMN public.webhook_endpoints.batch_size IS 'Max events per POST; 1 sends one event per request';
+COMMENT ON COLUMN public.webhook_endpoints.disabled_at IS 'Set when the endpoint was disabled after repeated delivery failures';
+
+-- One row per (event, endpoint); the id is derived from both, so publishing
+-- the same event twice is a no-op
+CREATE TABLE IF NOT EXISTS public.webhook_outbox (
+    id UUID PRIMARY KEY,
+    endpoint_id UUID NOT NULL REFERENCES public.webhook_endpoints(id) ON DELETE CASCADE,
+    user_id UUID NOT NULL,
+    event_type VARCHAR(100) NOT NULL,
+    payload JSONB NOT NULL,
+
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',  -- pending, delivered, failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    last_error TEXT,
+
+    lease_owner VARCHAR(255),
+    lease_expires_at TIMESTAMP WITH TIME ZONE,
+
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    delivered_at TIMESTAMP WITH TIME ZONE
+);
+
+-- Due-time scan over pending deliveries only
+CREATE INDEX IF NOT EXISTS idx_webhook_outbox_pending
+    ON public.webhook_outbox(next_attempt_at)
+    WHERE status = 'pending';
+
+CREATE INDEX IF NOT EXISTS idx_webhook_outbox_endpoint ON public.webhook_outbox(endpoint_id, created_at);
+
+-- Per-endpoint due-time scan (claim_webhook_deliveries caps rows per endpoint)
+CREATE INDEX IF NOT EXISTS idx_webhook_outbox_endpoint_pending
+    ON public.webhook_outbox(endpoint_id, next_attempt_at)
+    WHERE status = 'pending';
+
+ALTER TABLE public.webhook_outbox ENABLE ROW LEVEL SECURITY;
+
+-- ============================================================
+-- Claim due deliveries for active endpoints
+-- ============================================================
+-- Returns the outbox rows with the endpoint's url, secret and batch_size.
+-- Each endpoint gets at most p_endpoint_concurrency POSTs' worth of rows,
+-- minus the POSTs the worker already has in flight to it (p_in_flight:
+-- {"<endpoint id>": count}), so a slow endpoint's backlog stays in the
+-- outbox instead of sitting out its lease in the worker's queue.
+
+DROP FUNCTION IF EXISTS public.claim_webhook_deliveries(TEXT, INTEGER, INTEGER);
+
+CREATE OR REPLACE FUNCTION public.claim_webhook_deliveries(
+    p_worker_id TEXT,
+    p_batch_size INTEGER DEFAULT 200,
+    p_lease_seconds INTEGER DEFAULT 60,
+    p_endpoint_concurrency INTEGER DEFAULT 4,
+    p_in_flight JSONB DEFAULT '{}'
+)
+RETURNS TABLE (
+    id UUID,
+    endpoint_id UUID,
+    event_type VARCHAR,
+    payload JSONB,
+    attempts INTEGER,
+    url TEXT,
+    secret VARCHAR,
+    batch_size INTEGER
+) AS $$
+BEGIN
+    RETURN QUERY
+    WITH chosen AS (
+        SELECT d.id
+        FROM public.webhook_endpoints e
+        CROSS JOIN LATERAL (
+            SELECT o.id, o.next_attempt_at
+            FROM public.webhook_outbox o
+            WHERE o.endpoint_id = e.id
+              AND o.status = 'pending'
+              AND o.next_attempt_at <= NOW()
+              AND (o.lease_expires_at IS NULL OR o.lease_expires_at < NOW())
+            ORDER BY o.next_attempt_at
+            LIMIT GREATEST(p_endpoint_concurrency - COALESCE((p_in_flight ->> e.id::TEXT)::INTEGER, 0), 0)
+                * GREATEST(e.batch_size, 1)
+            FOR UPDATE OF o SKIP LOCKED
+        ) d
+        WHERE e.is_active
+        ORDER BY d.next_attempt_at
+        LIMIT p_batch_size
+    ),
+    claimed AS (
+        UPDATE public.webhook_outbox o
+        SET lease_owner = p_worker_id,
+            lease_expires_at = NOW() + make_interval(secs => p_lease_seconds)
+        FROM chosen
+        WHERE o.id = chosen.id
+        RETURNING o.*
+    )
+    SELECT c.id, c.endpoint_id, c.event_type, c.payload, c.attempts, e.url::TEXT, e.secret, e.batch_size
+    FROM claimed c
+    JOIN public.webhook_endpoints e ON e.id = c.endpoint_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================
+-- Record a delivery attempt against its endpoint
+-- ============================================================
+-- Updates the counters atomically and disables the endpoint after
+-- p_disable_after consecutive failures. Returns whether it is still active.
+
+CREATE OR REPLACE FUNCTION public.record_webhook_result(
+    p_endpoint_id UUID,
+    p_success BOOLEAN,
+    p_disable_after INTEGER DEFAULT 20
+)
+RETURNS BOOLEAN AS $$
+DECLARE
+    active BOOLEAN;
+BEGIN
+    UPDATE public.webhook_endpoints
+    SET success_count = success_count + CASE WHEN p_success THEN 1 ELSE 0 END,
+        failure_count = failure_count + CASE WHEN p_success THEN 0 ELSE 1 END,
+        consecutive_failures = CASE WHEN p_success THEN 0 ELSE consecutive_failures + 1 END,
+        last_triggered_at = NOW(),
+        is_active = is_active AND (p_success OR consecutive_failures + 1 < p_disable_after),
+        disabled_at = CASE
+            WHEN is_active AND NOT p_success AND consecutive_failures + 1 >= p_disable_after THEN NOW()
+            ELSE disabled_at
+        END
+    WHERE id = p_endpoint_id
+    RETURNING is_active INTO active;
+
+    RETURN COALESCE(active, FALSE);
+END;
+$$ LANGUAGE plpgsql;
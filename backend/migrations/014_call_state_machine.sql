@@ -0,0 +1,28 @@
+-- Migration: Call state machine
+-- Description: Call status changes are applied as conditional updates by
+-- app/services/call_state.py (including from the new
+-- /api/webhooks/elevenlabs/call-status webhook). This trigger derives
+-- duration_secs from started_at/ended_at when a call ends, so ending a call
+-- needs no read of the row first.
+
+ALTER TABLE public.calls
+    ADD COLUMN IF NOT EXISTS duration_secs INTEGER;
+
+CREATE OR REPLACE FUNCTION public.calls_fill_duration()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.ended_at IS NOT NULL
+       AND NEW.started_at IS NOT NULL
+       AND NEW.duration_secs IS NULL THEN
+        NEW.duration_secs := GREATEST(0, EXTRACT(EPOCH FROM (NEW.ended_at - NEW.started_at))::INTEGER);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS calls_fill_duration ON public.calls;
+CREATE TRIGGER calls_fill_duration
+    BEFORE UPDATE OF ended_at ON public.calls
+    FOR EACH ROW
+    EXECUTE FUNCTION public.calls_fill_duration();
+
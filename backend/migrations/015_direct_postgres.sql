@@ -0,0 +1,18 @@
+-- Migration: Direct Postgres queries
+-- Description: With DATABASE_DIRECT_QUERIES on, call stats, analytics stats
+-- and call exports are computed with SQL over a direct connection
+-- (app/services/postgres.py). Those queries name their columns, so the call
+-- outcome columns the API has always read with SELECT * must exist.
+
+ALTER TABLE public.calls
+    ADD COLUMN IF NOT EXISTS summary TEXT,
+    ADD COLUMN IF NOT EXISTS sentiment VARCHAR(50),
+    ADD COLUMN IF NOT EXISTS call_successful BOOLEAN;
+
+-- Per-user scans (stats, list, export) filtered and ordered by creation time
+CREATE INDEX IF NOT EXISTS idx_calls_user_created_at
+    ON public.calls(user_id, created_at);
+
+-- Per-agent analytics over a date range
+CREATE INDEX IF NOT EXISTS idx_conversations_agent_created_at
+    ON public.conversations(agent_id, created_at);
@@ -0,0 +1,58 @@
+-- Migration: Atomic appointment booking
+-- Description: book_appointment() checks for an overlapping appointment and
+-- inserts the new one in a single call, so agent bookings
+-- (/api/agent-actions/book-appointment) take one round trip and two callers
+-- can't both book the same slot. Bookings for the same user are serialized
+-- with a transaction-scoped advisory lock; appointments created from the
+-- dashboard or by calendar sync are not checked, as before, so this is not
+-- a table-wide exclusion constraint.
+
+-- Overlap lookups: user's appointments starting before the new one ends
+CREATE INDEX IF NOT EXISTS idx_appointments_user_start_time
+    ON public.appointments(user_id, start_time);
+
+-- ============================================================
+-- Book an appointment unless it overlaps another one
+-- ============================================================
+-- Any appointment that isn't cancelled blocks the slot, including ones that
+-- start before p_start_time and run into it. Returns the new appointment, or
+-- no row if the slot is taken.
+
+CREATE OR REPLACE FUNCTION public.book_appointment(
+    p_user_id UUID,
+    p_start_time TIMESTAMP WITH TIME ZONE,
+    p_end_time TIMESTAMP WITH TIME ZONE,
+    p_title TEXT,
+    p_description TEXT DEFAULT NULL,
+    p_timezone TEXT DEFAULT 'UTC',
+    p_attendee_name TEXT DEFAULT NULL,
+    p_attendee_phone TEXT DEFAULT NULL,
+    p_attendee_email TEXT DEFAULT NULL,
+    p_metadata JSONB DEFAULT NULL
+)
+RETURNS SETOF public.appointments AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtextextended('appointments:' || p_user_id::TEXT, 0));
+
+    IF EXISTS (
+        SELECT 1 FROM public.appointments
+        WHERE user_id = p_user_id
+          AND status IS DISTINCT FROM 'cancelled'
+          AND start_time < p_end_time
+          AND end_time > p_start_time
+    ) THEN
+        RETURN;
+    END IF;
+
+    RETURN QUERY
+    INSERT INTO public.appointments (
+        user_id, title, description, start_time, end_time, timezone, status,
+        attendee_name, attendee_phone, attendee_email, send_reminders, metadata
+    )
+    VALUES (
+        p_user_id, p_title, p_description, p_start_time, p_end_time, p_timezone, 'scheduled',
+        p_attendee_name, p_attendee_phone, p_attendee_email, TRUE, p_metadata
+    )
+    RETURNING *;
+END;
+$$ LANGUAGE plpgsql;